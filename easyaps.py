@@ -19,97 +19,3617 @@ Email: info@stcat.com
 GitHub: https://github.com/stcatcom/EasyAPS
 Version: 0.11 (2026-03-21)
 """
+import abc
+import asyncio
+import bisect
+import collections
+import concurrent.futures
 import configparser
+import contextlib
 import csv
+import ctypes
+import ctypes.util
+import hashlib
+import http.server
+import io
+import json
+import math
 import os
+import queue
+import re
+import select
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
 import subprocess
+import sys
+import tempfile
 import time
 import threading
+from array import array
 from datetime import datetime, timedelta
 
+try:
+    import jack  # JACK-Client（オプション：プロセス内 JACK 制御）
+except (ImportError, OSError):
+    jack = None
+
+try:
+    import numpy  # オプション：プロセス内再生（[PLAYER] mode = buffer）
+except ImportError:
+    numpy = None
+
 # バージョン情報
 version = "free-0.11"
 
+# 再生時にリアルタイムで適用するラウドネス正規化（解析結果がない音源用）
+LIVE_LOUDNORM = "loudnorm=I=-18:TP=-2.0:LRA=11"
+
+def jack_port_regex(name):
+    """JACK のポート検索（POSIX 拡張正規表現）で name そのものに一致するパターン"""
+    return re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', name)
+
+def jack_frame_delta(a, b):
+    """JACK のフレーム時刻の差 a - b（32 ビットの折り返しを考慮）"""
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+class ProcessReaper:
+    """終了させる子プロセスを引き取り、バックグラウンドで終了・回収するクラス
+
+    release() はキューに積むだけで戻る。ワーカースレッドは confirm() が真に
+    なるまで（最大 confirm_timeout 秒）待ってから terminate し、grace 秒以内に
+    終了しなければ kill する。
+    """
+
+    def __init__(self, grace=0.5):
+        self.grace = grace
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def release(self, process, confirm=None, confirm_timeout=1.0):
+        """process の終了を依頼（confirm: 終了させてよくなったら真を返す関数）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='reaper', daemon=True)
+                self._thread.start()
+        self._queue.put((process, confirm, confirm_timeout, time.monotonic()))
+
+    def _run(self):
+        while True:
+            process, confirm, confirm_timeout, queued_at = self._queue.get()
+            try:
+                # 引き継ぎ先の再生開始を確認したらすぐに終了させる
+                if confirm is not None:
+                    deadline = queued_at + confirm_timeout
+                    while time.monotonic() < deadline and not confirm():
+                        time.sleep(0.01)
+                if process.poll() is None:
+                    process.terminate()
+                try:
+                    process.wait(timeout=self.grace)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            except Exception as e:
+                print(f"mpv停止エラー: {e}")
+
+class ChildWatcher:
+    """子プロセスの終了をイベントとして通知するクラス
+
+    pidfd（Linux 5.3 以降・Python 3.9 以降）が使える場合は1つのスレッドで
+    すべての pidfd を poll し、使えない場合はプロセスごとのスレッドで wait()
+    する。どちらも定期的な確認（ポーリング）は行わない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watched = {}       # pidfd → (process, callback)
+        self._poll = None
+        self._wake_pipe = None
+        self._thread = None
+
+    def watch(self, process, callback):
+        """process の終了時に callback(process, returncode) を呼ぶ（監視スレッドから）"""
+        try:
+            fd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            threading.Thread(target=self._notify, args=(process, callback),
+                             name='child-wait', daemon=True).start()
+            return
+        with self._lock:
+            if self._thread is None:
+                self._poll = select.poll()
+                self._wake_pipe = os.pipe()
+                self._poll.register(self._wake_pipe[0], select.POLLIN)
+                self._thread = threading.Thread(target=self._run, name='child-watcher', daemon=True)
+                self._thread.start()
+            self._watched[fd] = (process, callback)
+            self._poll.register(fd, select.POLLIN)
+        # poll 中のスレッドに新しい pidfd を監視させる
+        os.write(self._wake_pipe[1], b'x')
+
+    def _run(self):
+        while True:
+            for fd, _ in self._poll.poll():
+                if fd == self._wake_pipe[0]:
+                    os.read(fd, 512)
+                    continue
+                with self._lock:
+                    entry = self._watched.pop(fd, None)
+                    self._poll.unregister(fd)
+                os.close(fd)
+                if entry is not None:
+                    self._notify(*entry)
+
+    @staticmethod
+    def _notify(process, callback):
+        """終了を待って（pidfd の場合は終了済み）回収し、callback を呼ぶ"""
+        try:
+            returncode = process.wait()
+            callback(process, returncode)
+        except Exception as e:
+            print(f"子プロセス監視エラー: {e}")
+
+class AdoptedProcess:
+    """前回の実行で起動した（自分の子ではない）プロセスを Popen と同じように扱うクラス
+
+    終了コードは取得できないため、終了後の returncode は -1 とする。PID の
+    再利用と区別するため、/proc/<pid>/stat の起動時刻が記録と一致する間だけ
+    動作中とみなす。
+    """
+
+    def __init__(self, pid, started):
+        self.pid = pid
+        self.started = started
+        self.returncode = None
+
+    @staticmethod
+    def start_time(pid):
+        """プロセスの起動時刻（/proc/<pid>/stat の starttime。終了済み・不明なら None）"""
+        try:
+            with open(f"/proc/{pid}/stat", 'rb') as f:
+                stat = f.read()
+            fields = stat[stat.rindex(b')') + 2:].split()
+            if fields[0] == b'Z':  # 終了済み（回収待ち）
+                return None
+            return int(fields[19])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def poll(self):
+        if self.returncode is None and (self.started is None or
+                                        self.start_time(self.pid) != self.started):
+            self.returncode = -1
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(f"pid {self.pid}", timeout)
+            time.sleep(0.01)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
 class mpvPlayer:
-    """mpvプレイヤー管理クラス"""
-    def __init__(self, mpv_path='/usr/bin/mpv', debug_mode=False):
+    """mpvプレイヤー管理クラス
+
+    mode='ipc' では常駐する mpv を1つだけ起動し、JSON IPC（--input-ipc-server）
+    の loadfile / stop コマンドで音源を切り替える。IPC の確立に失敗した場合や
+    mode='spawn' の場合は、従来どおり音源ごとに mpv プロセスを起動する。
+
+    handover=True の場合、spawn モードでは新しい mpv を先に起動し、その mpv の
+    IPC ソケットで音声の出力開始（core-idle が false）を確認してから前の mpv を
+    終了させる（make-before-break）。終了・回収は ProcessReaper のスレッドで行う。
+    """
+    reaper = ProcessReaper()  # 全プレイヤーで共有
+    watcher = ChildWatcher()  # 全プレイヤーで共有
+    HANDOVER_TIMEOUT = 2.0    # spawn モードで新しい mpv の出力開始を待つ最大秒数
+
+    def __init__(self, mpv_path='/usr/bin/mpv', debug_mode=False, mode='ipc', ipc_socket=None,
+                 handover=True, jack_name=None, tag=None):
         self.mpv_path = mpv_path
         self.mpv_process = None
         self.debug_mode = debug_mode
+        self.mode = mode
+        self.handover = handover
+        if ipc_socket is None:
+            ipc_socket = os.path.join(tempfile.gettempdir(), f"easyaps-mpv-{os.getuid()}.sock")
+        self.ipc_socket = ipc_socket
+        # 起動するすべての mpv に --title で付ける目印（前回の mpv を探すため。省略時は付けない）
+        self.tag = tag
+
+        # JACK の出力（jack_name: クライアント名。省略時は mpv の既定）
+        self.jack_name = jack_name
+        self.jack_autoconnect = True   # False なら出力ポートの接続は JackControl.route() が行う
+        self.jack_ports = ()           # 自動接続する場合の接続先（省略時は物理出力の先頭から）
+
+        # IPC モードの状態
+        self._sock = None
+        self._sock_lock = threading.Lock()
+        self._reader_thread = None
+        self._request_id = 0
+        self._pending = {}       # request_id → [Event, 応答]
+        self._idle = True        # mpv の idle-active プロパティ
+        self.last_end_reason = None  # 直近の end-file イベントの reason
+        self._primed = threading.Event()  # playback-restart 受信で set
+        self._playing = threading.Event()  # core-idle が false（音声を出力中）になったら set
+        self.armed_file = None   # arm() で一時停止状態のまま読み込んだファイル
+        self._current_af = LIVE_LOUDNORM  # 常駐 mpv に設定済みのオーディオフィルタ
+        self._spawn_count = 0    # spawn モードで起動した mpv の数（IPC ソケット名の切り替え用）
+        self.load_id = 0         # 音源の読み込み・停止のたびに増やす番号（終了通知が古いかどうかの判定用）
+        self.on_exit = None      # on_exit(player, load_id, returncode): 再生中の mpv が終了・再生エラー
+                                 # （returncode は IPC の再生エラーでは None）
+
+    def _base_args(self, audio_filter=LIVE_LOUDNORM):
+        """両モード共通の mpv 起動オプション"""
+        args = [
+            self.mpv_path,
+            "--no-video",          # 動画表示なし
+            "--no-terminal",       # ターミナル出力なし
+            "--really-quiet",      # 静かに実行
+            "--keep-open=no",      # 再生終了後に自動終了
+            "--ao=jack",           # JACK オーディオ出力
+            f"--af={audio_filter}",
+        ]
+        if self.tag:
+            args.append(f"--title={self.tag}")
+        if self.jack_name:
+            args.append(f"--jack-name={self.jack_name}")
+        if not self.jack_autoconnect:
+            args.append("--jack-autoconnect=no")
+        elif self.jack_ports:
+            ports = '|'.join(jack_port_regex(port) for port in self.jack_ports)
+            args.append(f"--jack-port=^({ports})$")
+        return args
+
+    def play_file(self, filepath, start_position=0, audio_filter=None):
+        """ファイルを再生（シーク付き）
+
+        audio_filter: mpv の --af に渡すフィルタ（省略時はリアルタイム loudnorm）
+        """
+        if audio_filter is None:
+            audio_filter = LIVE_LOUDNORM
+        if self.mode == 'ipc':
+            if self._ensure_ipc():
+                return self._ipc_play(filepath, start_position, audio_filter)
+            print("mpv IPC を確立できません。プロセス起動モードに切り替えます")
+            self.mode = 'spawn'
+
+        # 前回の再生を停止（handover 時は新しい mpv の起動を確認してから終了させる）
+        outgoing = None
+        if self.handover and self.mpv_process is not None and self.mpv_process.poll() is None:
+            outgoing, self.mpv_process = self.mpv_process, None
+        else:
+            self.stop()
+
+        start_time = time.time()
+
+        cmd = self._base_args(audio_filter)
+
+        if start_position > 0:
+            cmd.append(f"--start={int(start_position)}")
+            if self.debug_mode:
+                print(f"[mpv実行] シーク位置: {int(start_position)}秒")
+
+        # 音声の出力開始を確認するため、起動する mpv ごとに IPC ソケットを用意する
+        self._close_ipc()
+        self._playing.clear()
+        self.load_id += 1
+        ipc_socket = None
+        if self.handover:
+            ipc_socket = self._spawn_ipc_socket()
+            cmd.append(f"--input-ipc-server={ipc_socket}")
+
+        cmd.append(filepath)
+
+        try:
+            self.mpv_process = self._spawn(cmd)
+            if ipc_socket is not None:
+                threading.Thread(target=self._connect_spawned, args=(self.mpv_process, ipc_socket),
+                                 name='mpv-connect', daemon=True).start()
+            exec_time = time.time() - start_time
+            if self.debug_mode:
+                print(f"[mpv実行時間] {exec_time:.3f}s")
+            return True
+        except Exception as e:
+            print(f"mpv再生エラー: {e}")
+            return False
+        finally:
+            if outgoing is not None:
+                incoming, playing = self.mpv_process, self._playing
+                # spawn モードではフェードできないため、新しい mpv の音声出力を確認した時点で
+                # 終了させる（起動に失敗・終了した場合はすぐに）
+                self.reaper.release(
+                    outgoing,
+                    confirm=lambda: incoming is None or incoming.poll() is not None or playing.is_set(),
+                    confirm_timeout=self.HANDOVER_TIMEOUT)
+
+    def play_file_from_position(self, filepath, start_position, audio_filter=None):
+        """指定位置から再生"""
+        return self.play_file(filepath, start_position, audio_filter)
+
+    def _spawn(self, cmd):
+        """mpv を起動し、終了を ChildWatcher で監視"""
+        process = subprocess.Popen(cmd,
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL,
+                                   start_new_session=True)
+        self.watcher.watch(process, self._on_process_exit)
+        return process
+
+    def _on_process_exit(self, process, returncode):
+        """mpv の終了通知（監視スレッド）。停止・引き継ぎで手放したプロセスは通知しない"""
+        if process is self.mpv_process and self.on_exit is not None:
+            self.on_exit(self, self.load_id, returncode)
+
+    def _spawn_ipc_socket(self):
+        """spawn モードで起動する mpv の IPC ソケット（引き継ぎ中の mpv と重ならないよう交互に使う）"""
+        self._spawn_count += 1
+        root, ext = os.path.splitext(self.ipc_socket)
+        ipc_socket = f"{root}-spawn{self._spawn_count % 2}{ext}"
+        try:
+            os.remove(ipc_socket)
+        except OSError:
+            pass
+        return ipc_socket
+
+    def _connect_spawned(self, process, ipc_socket, timeout=3.0):
+        """spawn モードで起動した mpv の IPC ソケットに接続（接続スレッド）
+
+        接続後は core-idle の通知で _playing が set され、wait_playing() と
+        引き継ぎの確認に使われる。
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and process.poll() is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(ipc_socket)
+            except OSError:
+                sock.close()
+                time.sleep(0.01)
+                continue
+            if self.mpv_process is process and self.mode == 'spawn':
+                self._attach(sock)
+            else:
+                sock.close()  # 既に次の音源に切り替わった
+            return
+
+    def _ensure_ipc(self, timeout=3.0):
+        """常駐 mpv を起動して IPC ソケットに接続（接続済みなら何もしない）"""
+        if self._sock is not None and self.mpv_process is not None and self.mpv_process.poll() is None:
+            return True
+        self._close_ipc()
+
+        cmd = self._base_args() + [
+            "--idle=yes",                           # 再生終了後も常駐
+            f"--input-ipc-server={self.ipc_socket}",
+        ]
+        try:
+            if os.path.exists(self.ipc_socket):
+                os.remove(self.ipc_socket)
+            self.mpv_process = self._spawn(cmd)
+        except Exception as e:
+            print(f"mpv起動エラー: {e}")
+            return False
+
+        # ソケットが作成されるまで待機
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.mpv_process.poll() is not None:
+                break
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.ipc_socket)
+            except OSError:
+                time.sleep(0.01)
+                continue
+            self._attach(sock)
+            self._current_af = LIVE_LOUDNORM
+            if self.debug_mode:
+                print(f"[mpv IPC] 接続しました: {self.ipc_socket} (PID {self.mpv_process.pid})")
+            return True
+
+        self._stop_process()
+        return False
+
+    def _attach(self, sock):
+        """接続した IPC ソケットの読み取りを開始し、再生状態の通知を受け取る"""
+        self._sock = sock
+        self._idle = True
+        self._reader_thread = threading.Thread(target=self._ipc_reader, args=(sock,), daemon=True)
+        self._reader_thread.start()
+        self._send(["observe_property", 1, "idle-active"])
+        self._send(["observe_property", 2, "core-idle"])
+
+    def adopt(self, process, timeout=0.5):
+        """前回の実行で起動した mpv（AdoptedProcess）を引き継ぐ（できなければ False）
+
+        ipc モードでは IPC ソケットに接続し、再生中かどうかを取得する。
+        オーディオフィルタは分からないため、次の読み込み時に必ず設定する。
+        """
+        if process.poll() is not None:
+            return False
+        if self.mode == 'ipc':
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(timeout)
+                sock.connect(self.ipc_socket)
+                sock.settimeout(None)
+            except OSError:
+                return False
+            self.mpv_process = process
+            self._attach(sock)
+            reply = self._send(["get_property", "idle-active"], wait=True, timeout=timeout)
+            if reply is None or reply.get('error') != 'success':
+                self._close_ipc()
+                self.mpv_process = None
+                return False
+            self._idle = bool(reply.get('data'))
+            self._current_af = None
+        else:
+            self.mpv_process = process
+        self.watcher.watch(process, self._on_process_exit)
+        if self.debug_mode:
+            print(f"[mpv] 前回の mpv を引き継ぎました: PID {process.pid} ({self.ipc_socket})")
+        return True
+
+    def _close_ipc(self):
+        """IPC ソケットを閉じる"""
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        for pending in list(self._pending.values()):
+            pending[0].set()
+        self._pending.clear()
+        self._idle = True
+
+    def _ipc_reader(self, sock):
+        """IPC ソケットから応答・イベントを読み取るスレッド"""
+        buffer = b''
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except OSError:
+                chunk = b''
+            if not chunk:
+                break
+            buffer += chunk
+            while b'\n' in buffer and self._sock is sock:
+                line, buffer = buffer.split(b'\n', 1)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self._handle_ipc_message(message)
+        # mpv が終了した（ソケットが閉じられた）
+        if self._sock is sock:
+            self._close_ipc()
+
+    def _handle_ipc_message(self, message):
+        """IPC の応答・イベントを処理"""
+        request_id = message.get('request_id')
+        if request_id is not None and 'error' in message:
+            pending = self._pending.pop(request_id, None)
+            if pending is not None:
+                pending[1] = message
+                pending[0].set()
+            return
+
+        event = message.get('event')
+        if event == 'property-change' and message.get('name') == 'idle-active':
+            self._idle = bool(message.get('data'))
+        elif event == 'property-change' and message.get('name') == 'core-idle':
+            if message.get('data') is False:
+                self._playing.set()
+        elif event == 'end-file':
+            self.last_end_reason = message.get('reason')
+            if (self.last_end_reason == 'error' and self.mode == 'ipc' and
+                    self.on_exit is not None and self.mpv_process is not None):
+                # 常駐 mpv は終了しないため、再生エラーを終了と同じ経路で通知する
+                if self.debug_mode:
+                    print(f"[mpv IPC] 再生エラー: {message.get('file_error')}")
+                self.on_exit(self, self.load_id, None)
+        elif event == 'playback-restart':
+            self._primed.set()
+        if self.debug_mode and event and event != 'property-change':
+            print(f"[mpv IPC] {event}")
+
+    def _send(self, command, wait=False, timeout=1.0):
+        """IPC コマンドを送信（wait=True なら応答を待って返す）"""
+        sock = self._sock
+        if sock is None:
+            return None
+        with self._sock_lock:
+            self._request_id += 1
+            request_id = self._request_id
+            pending = [threading.Event(), None]
+            if wait:
+                self._pending[request_id] = pending
+            data = json.dumps({"command": command, "request_id": request_id}) + '\n'
+            try:
+                sock.sendall(data.encode('utf-8'))
+            except OSError as e:
+                print(f"mpv IPC 送信エラー: {e}")
+                self._pending.pop(request_id, None)
+                return None
+        if not wait:
+            return True
+        if not pending[0].wait(timeout):
+            self._pending.pop(request_id, None)
+            return None
+        return pending[1]
+
+    def _ipc_play(self, filepath, start_position, audio_filter):
+        """常駐 mpv に loadfile で音源を読み込ませる"""
+        return self._ipc_load(filepath, start_position, pause=False, audio_filter=audio_filter)
+
+    def _ipc_load(self, filepath, start_position, pause, audio_filter):
+        """start / pause / af を設定してから loadfile を送信"""
+        start_time = time.time()
+        if start_position > 0:
+            start_option = str(int(start_position))
+            if self.debug_mode:
+                print(f"[mpv実行] シーク位置: {int(start_position)}秒")
+        else:
+            start_option = "none"
+        # コマンドは送信順に処理されるため start / pause の応答は待たない
+        self._send(["set_property", "start", start_option])
+        self._send(["set_property", "pause", pause])
+        if audio_filter != self._current_af:
+            # フィルタチェーンの再構築を避けるため、変更時のみ送信
+            self._send(["set_property", "af", audio_filter])
+            self._current_af = audio_filter
+        self._idle = False
+        self._primed.clear()
+        self._playing.clear()
+        self.armed_file = None
+        self.load_id += 1
+        reply = self._send(["loadfile", filepath, "replace"], wait=True)
+        exec_time = time.time() - start_time
+        if self.debug_mode:
+            print(f"[mpv IPC実行時間] {exec_time:.3f}s")
+        if reply is None or reply.get('error') != 'success':
+            error = reply.get('error') if reply else 'タイムアウト'
+            print(f"mpv再生エラー: {error}")
+            return False
+        return True
+
+    def arm(self, filepath, start_position=0, timeout=2.0, audio_filter=None, start_at=None):
+        """一時停止状態で音源を読み込み、デコード準備が整うまで待つ（プリロール）
+
+        start_armed() を呼ぶと pause を解除するだけで再生が始まる（start_at は
+        BufferPlayer との互換用で、mpv では使わない）。
+        IPC モード以外では対応しないため False を返す。
+        """
+        if self.mode != 'ipc' or not self._ensure_ipc():
+            return False
+        if audio_filter is None:
+            audio_filter = LIVE_LOUDNORM
+        if not self._ipc_load(filepath, start_position, pause=True, audio_filter=audio_filter):
+            return False
+        # playback-restart（読み込み・シーク完了）を待つ
+        primed = self._primed.wait(timeout)
+        if self.debug_mode:
+            print(f"[mpv IPC] プリロール{'完了' if primed else '未完了（タイムアウト）'}: {filepath}")
+        self.armed_file = filepath
+        return True
+
+    def start_armed(self):
+        """arm() で読み込んだ音源の再生を開始"""
+        if self.armed_file is None:
+            return False
+        self.armed_file = None
+        self._playing.clear()
+        return self._send(["set_property", "pause", False]) is not None
+
+    def wait_playing(self, timeout=1.0):
+        """音声の出力が始まるまで待機
+
+        spawn モードでも handover=True なら起動した mpv の IPC ソケットで確認する
+        （handover=False ではプロセスが動作中かどうか）。
+        """
+        if self._sock is not None or (self.mode == 'spawn' and self.handover):
+            return self._playing.wait(timeout)
+        return self.mpv_process is not None and self.mpv_process.poll() is None
+
+    def fade_out(self, duration):
+        """duration 秒かけて音量を 0 まで下げる（IPC モードのみ）"""
+        if duration <= 0 or self.mode != 'ipc' or self._sock is None:
+            return
+        steps = max(1, int(duration / 0.02))
+        for step in range(1, steps + 1):
+            self._send(["set_property", "volume", 100.0 * (1 - step / steps)])
+            time.sleep(duration / steps)
+
+    def hand_over(self, incoming, fade=0.0, timeout=1.0):
+        """incoming の音声出力の開始を確認してから、この再生をフェードアウトして停止
+
+        make-before-break の後半。切り替えの処理とは別のスレッドから呼び出す。
+        """
+        if not incoming.wait_playing(timeout) and self.debug_mode:
+            print("[mpv] 引き継ぎ先の再生開始を確認できませんでした")
+        self.fade_out(fade)
+        self.stop()
+        if fade > 0 and self.mode == 'ipc' and self._sock is not None:
+            self._send(["set_property", "volume", 100.0])
+
+    def stop(self):
+        """再生を停止"""
+        self.load_id += 1
+        if self.mode == 'ipc' and self._sock is not None:
+            was_playing = self.is_playing()
+            self._idle = True
+            self.armed_file = None
+            self._send(["stop"])
+            return was_playing
+        return self._stop_process()
+
+    def _stop_process(self):
+        """mpv プロセスを終了（終了の確認・回収は ProcessReaper で行う）"""
+        try:
+            process = self.mpv_process
+            if process is not None and process.poll() is None:
+                # 終了通知を異常終了と区別するため、先に手放してから終了させる
+                self.mpv_process = None
+                process.terminate()
+                self.reaper.release(process)
+                return True
+        except Exception as e:
+            print(f"mpv停止エラー: {e}")
+        return False
+
+    def is_playing(self):
+        """再生中かどうかを確認"""
+        if self.mpv_process is None or self.mpv_process.poll() is not None:
+            return False
+        if self.mode == 'ipc' and self._sock is not None:
+            return not self._idle
+        return True
+
+    def disconnect(self):
+        """クリーンアップ（停止・常駐 mpv の終了）"""
+        self.stop()
+        if self.mode == 'ipc':
+            self._close_ipc()
+            self._stop_process()
+
+class DecodedStream:
+    """ffmpeg で音源を float32 のステレオにデコードし、メモリ上に先読みするストリーム
+
+    デコードは専用スレッドで行い、NumPy 配列のチャンクとして保持する。
+    先読みは max_ahead 秒分までで、再生（read_into）が進むと続きをデコードする。
+    read_into() は JACK の process コールバックから呼ばれるため、ブロックしない。
+    """
+    CHANNELS = 2
+    CHUNK_FRAMES = 4096
+
+    def __init__(self, filepath, samplerate, start_position=0, audio_filter=None,
+                 max_ahead=30.0, ffmpeg_path='ffmpeg'):
+        self.filepath = filepath
+        self.samplerate = samplerate
+        self.start_position = start_position
+        self.audio_filter = audio_filter
+        self.max_ahead = int(max_ahead * samplerate)
+        self.ffmpeg_path = ffmpeg_path
+        self.decoded_frames = 0    # デコード済みのフレーム数（デコードスレッドのみ更新）
+        self.consumed_frames = 0   # 再生済みのフレーム数（read() のみ更新）
+        self.finished = False      # デコードが終わった（末尾まで、またはエラー）
+        self.underruns = 0         # デコードが再生に間に合わなかった回数
+        self._chunks = collections.deque()
+        self._head_pos = 0         # 先頭チャンクの読み出し位置
+        self._closed = False
+        self._progress = threading.Event()  # デコードが進んだ・終わった
+        self._process = None
+        self._thread = None
+
+    def start(self):
+        """デコードを開始"""
+        cmd = [self.ffmpeg_path, "-hide_banner", "-nostdin", "-loglevel", "error"]
+        if self.start_position > 0:
+            cmd += ["-ss", f"{self.start_position:.3f}"]
+        cmd += ["-i", self.filepath, "-vn"]
+        if self.audio_filter:
+            cmd += ["-af", self.audio_filter]
+        cmd += ["-ac", str(self.CHANNELS), "-ar", str(self.samplerate), "-f", "f32le", "-"]
+        self._process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, start_new_session=True)
+        self._thread = threading.Thread(target=self._decode, args=(self._process,),
+                                        name='decoder', daemon=True)
+        self._thread.start()
+
+    def _decode(self, process):
+        """デコードスレッド：ffmpeg の出力をチャンクに分けて積む"""
+        frame_bytes = self.CHANNELS * 4
+        try:
+            while not self._closed:
+                if self.decoded_frames - self.consumed_frames >= self.max_ahead:
+                    time.sleep(0.05)
+                    continue
+                data = process.stdout.read(self.CHUNK_FRAMES * frame_bytes)
+                if not data:
+                    break
+                usable = len(data) - len(data) % frame_bytes
+                chunk = numpy.frombuffer(data[:usable], dtype=numpy.float32).reshape(-1, self.CHANNELS)
+                self._chunks.append(chunk)
+                self.decoded_frames += len(chunk)
+                self._progress.set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.finished = True
+            self._progress.set()
+            self._release_process()
+
+    def _release_process(self):
+        """ffmpeg を終了させ、回収は ProcessReaper に任せる"""
+        process, self._process = self._process, None
+        if process is not None:
+            if process.poll() is None:
+                process.terminate()
+            mpvPlayer.reaper.release(process)
+
+    def wait_ready(self, frames, timeout):
+        """frames フレーム以上デコードされるまで待機（短い音源は末尾まで終われば True）"""
+        deadline = time.monotonic() + timeout
+        while self.decoded_frames < frames and not self.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._progress.wait(min(remaining, 0.05))
+            self._progress.clear()
+        return self.decoded_frames > 0
+
+    @property
+    def exhausted(self):
+        """末尾まで再生し終えたかどうか"""
+        return self.finished and self.consumed_frames >= self.decoded_frames
+
+    def read_into(self, out, frames):
+        """最大 frames フレームを out の先頭にコピーし、コピーしたフレーム数を返す（ブロックしない）"""
+        filled = 0
+        chunks = self._chunks
+        while filled < frames and chunks:
+            head = chunks[0]
+            count = min(frames - filled, len(head) - self._head_pos)
+            out[filled:filled + count] = head[self._head_pos:self._head_pos + count]
+            filled += count
+            self._head_pos += count
+            if self._head_pos >= len(head):
+                chunks.popleft()
+                self._head_pos = 0
+        self.consumed_frames += filled
+        if filled < frames and not self.finished:
+            self.underruns += 1
+        return filled
+
+    def close(self):
+        """デコードを中止してバッファを解放"""
+        self._closed = True
+        self._release_process()
+        self._chunks.clear()
+
+class BufferVoice:
+    """JackBufferEngine でミックスする1つの音源（開始フレーム・ゲイン・フェード）"""
+
+    def __init__(self, stream, gain=1.0, frames=1024):
+        self.stream = stream
+        self.gain = gain
+        self.start_frame = None    # 出力を始める JACK のフレーム時刻（None: 未開始）
+        self.fade_frames = 0       # フェードアウトの長さ（0: フェードなし）
+        self.fade_start = None     # フェードアウトを始めるフレーム時刻（None: 次に出力するフレーム）
+        self.done = False
+        self.playing = threading.Event()  # 最初のフレームを出力したら set
+        self.allocate(frames)
+
+    def allocate(self, frames):
+        """mix() の作業用バッファを確保（JACK の周期ごとに配列を作らないため）"""
+        self._index = numpy.arange(frames, dtype=numpy.float32)
+        self._ramp = numpy.empty((frames, 1), dtype=numpy.float32)
+        self._frames = numpy.empty((frames, DecodedStream.CHANNELS), dtype=numpy.float32)
+        self._channels = [self._frames[:, channel] for channel in range(DecodedStream.CHANNELS)]
+
+    def fade_out(self, frames, start_frame=None):
+        """frames フレームかけて音量を 0 にし、終わったら停止
+
+        start_frame: フェードを始める JACK のフレーム時刻（省略時は次に出力するフレーム）。
+        既にフェード中なら何もしない（音量が戻らないように）。
+        """
+        if self.fade_frames:
+            return
+        self.fade_start = start_frame
+        self.fade_frames = max(1, frames)
+
+    def mix(self, outputs, frame_time, frames):
+        """このサイクル（frame_time から frames フレーム）の出力に加算。停止したら True"""
+        if self.done:
+            return True
+        if self.start_frame is None:
+            return False
+        offset = jack_frame_delta(self.start_frame, frame_time)
+        if offset >= frames:
+            return False
+        offset = max(0, offset)
+        if len(self._index) != frames:
+            self.allocate(frames)  # JACK のバッファサイズが変わった場合のみ
+        count = self.stream.read_into(self._frames, frames - offset)
+        if count:
+            if count == frames:
+                data, ramp, channels = self._frames, self._ramp, self._channels
+            else:
+                data, ramp = self._frames[:count], self._ramp[:count]
+                channels = None
+            first = frame_time + offset  # data の先頭のフレーム時刻
+            if self.fade_frames:
+                if self.fade_start is None:
+                    self.fade_start = first
+                # ゲイン = (1 - (first + i - fade_start) / fade_frames) * gain（0〜gain に制限）
+                line = ramp[:, 0]
+                numpy.add(self._index[:count] if channels is None else self._index,
+                          jack_frame_delta(first, self.fade_start), out=line)
+                line *= -1.0 / self.fade_frames
+                line += 1.0
+                numpy.clip(line, 0.0, 1.0, out=line)
+                line *= self.gain
+                data *= ramp
+                if jack_frame_delta(first + count, self.fade_start) >= self.fade_frames:
+                    self.done = True
+            elif self.gain != 1.0:
+                data *= self.gain
+            for channel, out in enumerate(outputs):
+                if channels is not None:
+                    out += channels[channel]
+                else:
+                    out[offset:offset + count] += data[:, channel]
+            if not self.playing.is_set():
+                self.playing.set()
+        if self.stream.exhausted:
+            self.done = True
+        return self.done
+
+class JackBufferEngine:
+    """デコード済みのバッファを JACK の process コールバックで直接出力するエンジン
+
+    1つの JACK クライアント（出力ポート2つ）で、放送用・プリロール用の
+    BufferPlayer の音源をミックスする。開始はフレーム単位で指定し、
+    ゲイン・フェードはコールバック内でサンプル単位に適用する。
+
+    コールバックでは音声データ用の配列を確保しない（作業用のバッファと
+    出力ポートの配列は使い回す）。Python のため、小さなオブジェクトの生成
+    （整数・配列のビューなど）までは避けられない。
+    """
+
+    def __init__(self, client_name='easyaps-player', destinations=(), debug_mode=False):
+        self.client_name = client_name
+        self.destinations = list(destinations)  # 出力ポートの接続先（L, R）
+        self.debug_mode = debug_mode
+        self.client = None
+        self.ports = []
+        self._port_buffers = []    # 出力ポートのバッファのアドレス（前のサイクル）
+        self._outputs = []         # 上記のバッファの NumPy 配列（アドレスが変わったときだけ作り直す）
+        self.samplerate = 48000
+        self._voices = []          # 出力中の音源（コールバックは参照のみ。更新はリストの入れ替え）
+        self._lock = threading.Lock()
+        self._discard_pending = False  # 出力が終わった音源がある（コールバックが立て、破棄スレッドが見る）
+        self._stop = threading.Event()
+        self._discard_thread = None
+
+    @staticmethod
+    def available():
+        """プロセス内再生に必要なモジュール・コマンドがそろっているか"""
+        return jack is not None and numpy is not None and shutil.which('ffmpeg') is not None
+
+    def open(self):
+        """JACK クライアントを開き、出力ポートを接続先につなぐ"""
+        if self.client is not None:
+            return True
+        try:
+            client = jack.Client(self.client_name, no_start_server=True)
+            self.ports = [client.outports.register(f"out_{i + 1}") for i in range(DecodedStream.CHANNELS)]
+            self._port_buffers = [None] * len(self.ports)
+            self._outputs = [None] * len(self.ports)
+            client.set_process_callback(self._process)
+            client.set_shutdown_callback(self._on_shutdown)
+            self.client = client
+            client.activate()
+            for port, destination in zip(self.ports, self.destinations):
+                try:
+                    client.connect(port, destination)
+                except jack.JackError as e:
+                    print(f"JACK接続エラー ({port.name} → {destination}): {e}")
+        except Exception as e:
+            print(f"JACKクライアント接続エラー（プロセス内再生）: {e}")
+            self.client = None
+            return False
+        self.samplerate = client.samplerate
+        self._stop.clear()
+        self._discard_thread = threading.Thread(target=self._run_discard, name='voice-discard', daemon=True)
+        self._discard_thread.start()
+        print(f"プロセス内再生の JACK クライアントを開きました: {client.name} ({client.samplerate} Hz)")
+        return True
+
+    def close(self):
+        """JACK クライアントを閉じ、出力中の音源を解放"""
+        self._stop.set()
+        if self._discard_thread is not None:
+            self._discard_thread.join(timeout=1.0)
+            self._discard_thread = None
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                client.deactivate()
+                client.close()
+            except Exception:
+                pass
+        self._port_buffers = []
+        self._outputs = []
+        with self._lock:
+            voices, self._voices = self._voices, []
+        for voice in voices:
+            voice.stream.close()
+
+    def _on_shutdown(self, status, reason):
+        """JACK サーバー停止の通知"""
+        print(f"\nJACKサーバーから切断されました（プロセス内再生）: {reason}")
+        self.client = None
+
+    DISCARD_INTERVAL = 0.05   # 出力が終わった音源を確認する間隔（秒）
+
+    @property
+    def blocksize(self):
+        client = self.client
+        return client.blocksize if client is not None else 1024
+
+    def start(self, voice, at=None, frame=None):
+        """音源の出力を予約
+
+        at: 開始する時刻（time.monotonic() の値）。JACK のフレーム時刻に換算し、
+        コールバックがそのフレームから出力する。省略時は呼び出し時点から1周期後。
+        frame: 開始する JACK のフレーム時刻（指定すれば at より優先）
+        """
+        client = self.client
+        if client is None:
+            return False
+        if frame is not None:
+            start_frame = frame
+        elif at is None:
+            start_frame = client.frame_time + client.blocksize
+        else:
+            start_frame = client.frame_time + int(round((at - time.monotonic()) * client.samplerate))
+        voice.start_frame = start_frame & 0xFFFFFFFF
+        with self._lock:
+            self._voices = self._voices + [voice]
+        return True
+
+    def _run_discard(self):
+        """破棄スレッド：コールバックが立てたフラグを見て、出力が終わった音源を解放"""
+        while not self._stop.wait(self.DISCARD_INTERVAL):
+            if self._discard_pending:
+                self._discard_done()
+
+    def _discard_done(self):
+        """出力が終わった音源をリストから外して解放（コールバックの外で実行）"""
+        self._discard_pending = False
+        with self._lock:
+            finished = [v for v in self._voices if v.done]
+            if finished:
+                self._voices = [v for v in self._voices if not v.done]
+        for voice in finished:
+            voice.stream.close()
+
+    def _output_arrays(self, frames):
+        """出力ポートのバッファを NumPy 配列で返す（コールバック内で呼ぶ）
+
+        バッファはサイクルごとに取得し直す必要があるが、アドレスが前のサイクルと
+        同じなら配列を作り直さない（JACK-Client の get_array() は毎回作る）。
+        """
+        outputs = self._outputs
+        for index, port in enumerate(self.ports):
+            buffer = jack._lib.jack_port_get_buffer(port._ptr, frames)
+            if buffer != self._port_buffers[index] or len(outputs[index]) != frames:
+                self._port_buffers[index] = buffer
+                outputs[index] = numpy.frombuffer(jack._ffi.buffer(buffer, frames * 4), dtype=numpy.float32)
+        return outputs
+
+    def _process(self, frames):
+        """JACK の process コールバック（リアルタイムスレッド）"""
+        client = self.client
+        if client is None:
+            return  # JACK サーバーから切断された（_on_shutdown）・閉じている
+        outputs = self._output_arrays(frames)
+        for out in outputs:
+            out.fill(0.0)
+        voices = self._voices
+        if not voices:
+            return
+        frame_time = client.last_frame_time
+        finished = False
+        for voice in voices:
+            if voice.mix(outputs, frame_time, frames):
+                finished = True
+        if finished:
+            self._discard_pending = True  # スレッドの起動・ロックはコールバック内で行わない
+
+class BufferPlayer:
+    """mpvPlayer と同じ操作で、JackBufferEngine を使ってプロセス内で再生するプレイヤー
+
+    arm() で音源の先頭をメモリに先読みし、start_armed() で JACK のフレーム
+    単位の時刻に出力を始める。再生のたびに mpv を起動しない（デコードは
+    ffmpeg で開始前に行う）。
+    """
+    STOP_FADE = 0.005   # 停止時のクリック音を避けるためのフェード（秒）
+
+    def __init__(self, engine, debug_mode=False, handover=True, preload=1.0, max_ahead=30.0):
+        self.engine = engine
+        self.debug_mode = debug_mode
+        self.handover = handover
+        self.mode = 'buffer'
+        self.preload = preload       # 再生開始前にデコードしておく秒数
+        self.max_ahead = max_ahead   # 再生中に先読みする最大の秒数
+        self.ffmpeg_path = shutil.which('ffmpeg') or 'ffmpeg'
+        self.voice = None            # 出力中の音源
+        self.armed_voice = None      # arm() で準備した音源
+        self.armed_file = None
+
+    @staticmethod
+    def gain_for(audio_filter):
+        """固定ゲイン（volume=XdB）はコールバックで適用し、それ以外は ffmpeg のフィルタに渡す"""
+        match = re.match(r'^volume=(-?[\d.]+)dB$', audio_filter or '')
+        if match:
+            return 10 ** (float(match.group(1)) / 20), None
+        return 1.0, audio_filter
+
+    def _prepare(self, filepath, start_position, audio_filter, timeout):
+        """デコードを始め、preload 秒分そろったら BufferVoice を返す（間に合わなければ None）"""
+        if audio_filter is None:
+            audio_filter = LIVE_LOUDNORM
+        gain, ffmpeg_filter = self.gain_for(audio_filter)
+        stream = DecodedStream(filepath, self.engine.samplerate, start_position, ffmpeg_filter,
+                               self.max_ahead, self.ffmpeg_path)
+        try:
+            stream.start()
+        except OSError as e:
+            print(f"デコードエラー: {e}")
+            return None
+        if not stream.wait_ready(int(self.preload * self.engine.samplerate), timeout):
+            if self.debug_mode:
+                print(f"[プロセス内再生] 先読みが間に合いません: {filepath}")
+            stream.close()
+            return None
+        return BufferVoice(stream, gain, frames=self.engine.blocksize)
+
+    def play_file(self, filepath, start_position=0, audio_filter=None):
+        """ファイルを再生（先読みが終わり次第、前の音源と入れ替える）"""
+        voice = self._prepare(filepath, start_position, audio_filter, timeout=2.0)
+        if voice is None:
+            return False
+        return self._start(voice)
+
+    def play_file_from_position(self, filepath, start_position, audio_filter=None):
+        """指定位置から再生"""
+        return self.play_file(filepath, start_position, audio_filter)
+
+    def arm(self, filepath, start_position=0, timeout=2.0, audio_filter=None, start_at=None):
+        """音源を先読みして待機
+
+        start_at（time.monotonic() の時刻）を指定すると、その時刻に当たる JACK の
+        フレームで出力が始まるよう予約する（start_armed() の呼び出しの遅れに
+        よらない）。省略時は start_armed() で開始する。
+        """
+        self._discard_armed()
+        voice = self._prepare(filepath, start_position, audio_filter, timeout)
+        if voice is None:
+            return False
+        if start_at is not None and not self.engine.start(voice, at=start_at):
+            voice.stream.close()
+            return False
+        self.armed_voice = voice
+        self.armed_file = filepath
+        return True
+
+    def start_armed(self):
+        """arm() で準備した音源の出力を開始（予約済みならこのプレイヤーの音源として確定）"""
+        voice, self.armed_voice = self.armed_voice, None
+        self.armed_file = None
+        if voice is None or voice.done:
+            return False
+        if voice.start_frame is None:
+            return self._start(voice)
+        previous, self.voice = self.voice, voice
+        if previous is not None:
+            previous.fade_out(int(self.STOP_FADE * self.engine.samplerate), start_frame=voice.start_frame)
+        return True
+
+    def cancel_armed(self):
+        """arm() で予約した開始を取り消す"""
+        self._discard_armed()
+
+    def _start(self, voice):
+        """音源の出力を開始し、このプレイヤーで出力中だった音源はフェードアウト"""
+        previous, self.voice = self.voice, voice
+        if not self.engine.start(voice):
+            self.voice = previous
+            voice.stream.close()
+            return False
+        if previous is not None:
+            previous.fade_out(int(self.STOP_FADE * self.engine.samplerate), start_frame=voice.start_frame)
+        return True
+
+    def _discard_armed(self):
+        voice, self.armed_voice = self.armed_voice, None
+        self.armed_file = None
+        if voice is not None:
+            voice.done = True  # 開始を予約済みならエンジンの出力からも外れる
+            voice.stream.close()
+
+    def wait_playing(self, timeout=1.0):
+        """音声の出力が始まるまで待機"""
+        voice = self.voice
+        return voice is not None and voice.playing.wait(timeout)
+
+    def hand_over(self, incoming, fade=0.0, timeout=1.0):
+        """incoming の開始フレームから、この音源を fade 秒でフェードアウト（クロスフェード）
+
+        incoming の開始フレームが分からない場合は出力開始を確認してからフェードする。
+        """
+        voice, self.voice = self.voice, None
+        if voice is None:
+            return
+        start_frame = incoming.voice.start_frame if incoming.voice is not None else None
+        if start_frame is None and not incoming.wait_playing(timeout) and self.debug_mode:
+            print("[プロセス内再生] 引き継ぎ先の再生開始を確認できませんでした")
+        voice.fade_out(int(max(fade, self.STOP_FADE) * self.engine.samplerate), start_frame=start_frame)
+
+    def stop(self):
+        """再生を停止（短いフェードアウト後に出力から外す）"""
+        self._discard_armed()
+        voice, self.voice = self.voice, None
+        if voice is None or voice.done:
+            return False
+        voice.fade_out(int(self.STOP_FADE * self.engine.samplerate))
+        return True
+
+    def is_playing(self):
+        """再生中かどうかを確認"""
+        voice = self.voice
+        return voice is not None and not voice.done
+
+    def disconnect(self):
+        """クリーンアップ（停止・先読みの破棄）"""
+        self.stop()
+
+class JackControl:
+    """JACK のポート接続を制御するクラス
+
+    JACK-Client（python3-jack-client）が利用できる場合は1つのクライアント接続を
+    保持し、ポート接続の変化をコールバックで受けて接続グラフをキャッシュする。
+    接続確認はメモリ上の参照、接続・切断は API の直接呼び出しになる。
+    利用できない場合は jack_lsp / jack_connect / jack_disconnect を呼び出す。
+    """
+    ROUTE_RETRY = 0.5   # route() の接続先のクライアントが有効になるまで再試行する時間（秒）
+
+    def __init__(self, client_name='easyaps', backend='auto', debug_mode=False):
+        self.client_name = client_name
+        self.backend = backend    # auto / client / cli
+        self.debug_mode = debug_mode
+        self.client = None
+        self._connections = set()  # (出力ポート名, 入力ポート名)
+        self._routes = {}          # JACK クライアント名 → 出力ポートの接続先（L, R）
+        self._router = None        # ポート登録時の接続を行うスレッド（通知スレッドでは接続できない）
+        self._lock = threading.Lock()
+
+    @property
+    def in_process(self):
+        """プロセス内クライアントで制御中かどうか"""
+        return self.client is not None
+
+    def open(self):
+        """プロセス内クライアントを開く（失敗時は CLI にフォールバック）"""
+        if self.client is not None or self.backend == 'cli':
+            return self.client is not None
+        if jack is None:
+            if self.backend == 'client':
+                print("警告: JACK-Client モジュールがありません。jack_connect 等を使用します。")
+            return False
+        try:
+            client = jack.Client(self.client_name, no_start_server=True)
+            client.set_port_connect_callback(self._on_port_connect)
+            client.set_port_registration_callback(self._on_port_registration)
+            client.set_shutdown_callback(self._on_shutdown)
+            client.activate()
+            connections = set()
+            for port in client.get_ports(is_output=True):
+                for peer in client.get_all_connections(port):
+                    connections.add((port.name, peer.name))
+        except Exception as e:
+            print(f"JACKクライアント接続エラー: {e}（jack_connect 等を使用します）")
+            return False
+        with self._lock:
+            self._connections = connections
+        self._router = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='jack-route')
+        self.client = client
+        print(f"JACKクライアントに接続しました: {client.name} (接続数: {len(connections)})")
+        return True
+
+    def close(self):
+        """プロセス内クライアントを閉じる"""
+        router, self._router = self._router, None
+        if router is not None:
+            router.shutdown(wait=False)
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                client.deactivate()
+                client.close()
+            except Exception:
+                pass
+
+    def _on_port_connect(self, a, b, connect):
+        """ポート接続・切断の通知（JACK の通知スレッド）"""
+        if a.is_input:
+            a, b = b, a
+        with self._lock:
+            if connect:
+                self._connections.add((a.name, b.name))
+            else:
+                self._connections.discard((a.name, b.name))
+
+    def route(self, client_name, destinations):
+        """client_name の出力ポートを登録のたびに destinations（L, R）へ接続する
+
+        プロセス内クライアントで制御できない場合は False（呼び出し側で
+        mpv の自動接続先を指定する）。
+        """
+        if self.client is None:
+            return False
+        with self._lock:
+            self._routes[client_name] = tuple(destinations)
+        self._router.submit(self._connect_route, client_name)
+        return True
+
+    def _on_port_registration(self, port, register):
+        """ポート登録の通知（JACK の通知スレッド）。接続は別スレッドで行う"""
+        if not register or not port.is_output:
+            return
+        name = port.name.split(':', 1)[0]
+        with self._lock:
+            if name not in self._routes:
+                # 同名のクライアントがある場合に JACK が付ける番号（-01 など）を除く
+                name = re.sub(r'-\d+$', '', name)
+                if name not in self._routes:
+                    return
+        router = self._router
+        if router is not None:
+            try:
+                router.submit(self._connect_route, port.name.split(':', 1)[0], name)
+            except RuntimeError:
+                pass
+
+    def _connect_route(self, client_name, route_name=None):
+        """client_name の出力ポートを登録順に接続先へつなぐ（ルーティング用スレッド）
+
+        ポートの登録はクライアントの activate より前に通知されるため、
+        接続できるようになるまで短い間隔で再試行する。
+        """
+        client = self.client
+        with self._lock:
+            destinations = self._routes.get(route_name or client_name)
+        if client is None or not destinations:
+            return
+        deadline = time.monotonic() + self.ROUTE_RETRY
+        while True:
+            try:
+                ports = client.get_ports('^' + jack_port_regex(client_name) + ':',
+                                         is_output=True, is_audio=True)
+            except jack.JackError:
+                return
+            error = None
+            for port, destination in zip(ports, destinations):
+                if self.is_connected(port.name, destination):
+                    continue
+                try:
+                    client.connect(port, destination)
+                except jack.JackError as e:
+                    error = e
+                    continue
+                with self._lock:
+                    self._connections.add((port.name, destination))
+            if error is None:
+                return
+            if time.monotonic() >= deadline:
+                print(f"JACK接続エラー ({client_name} → {', '.join(destinations)}): {error}")
+                return
+            time.sleep(0.01)
+
+    def _on_shutdown(self, status, reason):
+        """JACK サーバー停止の通知"""
+        print(f"\nJACKサーバーから切断されました: {reason}（jack_connect 等を使用します）")
+        self.client = None
+
+    def _cli_connections(self):
+        """jack_lsp -c の出力から接続一覧を取得"""
+        connections = set()
+        result = subprocess.run(["jack_lsp", "-c"],
+                                capture_output=True,
+                                text=True,
+                                timeout=3)
+        if result.returncode != 0:
+            return connections
+        current_port = None
+        for line in result.stdout.split('\n'):
+            if not line.strip():
+                continue
+            if not line.startswith((' ', '\t')):
+                # ポートの行（インデントなし）
+                current_port = line.strip()
+            elif current_port is not None:
+                # 接続先の行（インデント有り）
+                connections.add((current_port, line.strip()))
+        return connections
+
+    def is_connected(self, source, destination):
+        """source → destination が接続されているか"""
+        return self.all_connected([(source, destination)])
+
+    def all_connected(self, pairs):
+        """(source, destination) の組がすべて接続されているか（CLI では jack_lsp を1回だけ実行）"""
+        if self.client is not None:
+            with self._lock:
+                return all(pair in self._connections for pair in pairs)
+        try:
+            connections = self._cli_connections()
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return False
+        return all(pair in connections for pair in pairs)
+
+    def connect(self, source, destination):
+        """source → destination を接続"""
+        client = self.client
+        if client is not None:
+            if self.is_connected(source, destination):
+                return True
+            try:
+                client.connect(source, destination)
+            except jack.JackError as e:
+                print(f"JACK接続エラー ({source} → {destination}): {e}")
+                return False
+            with self._lock:
+                self._connections.add((source, destination))
+            return True
+        subprocess.run(["jack_connect", source, destination],
+                       capture_output=True, text=True, timeout=5)
+        return True
+
+    def disconnect(self, source, destination):
+        """source → destination を切断"""
+        client = self.client
+        if client is not None:
+            if not self.is_connected(source, destination):
+                return True
+            try:
+                client.disconnect(source, destination)
+            except jack.JackError as e:
+                print(f"JACK切断エラー ({source} → {destination}): {e}")
+                return False
+            with self._lock:
+                self._connections.discard((source, destination))
+            return True
+        subprocess.run(["jack_disconnect", source, destination],
+                       capture_output=True, text=True, timeout=5)
+        return True
+
+class LevelMonitor:
+    """放送出力のレベルを測定するクラス（無音検出用）
+
+    JACK の入力ポートを2つ持つクライアントを開き、playback_l / playback_r に
+    つながっている出力ポートを同じように入力ポートにもつなぐ（接続の変化に
+    追従）。process コールバックは入力をリングバッファにコピーするだけで、
+    RMS・ピークの計算は監視スレッドが interval 秒ごとに NumPy でまとめて行う。
+    リングバッファへの書き込みはコールバックのみが行い、書き込み済みの
+    フレーム数で読み出し位置を決めるためロックは使わない。
+    """
+    FLOOR_DB = -120.0   # 無音（0）の dBFS 表示の下限
+
+    def __init__(self, client_name, destinations, callback, interval=0.5, seconds=2.0,
+                 debug_mode=False):
+        self.client_name = client_name
+        self.destinations = list(destinations)  # 監視する入力ポート（playback_l, playback_r）
+        self.callback = callback    # callback(rms_db のリスト, peak_db のリスト)
+        self.interval = interval
+        self.seconds = seconds      # リングバッファの長さ（秒）
+        self.debug_mode = debug_mode
+        self.client = None
+        self.ports = []
+        self._ring = None
+        self._size = 0
+        self._written = 0           # 書き込み済みのフレーム数（コールバックのみ更新）
+        self._read = 0              # 測定済みのフレーム数（監視スレッドのみ更新）
+        self._resync = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def available():
+        """レベル測定に必要なモジュールがそろっているか"""
+        return jack is not None and numpy is not None
+
+    def open(self):
+        """JACK クライアントを開き、監視スレッドを開始"""
+        try:
+            client = jack.Client(self.client_name, no_start_server=True)
+            self.ports = [client.inports.register(f"in_{i + 1}") for i in range(len(self.destinations))]
+            self._size = 1 << max(10, math.ceil(math.log2(self.seconds * client.samplerate)))
+            self._ring = numpy.zeros((len(self.ports), self._size), dtype=numpy.float32)
+            client.set_process_callback(self._process)
+            client.set_port_connect_callback(self._on_port_connect)
+            client.activate()
+        except Exception as e:
+            print(f"JACKクライアント接続エラー（レベル監視）: {e}")
+            return False
+        self.client = client
+        self._sync_connections()
+        self._thread = threading.Thread(target=self._run, name='level-monitor', daemon=True)
+        self._thread.start()
+        print(f"出力レベルの監視を開始しました: {', '.join(self.destinations)}")
+        return True
+
+    def close(self):
+        """監視を停止して JACK クライアントを閉じる"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                client.deactivate()
+                client.close()
+            except Exception:
+                pass
+
+    def _process(self, frames):
+        """JACK の process コールバック：入力をリングバッファにコピー"""
+        size = self._size
+        position = self._written % size
+        first = min(frames, size - position)
+        for ring, port in zip(self._ring, self.ports):
+            data = port.get_array()
+            ring[position:position + first] = data[:first]
+            if first < frames:
+                ring[:frames - first] = data[first:]
+        self._written += frames
+
+    def _on_port_connect(self, a, b, connect):
+        """ポート接続の変化（JACK の通知スレッド。接続操作は監視スレッドで行う）"""
+        if a.name in self.destinations or b.name in self.destinations:
+            self._resync.set()
+
+    def _sync_connections(self):
+        """playback_l / playback_r への接続元を入力ポートにもつなぐ"""
+        client = self.client
+        own = {port.name for port in self.ports}
+        for port, destination in zip(self.ports, self.destinations):
+            try:
+                sources = {p.name for p in client.get_all_connections(destination)} - own
+                current = {p.name for p in client.get_all_connections(port)}
+                for source in sources - current:
+                    client.connect(source, port)
+                for source in current - sources:
+                    client.disconnect(source, port)
+            except jack.JackError as e:
+                if self.debug_mode:
+                    print(f"[レベル監視] 接続エラー ({destination}): {e}")
+
+    def measure(self):
+        """前回の測定以降のフレームの RMS・ピーク（dBFS）をチャンネルごとに返す（なければ None）"""
+        written = self._written
+        count = min(written - self._read, self._size)
+        self._read = written
+        if count <= 0:
+            return None
+        start = (written - count) % self._size
+        rms_db, peak_db = [], []
+        for ring in self._ring:
+            if start + count <= self._size:
+                segments = (ring[start:start + count],)
+            else:
+                segments = (ring[start:], ring[:start + count - self._size])
+            energy = sum(float(numpy.dot(s, s)) for s in segments)
+            peak = max(max(float(s.max()), -float(s.min())) for s in segments)
+            rms_db.append(self.to_db(math.sqrt(energy / count)))
+            peak_db.append(self.to_db(peak))
+        return rms_db, peak_db
+
+    @classmethod
+    def to_db(cls, value):
+        return max(cls.FLOOR_DB, 20 * math.log10(value)) if value > 0 else cls.FLOOR_DB
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._resync.is_set():
+                self._resync.clear()
+                self._sync_connections()
+            levels = self.measure()
+            if levels is not None:
+                try:
+                    self.callback(*levels)
+                except Exception as e:
+                    print(f"\nレベル監視エラー: {e}")
+
+class DirectoryWatcher:
+    """ディレクトリ内のファイルの追加・更新・削除を監視するクラス
+
+    Linux では inotify（ctypes 経由）でイベントを受け取り、変更のあった
+    ファイル名で callback を呼び出す。inotify が使えない場合は
+    poll_interval 秒ごとに mtime を比較する。
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    _EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    def __init__(self, path, callback, poll_interval=5):
+        self.path = path
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.running = False
+        self.thread = None
+        self._inotify_fd = None
+        self._stop_pipe = None
+
+    def _open_inotify(self):
+        """inotify を初期化して監視を登録（失敗時は None）"""
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_MOVED_FROM | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.path), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def start(self):
+        """監視スレッドを開始"""
+        if self.running:
+            return
+        self.running = True
+        self._inotify_fd = self._open_inotify()
+        if self._inotify_fd is not None:
+            self._stop_pipe = os.pipe()
+            target = self._inotify_loop
+        else:
+            print(f"inotify を使用できません。{self.poll_interval}秒ごとに確認します: {self.path}")
+            target = self._poll_loop
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """監視スレッドを停止"""
+        self.running = False
+        if self._stop_pipe is not None:
+            os.write(self._stop_pipe[1], b'x')
+
+    def _notify(self, name):
+        try:
+            self.callback(name)
+        except Exception as e:
+            print(f"\nファイル監視の処理でエラーが発生しました ({name}): {e}")
+
+    def _inotify_loop(self):
+        """inotify のイベントを読み取るスレッド"""
+        fd, stop_fd = self._inotify_fd, self._stop_pipe[0]
+        try:
+            while self.running:
+                readable, _, _ = select.select([fd, stop_fd], [], [])
+                if stop_fd in readable:
+                    break
+                data = os.read(fd, 65536)
+                offset = 0
+                names = []
+                while offset + self._EVENT.size <= len(data):
+                    _, _, _, length = self._EVENT.unpack_from(data, offset)
+                    offset += self._EVENT.size
+                    name = data[offset:offset + length].rstrip(b'\0')
+                    offset += length
+                    if name and os.fsdecode(name) not in names:
+                        names.append(os.fsdecode(name))
+                for name in names:
+                    self._notify(name)
+        finally:
+            os.close(fd)
+            for pipe_fd in self._stop_pipe:
+                os.close(pipe_fd)
+            self._inotify_fd = self._stop_pipe = None
+
+    def _snapshot(self):
+        """ファイル名 → mtime の一覧"""
+        snapshot = {}
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    try:
+                        snapshot[entry.name] = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return snapshot
+
+    def _poll_loop(self):
+        """mtime の比較で変更を検出するスレッド（inotify が使えない場合）"""
+        previous = self._snapshot()
+        while self.running:
+            time.sleep(self.poll_interval)
+            current = self._snapshot()
+            for name in sorted(set(previous) | set(current)):
+                if previous.get(name) != current.get(name):
+                    self._notify(name)
+            previous = current
+
+class LogWriter:
+    """キューを介してログファイルに書き込むクラス
+
+    write() はキューに積むだけで戻り、書き込みスレッドが溜まった分を
+    まとめて書き込む（fsync は fsync_interval 秒ごと）。ファイルが
+    max_bytes を超えたとき、または日付が変わったとき（daily=True）に
+    NAME.1 … NAME.<backup_count> へローテーションする。
+    """
+    _CLOSE = object()  # 書き込みスレッドの終了指示
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=7, daily=True,
+                 fsync_interval=5.0, echo=False, echo_prefix=''):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.daily = daily
+        self.fsync_interval = fsync_interval
+        self.echo = echo            # 標準出力にも表示
+        self.echo_prefix = echo_prefix  # 標準出力の各行の先頭に付ける文字列（マルチ局モードの局名）
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+        self._size = 0
+        self._opened_date = None
+        self._unsynced = False
+
+    def start(self):
+        """書き込みスレッドを開始"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, item):
+        """ログを1件キューに積む（書き込みは書き込みスレッドで行う）"""
+        self._queue.put(item)
+
+    def close(self, timeout=5.0):
+        """キューに残った分を書き込んでから終了"""
+        if self._thread is not None:
+            self._queue.put(self._CLOSE)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def format(self, item):
+        """キューの要素をファイルに書き込む1行に変換"""
+        return item
+
+    def _echo_text(self, item):
+        """標準出力に表示する文字列（空行以外の各行に echo_prefix を付ける）"""
+        if not self.echo_prefix:
+            return item
+        return '\n'.join(self.echo_prefix + line if line.strip() else line
+                         for line in str(item).split('\n'))
+
+    def _writer(self):
+        while True:
+            try:
+                items = [self._queue.get(timeout=self.fsync_interval if self._unsynced else None)]
+            except queue.Empty:
+                self._sync()
+                continue
+            # 溜まっている分をまとめて取り出す
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = False
+            lines = []
+            for item in items:
+                if item is self._CLOSE:
+                    closing = True
+                    continue
+                if self.echo:
+                    print(self._echo_text(item))
+                lines.append(self.format(item))
+            try:
+                if lines:
+                    self._write_lines(lines)
+                if closing:
+                    self._sync()
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+            except Exception as e:
+                print(f"ログ書き込みエラー ({self.path}): {e}")
+            if closing:
+                return
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        st = os.fstat(self._file.fileno())
+        self._size = st.st_size
+        # 既存のファイルは最終更新日の日付のものとして扱う
+        self._opened_date = (datetime.fromtimestamp(st.st_mtime).date() if st.st_size
+                             else datetime.now().date())
+
+    def _write_lines(self, lines):
+        if self._file is None:
+            self._open()
+        if self._size and self.daily and datetime.now().date() != self._opened_date:
+            self._rotate()
+        chunk = []
+        chunk_size = 0
+        for line in lines:
+            data = line + '\n'
+            size = len(data.encode('utf-8'))
+            if self.max_bytes and self._size + chunk_size + size > self.max_bytes and self._size + chunk_size:
+                self._file.write(''.join(chunk))
+                chunk, chunk_size = [], 0
+                self._rotate()
+            chunk.append(data)
+            chunk_size += size
+        self._file.write(''.join(chunk))
+        self._file.flush()
+        self._size += chunk_size
+        self._unsynced = True
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+
+    def _rotate(self):
+        """NAME → NAME.1 → … → NAME.<backup_count> の順にずらして新しいファイルを開く"""
+        self._sync()
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+class AsRunLog(LogWriter):
+    """実際に放送した内容を JSON Lines で記録するログ（1行1イベント）"""
+
+    def format(self, item):
+        return json.dumps(item, ensure_ascii=False, default=lambda value: value.isoformat())
+
+class Histogram:
+    """Prometheus 形式のヒストグラム（ラベルの組み合わせごとに集計）"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, lock):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = lock
+        self._series = {}  # ラベル → [バケットごとの件数, 合計, 件数]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, base_labels):
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            labels = base_labels + key
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{self.name}_bucket{Metrics.format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{Metrics.format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{Metrics.format_labels(labels)} {count}")
+        return lines
+
+class Counter:
+    """Prometheus 形式のカウンタ（gauge=True ならゲージ）"""
+
+    def __init__(self, name, help_text, lock, gauge=False):
+        self.name = name
+        self.help_text = help_text
+        self.kind = 'gauge' if gauge else 'counter'
+        self._lock = lock
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self, base_labels):
+        return [f"{self.name}{Metrics.format_labels(base_labels + key)} {value!r}"
+                for key, value in sorted(self._values.items())]
+
+class Metrics:
+    """放送タイミングの計測値を Prometheus のテキスト形式で出力するクラス
+
+    node_exporter の textfile collector 用のファイルを定期的に書き出すか、
+    ローカルの HTTP エンドポイント（/metrics）で公開する。
+    """
+
+    def __init__(self, base_labels=None):
+        self.base_labels = tuple(sorted((base_labels or {}).items()))
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._stop = threading.Event()
+        self._textfile_thread = None
+        self._http_server = None
+        self.textfile_path = None
+
+    def _register(self, name, factory):
+        """同じ名前の計測値が登録済みならそれを返す（複数局で共有するため）"""
+        with self._lock:
+            for metric in self._metrics:
+                if metric.name == name:
+                    return metric
+            metric = factory()
+            self._metrics.append(metric)
+            return metric
+
+    def histogram(self, name, help_text, buckets):
+        return self._register(name, lambda: Histogram(name, help_text, buckets, self._lock))
+
+    def counter(self, name, help_text):
+        return self._register(name, lambda: Counter(name, help_text, self._lock))
+
+    def gauge(self, name, help_text):
+        return self._register(name, lambda: Counter(name, help_text, self._lock, gauge=True))
+
+    def view(self, **labels):
+        """常に labels を付けて記録するビュー（マルチ局モードで局ごとに使用）"""
+        return MetricsView(self, labels)
+
+    @staticmethod
+    def format_labels(labels):
+        """ラベルを {key="value",...} の形式に変換"""
+        if not labels:
+            return ''
+        parts = []
+        for key, value in labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{key}="{value}"')
+        return '{' + ','.join(parts) + '}'
+
+    def render(self):
+        """Prometheus のテキスト形式（version 0.0.4）で出力"""
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric.render(self.base_labels))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self):
+        """textfile collector 用のファイルをアトミックに書き込み"""
+        try:
+            tmp_path = self.textfile_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, self.textfile_path)
+        except OSError as e:
+            print(f"メトリクス書き込みエラー ({self.textfile_path}): {e}")
+
+    def start_textfile(self, path, interval=15.0):
+        """interval 秒ごとに textfile を書き出すスレッドを開始"""
+        self.textfile_path = path
+
+        def writer():
+            while not self._stop.wait(interval):
+                self.write_textfile()
+
+        self._textfile_thread = threading.Thread(target=writer, name='metrics-textfile', daemon=True)
+        self._textfile_thread.start()
+
+    def start_http(self, address, port):
+        """/metrics を返す HTTP サーバーを開始"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http_server = http.server.ThreadingHTTPServer((address, port), Handler)
+        self._http_server.daemon_threads = True
+        threading.Thread(target=self._http_server.serve_forever, name='metrics-http',
+                         daemon=True).start()
+
+    def stop(self):
+        """出力を停止（textfile は最後にもう一度書き出す）"""
+        self._stop.set()
+        if self.textfile_path:
+            self.write_textfile()
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+
+class MetricsView:
+    """Metrics に固定のラベルを付けて記録するビュー（Metrics.view() で作成）"""
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def histogram(self, name, help_text, buckets):
+        return LabelledMetric(self.metrics.histogram(name, help_text, buckets), self.labels)
+
+    def counter(self, name, help_text):
+        return LabelledMetric(self.metrics.counter(name, help_text), self.labels)
+
+    def gauge(self, name, help_text):
+        return LabelledMetric(self.metrics.gauge(name, help_text), self.labels)
+
+class LabelledMetric:
+    """計測値の observe/inc/set に固定のラベルを追加するラッパー"""
+
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def observe(self, value, **labels):
+        self.metric.observe(value, **self.labels, **labels)
+
+    def inc(self, amount=1, **labels):
+        self.metric.inc(amount, **self.labels, **labels)
+
+    def set(self, value, **labels):
+        self.metric.set(value, **self.labels, **labels)
+
+class SystemClock:
+    """実時間の時計（MusicScheduler の既定の時計）"""
+    speed = 1.0
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def wait(self, event, timeout=None):
+        """threading.Event を timeout 秒（この時計の秒）まで待機"""
+        return event.wait(timeout)
+
+class ScaledClock(SystemClock):
+    """start から speed 倍速で進む仮想時計（ベンチマーク用）"""
+
+    def __init__(self, start, speed=100.0):
+        self.speed = float(speed)
+        self._start = start
+        self._origin = time.monotonic()
+
+    def now(self):
+        return self._start + timedelta(seconds=self.monotonic())
+
+    def monotonic(self):
+        return (time.monotonic() - self._origin) * self.speed
+
+    def wait(self, event, timeout=None):
+        return event.wait(None if timeout is None else timeout / self.speed)
+
+class DeadlineTimer:
+    """期限（壁時計の時刻）まで単調時計で待機するタイマー
+
+    期限の SPIN_MARGIN 秒前までは Event.wait で眠り、残りは短い sleep で
+    詰めて開始精度を確保する。wake() で待機中のスレッドを即座に起こせる
+    （スケジュールの再読み込みなど）。
+    """
+    SPIN_MARGIN = 0.005   # 期限直前のこの秒数は短い sleep で詰める
+    MAX_SLEEP = 60.0      # 壁時計の補正に追従するため、一度に眠る最大秒数
+
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self._wake_event = threading.Event()
+        self.wakeups = 0          # 待機からの復帰回数（統計用）
+        self.last_jitter = None   # 直近の期限到達時の遅れ（秒）
+
+    def wake(self):
+        """wait_until() で待機中のスレッドを起こす"""
+        self._wake_event.set()
+
+    def wait_until(self, target):
+        """target まで待機。期限に達したら True、wake() で起こされたら False"""
+        clock = self.clock
+        while True:
+            remaining = (target - clock.now()).total_seconds()
+            if remaining <= self.SPIN_MARGIN:
+                break
+            self.wakeups += 1
+            if clock.wait(self._wake_event, min(remaining - self.SPIN_MARGIN, self.MAX_SLEEP)):
+                self._wake_event.clear()
+                return False
+
+        deadline = clock.monotonic() + remaining
+        while clock.monotonic() < deadline:
+            time.sleep(0.0002)
+        self.last_jitter = (clock.now() - target).total_seconds()
+        return True
+
+class AsyncDeadlineTimer:
+    """DeadlineTimer の asyncio 版（AsyncPlayoutEngine 用）
+
+    期限の SPIN_MARGIN 秒前まではイベントループ上で待機し、残りは短い
+    sleep で詰める。wake() は他のスレッドから呼び出してもよい。
+    """
+    SPIN_MARGIN = DeadlineTimer.SPIN_MARGIN
+    MAX_SLEEP = DeadlineTimer.MAX_SLEEP
+
+    def __init__(self, loop, clock=None):
+        self._loop = loop
+        self.clock = clock or SystemClock()
+        self._wake_event = asyncio.Event()
+        self.wakeups = 0
+        self.last_jitter = None
+
+    def wake(self):
+        """wait_until() で待機中のタスクを起こす（スレッドセーフ）"""
+        self._loop.call_soon_threadsafe(self._wake_event.set)
+
+    async def wait_until(self, target):
+        """target まで待機。期限に達したら True、wake() で起こされたら False"""
+        clock = self.clock
+        while True:
+            remaining = (target - clock.now()).total_seconds()
+            if remaining <= self.SPIN_MARGIN:
+                break
+            self.wakeups += 1
+            try:
+                await asyncio.wait_for(self._wake_event.wait(),
+                                       min(remaining - self.SPIN_MARGIN, self.MAX_SLEEP) / clock.speed)
+            except asyncio.TimeoutError:
+                continue
+            self._wake_event.clear()
+            return False
+
+        # 短い sleep の合間にループへ制御を返し、同じループの他局のタスクを止めない
+        deadline = clock.monotonic() + remaining
+        while clock.monotonic() < deadline:
+            time.sleep(0.0002)
+            await asyncio.sleep(0)
+        self.last_jitter = (clock.now() - target).total_seconds()
+        return True
+
+class LoopEvent:
+    """他のスレッドから set() できる asyncio.Event（threading.Event の代わり）"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._event.clear()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    async def wait(self, timeout=None):
+        """set されるまで待機（timeout 秒経過したら False）"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class MediaIndex:
+    """メディアファイルのインメモリ索引（ファイル名 → フルパス）
+
+    起動時に contents_dir 以下を一度だけ走査し、以降はディレクトリの
+    mtime を比較して変更のあったディレクトリだけを再走査する。
+    検索は大文字小文字を区別しない辞書引きで、見つからなかった名前は
+    negative_ttl 秒間キャッシュする。
+    """
+    EXTENSIONS = ('.mp3', '.m4a')  # 対応拡張子（優先順）
+
+    def __init__(self, contents_dir, refresh_interval=30, negative_ttl=10):
+        self.contents_dir = contents_dir
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self._index = {}        # 小文字のファイル名 → フルパスのリスト
+        self._dir_files = {}    # ディレクトリ → そのディレクトリ直下の対応ファイル
+        self._dir_subdirs = {}  # ディレクトリ → そのディレクトリ直下のサブディレクトリ
+        self._dir_mtimes = {}   # ディレクトリ → 走査時の mtime
+        self._negative = {}     # 見つからなかった名前 → 記録時刻（monotonic）
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._refresh_running = False
+
+    @staticmethod
+    def _keys_for(name):
+        """find -iname 'NAME.*' と同じ条件で一致する検索キーを列挙"""
+        lower = name.lower()
+        keys = []
+        pos = lower.find('.')
+        while pos > 0:
+            keys.append(lower[:pos])
+            pos = lower.find('.', pos + 1)
+        return keys
+
+    def _scan_dir(self, dirpath):
+        """1ディレクトリ直下を走査し、(対応ファイル, サブディレクトリ) を返す"""
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():  # シンボリックリンクも辿る（find -L 相当）
+                            subdirs.append(entry.path)
+                        elif entry.is_file() and entry.name.lower().endswith(self.EXTENSIONS):
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return sorted(files), subdirs
+
+    def _rebuild_index(self):
+        """ディレクトリ別のファイル一覧から検索用辞書を作り直す"""
+        index = {}
+        for files in self._dir_files.values():
+            for path in files:
+                for key in self._keys_for(os.path.basename(path)):
+                    index.setdefault(key, []).append(path)
+        for paths in index.values():
+            # .mp3 を .m4a より優先し、同一拡張子内はパス順
+            paths.sort(key=lambda p: (self.EXTENSIONS.index(os.path.splitext(p)[1].lower()), p))
+        self._index = index
+
+    def build(self):
+        """contents_dir 以下を全走査して索引を構築"""
+        start_time = time.time()
+        with self._lock:
+            self._dir_files = {}
+            self._dir_subdirs = {}
+            self._dir_mtimes = {}
+        self.refresh()
+        file_count = sum(len(files) for files in self._dir_files.values())
+        print(f"メディア索引を構築しました: {file_count} ファイル ({time.time() - start_time:.2f}s)")
+
+    def refresh(self):
+        """mtime が変化したディレクトリだけを再走査して索引を更新"""
+        with self._lock:
+            changed = False
+            seen = set()
+            pending = [self.contents_dir]
+            dir_files = {}
+            dir_subdirs = {}
+            dir_mtimes = {}
+            while pending:
+                dirpath = pending.pop()
+                real = os.path.realpath(dirpath)
+                if real in seen:  # シンボリックリンクのループ対策
+                    continue
+                seen.add(real)
+                try:
+                    mtime = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    if dirpath in self._dir_files:
+                        # 共有フォルダが一時的に応答しない：前回の一覧をそのまま使う
+                        # （削除されたディレクトリは親の再走査で一覧から外れる）
+                        dir_files[dirpath] = self._dir_files[dirpath]
+                        dir_subdirs[dirpath] = self._dir_subdirs[dirpath]
+                        dir_mtimes[dirpath] = self._dir_mtimes[dirpath]
+                        pending.extend(dir_subdirs[dirpath])
+                        continue
+                    changed = True
+                    continue
+                dir_mtimes[dirpath] = mtime
+                if self._dir_mtimes.get(dirpath) == mtime:
+                    # 変更なし：既存の一覧を流用し、サブディレクトリだけ辿る
+                    dir_files[dirpath] = self._dir_files[dirpath]
+                    dir_subdirs[dirpath] = self._dir_subdirs[dirpath]
+                else:
+                    changed = True
+                    dir_files[dirpath], dir_subdirs[dirpath] = self._scan_dir(dirpath)
+                pending.extend(dir_subdirs[dirpath])
+            if changed or len(dir_files) != len(self._dir_files):
+                self._dir_files = dir_files
+                self._dir_subdirs = dir_subdirs
+                self._dir_mtimes = dir_mtimes
+                self._rebuild_index()
+                self._negative.clear()
+            return changed
+
+    def lookup(self, filename, exists=os.path.isfile):
+        """ファイル名（拡張子なし）からフルパスを取得。見つからなければ None
+
+        exists: 索引のパスが今もあるかの確認（ローカルにコピー済みなら確認しない場合など）
+        """
+        key = filename.lower()
+        paths = self._index.get(key)
+        if paths:
+            for path in paths:
+                if exists(path):
+                    return path
+            # 索引が古い（削除・移動された）ので更新して再検索
+            self.refresh()
+            paths = self._index.get(key)
+            return paths[0] if paths else None
+
+        # 直近に見つからなかった名前は再走査しない
+        missed_at = self._negative.get(key)
+        if missed_at is not None and time.monotonic() - missed_at < self.negative_ttl:
+            return None
+
+        self.refresh()
+        paths = self._index.get(key)
+        if paths:
+            return paths[0]
+        self._negative[key] = time.monotonic()
+        return None
+
+    def _refresh_loop(self):
+        """索引を定期的に更新するスレッド"""
+        while self._refresh_running:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"\nメディア索引更新エラー: {e}")
+
+    def start_refresh_thread(self):
+        """索引の定期更新スレッドを開始"""
+        if not self._refresh_running and self.refresh_interval > 0:
+            self._refresh_running = True
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresh_thread.start()
+
+    def stop_refresh_thread(self):
+        """索引の定期更新スレッドを停止"""
+        self._refresh_running = False
+
+class FileInfoCache:
+    """音源ごとの解析結果をディスクに保存するキャッシュ
+
+    パスをキーに、サイズ・mtime と解析結果を JSON で保存する。サイズか
+    mtime が変わった音源の結果は無効として扱う。書き込みはまとめて行う。
+    """
+    SAVE_BATCH = 20       # この件数ごとにキャッシュを書き込み
+    SAVE_INTERVAL = 30    # 最後の書き込みからこの秒数が経過したら書き込み
+
+    def __init__(self, cache_path, label):
+        self.cache_path = cache_path
+        self.label = label        # エラーメッセージ用の名前
+        self._lock = threading.Lock()
+        self._entries = {}        # パス → 解析結果
+        self._dirty = 0           # 未保存の解析結果の件数
+        self._last_save = time.monotonic()
+        self._load()
+
+    def _load(self):
+        """キャッシュファイルを読み込み"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._entries = data.get('files', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"{self.label}キャッシュ読み込みエラー: {e}")
+
+    def flush(self):
+        """未保存の結果があればキャッシュファイルをアトミックに書き込み"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'version': 1, 'files': dict(self._entries)}
+            self._dirty = 0
+            self._last_save = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"{self.label}キャッシュ書き込みエラー: {e}")
+
+    def get(self, filepath):
+        """サイズ・mtime が一致する解析結果を返す（なければ None）"""
+        entry = self._entries.get(filepath)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        if entry.get('size') != st.st_size or entry.get('mtime') != st.st_mtime_ns:
+            return None
+        return entry
+
+    def peek(self, filepath):
+        """登録済みの結果を返す（サイズ・mtime は確認しない。なければ None）"""
+        return self._entries.get(filepath)
+
+    def put(self, filepath, st, info):
+        """解析結果を登録（一定件数・一定時間ごとに書き込み）"""
+        entry = dict(info, size=st.st_size, mtime=st.st_mtime_ns)
+        with self._lock:
+            self._entries[filepath] = entry
+            self._dirty += 1
+            save_due = (self._dirty >= self.SAVE_BATCH or
+                        time.monotonic() - self._last_save >= self.SAVE_INTERVAL)
+        if save_due:
+            self.flush()
+        return entry
+
+    def touch(self, filepath, **fields):
+        """登録済みの結果の一部を更新（書き込みは次の flush 時）"""
+        with self._lock:
+            entry = self._entries.get(filepath)
+            if entry is not None:
+                entry.update(fields)
+                self._dirty += 1
+
+    def remove(self, filepath):
+        """結果を削除し、削除した結果を返す（なければ None）"""
+        with self._lock:
+            entry = self._entries.pop(filepath, None)
+            if entry is not None:
+                self._dirty += 1
+        return entry
+
+    def items(self):
+        """(パス, 結果) の一覧（スナップショット）"""
+        with self._lock:
+            return list(self._entries.items())
+
+class MediaAnalyzer(abc.ABC):
+    """音源をワーカープールで解析し、結果を FileInfoCache に保存する基底クラス
+
+    サブクラスは tool（外部コマンド名。不要なら None）と label を定義し、
+    _measure() で1ファイルの解析結果（dict）を返す。
+    """
+    tool = None
+    label = None
+    action = '解析'   # エラーメッセージ用の処理の名前
+
+    def __init__(self, cache_path, workers=2, debug_mode=False):
+        self.cache = FileInfoCache(cache_path, self.label)
+        self.workers = workers
+        self.tool_path = shutil.which(self.tool) if self.tool else None
+        self.nice_path = shutil.which('nice')  # 低優先度で実行（なければそのまま実行）
+        self.debug_mode = debug_mode
+        self._lock = threading.Lock()
+        self._in_flight = {}     # パス → Future
+        self._executor = None
+
+    @property
+    def available(self):
+        """解析用の外部コマンドが利用可能かどうか"""
+        return self.tool is None or self.tool_path is not None
+
+    def get(self, filepath):
+        """有効な解析結果を返す（なければ None）"""
+        return self.cache.get(filepath)
+
+    def submit(self, filepaths):
+        """未解析の音源をワーカープールに投入し、{パス: Future} を返す（投入順に解析）"""
+        futures = {}
+        if not self.available:
+            return futures
+        for filepath in filepaths:
+            with self._lock:
+                future = self._in_flight.get(filepath)
+            if future is None:
+                if self.get(filepath) is not None:
+                    continue
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = concurrent.futures.ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix=self.tool)
+                    future = self._executor.submit(self._run, filepath)
+                    self._in_flight[filepath] = future
+            futures[filepath] = future
+        return futures
+
+    def _run(self, filepath):
+        """1ファイルを解析してキャッシュに保存（ワーカースレッド）"""
+        try:
+            st = os.stat(filepath)
+            info = self._measure(filepath)
+            if info is None:
+                print(f"\n{self.label}{self.action}エラー: {filepath}")
+                return None
+            return self.cache.put(filepath, st, info)
+        except Exception as e:
+            print(f"\n{self.label}{self.action}エラー ({filepath}): {e}")
+            return None
+        finally:
+            with self._lock:
+                self._in_flight.pop(filepath, None)
+                idle = not self._in_flight
+            if idle:
+                self.cache.flush()
+
+    @abc.abstractmethod
+    def _measure(self, filepath):
+        """1ファイルを解析し、キャッシュに保存する結果（dict）を返す（保存しない場合は None）"""
+
+    def _run_tool(self, args):
+        """外部コマンドを低優先度で実行
+
+        スレッドのあるプロセスでは preexec_fn が安全でないため、nice コマンドを介して起動する。
+        """
+        cmd = [self.tool_path] + args
+        if self.nice_path:
+            cmd = [self.nice_path, '-n', '10'] + cmd
+        return subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+
+    def shutdown(self):
+        """未着手の解析を破棄してワーカープールを終了"""
+        if self._executor is not None:
+            try:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:  # Python 3.8 以前
+                self._executor.shutdown(wait=False)
+        self.cache.flush()
+
+class LoudnessAnalyzer(MediaAnalyzer):
+    """音源ごとのラウドネスを事前解析するクラス
+
+    ffmpeg の loudnorm（1パス目, print_format=json）で統合ラウドネスと
+    トゥルーピークを測定し、再生時のオーディオフィルタを決める。
+    """
+    tool = 'ffmpeg'
+    label = 'ラウドネス'
+
+    def __init__(self, cache_path, target_i=-18.0, target_tp=-2.0, target_lra=11.0,
+                 workers=2, debug_mode=False):
+        super().__init__(cache_path, workers, debug_mode)
+        self.target_i = target_i
+        self.target_tp = target_tp
+        self.target_lra = target_lra
+
+    def _measure(self, filepath):
+        result = self._run_tool([
+            "-hide_banner", "-nostdin", "-nostats",
+            "-i", filepath, "-vn",
+            "-af", (f"loudnorm=I={self.target_i}:TP={self.target_tp}:LRA={self.target_lra}"
+                    ":print_format=json"),
+            "-f", "null", "-",
+        ])
+        text = result.stderr
+        start, end = text.rfind('{'), text.rfind('}')
+        if result.returncode != 0 or start < 0 or end < start:
+            return None
+        measured = json.loads(text[start:end + 1])
+        info = {key: float(measured[key]) for key in
+                ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')}
+        if self.debug_mode:
+            print(f"\n[ラウドネス解析] {os.path.basename(filepath)}: "
+                  f"I={info['input_i']:.1f} LUFS, TP={info['input_tp']:.1f} dBTP")
+        return info
+
+    def audio_filter(self, filepath, mode='gain', trusted=False):
+        """解析結果から mpv 用のオーディオフィルタを生成
+
+        mode='gain'   : 目標ラウドネスとの差を固定ゲインで補正（トゥルーピーク上限あり）
+        mode='linear' : 測定値を渡した loudnorm の linear モード
+        未解析・測定不能の音源、mode='live' ではリアルタイム loudnorm を返す。
+        trusted=True なら元の音源のサイズ・mtime を確認しない（確認済みのコピーを再生する場合）。
+        """
+        entry = None
+        if mode != 'live':
+            entry = self.cache.peek(filepath) if trusted else self.get(filepath)
+        if entry is None or not all(math.isfinite(entry[k]) for k in ('input_i', 'input_tp')):
+            return LIVE_LOUDNORM
+        if mode == 'linear':
+            # 無音に近い音源では LRA・しきい値が -inf になるため、loudnorm に渡さない
+            if not all(math.isfinite(entry[k]) for k in ('input_lra', 'input_thresh', 'target_offset')):
+                return LIVE_LOUDNORM
+            return (f"loudnorm=I={self.target_i}:TP={self.target_tp}:LRA={self.target_lra}"
+                    f":measured_I={entry['input_i']}:measured_TP={entry['input_tp']}"
+                    f":measured_LRA={entry['input_lra']}:measured_thresh={entry['input_thresh']}"
+                    f":offset={entry['target_offset']}:linear=true")
+        gain = min(self.target_i - entry['input_i'], self.target_tp - entry['input_tp'])
+        return f"volume={gain:.2f}dB"
+
+class DurationProbe(MediaAnalyzer):
+    """ffprobe で音源の長さ（秒）を測定するクラス"""
+    tool = 'ffprobe'
+    label = '再生時間'
+
+    def _measure(self, filepath):
+        result = self._run_tool([
+            "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", filepath,
+        ])
+        try:
+            return {'duration': float(result.stdout.strip())}
+        except ValueError:
+            return None
+
+    def duration(self, filepath):
+        """測定済みの長さ（秒）。未測定なら None"""
+        entry = self.get(filepath)
+        return entry['duration'] if entry else None
+
+    def probe_all(self, filepaths, timeout=None):
+        """未測定の音源を並列に測定し、完了を待つ"""
+        futures = self.submit(filepaths)
+        concurrent.futures.wait(list(futures.values()), timeout=timeout)
+
+class SeekCache(MediaAnalyzer):
+    """途中からの再生を速くするため、音源を FLAC に変換して保存するキャッシュ
+
+    m4a や VBR の mp3 は長い番組の途中へのシークに時間がかかるため、
+    バックグラウンドで FLAC に変換しておき、途中から再生するときに使う。
+    元の音源のサイズ・mtime が変わると無効になり、合計サイズが max_bytes を
+    超える場合は最後に使われた時刻が古いものから削除する（LRU）。使用時刻は
+    保存したファイルの mtime に記録する（索引の書き出しを待たずに残るため、
+    異常終了後も LRU の順序が保たれる）。
+    """
+    tool = 'ffmpeg'
+    label = 'シークキャッシュ'
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, extensions=('.m4a', '.mp3', '.aac'),
+                 min_bytes=0, workers=1, debug_mode=False):
+        super().__init__(os.path.join(cache_dir, 'index.json'), workers, debug_mode)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.min_bytes = min_bytes        # これより小さい音源は変換しない
+        self._pins = {}                   # 呼び出し元（局）→ 上限を超えても削除しない音源
+        self._evict_lock = threading.Lock()
+        self._remove_partial()
+
+    def _remove_partial(self):
+        """前回の実行で変換途中のまま残ったファイルを削除"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.part'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def wants(self, filepath):
+        """変換の対象とする音源かどうか（拡張子とサイズで判定）"""
+        if not filepath.lower().endswith(self.extensions):
+            return False
+        try:
+            return os.path.getsize(filepath) >= self.min_bytes
+        except OSError:
+            return False
+
+    def submit(self, filepaths):
+        return super().submit([f for f in filepaths if self.wants(f)])
+
+    def get(self, filepath):
+        entry = self.cache.get(filepath)
+        if entry is None or not os.path.exists(entry['path']):
+            return None
+        return entry
+
+    def lookup(self, filepath):
+        """変換済みのファイルのパスを返し、使用時刻を更新（なければ None）"""
+        entry = self.get(filepath)
+        if entry is None:
+            return None
+        self._mark_used(entry['path'])
+        return entry['path']
+
+    @staticmethod
+    def _mark_used(path):
+        """使用時刻として保存したファイルの mtime を現在時刻にする"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _last_used(entry):
+        """保存したファイルの最後に使われた時刻（ファイルがなければ 0）"""
+        try:
+            return os.stat(entry['path']).st_mtime
+        except OSError:
+            return 0
+
+    def _measure(self, filepath):
+        name = hashlib.sha1(filepath.encode('utf-8', 'surrogateescape')).hexdigest() + '.flac'
+        out_path = os.path.join(self.cache_dir, name)
+        tmp_path = out_path + '.part'
+        os.makedirs(self.cache_dir, exist_ok=True)
+        result = self._run_tool([
+            "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+            "-i", filepath, "-map", "0:a:0", "-vn", "-c:a", "flac", "-f", "flac", tmp_path,
+        ])
+        if result.returncode != 0 or not os.path.exists(tmp_path):
+            self._discard(tmp_path)
+            return None
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            print(f"\nシークキャッシュの上限を超えるため保存しません: {filepath}")
+            self._discard(tmp_path)
+            return None
+        self._evict(size, keep=filepath)
+        os.replace(tmp_path, out_path)
+        if self.debug_mode:
+            print(f"\n[シークキャッシュ] {os.path.basename(filepath)}: {size / 1024 ** 2:.1f}MB")
+        return {'path': out_path, 'bytes': size}
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def pin(self, owner, filepaths):
+        """owner（局）の使う音源を削除の対象から外す（owner ごとに前回の指定を置き換える）"""
+        self._pins[owner] = frozenset(filepaths)
+
+    @property
+    def pinned(self):
+        """いずれかの呼び出し元が削除の対象から外している音源"""
+        return frozenset().union(*list(self._pins.values()))
+
+    def _evict(self, incoming, keep=None):
+        """incoming バイトを追加しても上限に収まるよう、古いものから削除"""
+        with self._evict_lock:
+            pinned = self.pinned
+            entries = [(path, entry) for path, entry in self.cache.items() if path != keep]
+            total = sum(entry.get('bytes', 0) for _, entry in entries) + incoming
+            for path, entry in sorted(entries, key=lambda item: self._last_used(item[1])):
+                if total <= self.max_bytes:
+                    break
+                if path in pinned:
+                    continue
+                self.cache.remove(path)
+                self._discard(entry['path'])
+                total -= entry.get('bytes', 0)
+                if self.debug_mode:
+                    print(f"\n[{self.label}] 削除: {os.path.basename(path)}")
+
+class MediaCache(SeekCache):
+    """ネットワーク共有（Samba など）上の音源をローカルディスクにコピーしておくキャッシュ
+
+    SeekCache と同じ保存・LRU 管理で、変換せずにそのままコピーする。
+    次の数件のレコードの音源を先読みの際にサイズ・mtime で確認し、変わって
+    いればコピーし直す。再生時の lookup() は元の音源にアクセスしないため、
+    NAS が一時的に応答しない間もコピー済みの音源は再生できる。先読み対象の
+    音源は局ごとに pin() し、いずれかの局が使うものは容量の上限を超えても
+    削除しない。
+    """
+    tool = None
+    label = 'メディアキャッシュ'
+    action = 'コピー'
+
+    def __init__(self, cache_dir, max_bytes=10 * 1024 ** 3, workers=2, debug_mode=False):
+        super().__init__(cache_dir, max_bytes, extensions=('',), workers=workers,
+                         debug_mode=debug_mode)
+        self._planner = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='media-prefetch')
+
+    def wants(self, filepath):
+        return True
+
+    def lookup(self, filepath):
+        """コピー済みのファイルのパスを返し、使用時刻を更新（なければ None）
+
+        元の音源のサイズ・mtime は確認しない（先読みの際に確認済み）
+        """
+        entry = self.cache.peek(filepath)
+        if entry is None or not os.path.exists(entry['path']):
+            return None
+        self._mark_used(entry['path'])
+        return entry['path']
+
+    def has(self, filepath):
+        """コピー済みかどうか（元の音源にはアクセスしない）"""
+        entry = self.cache.peek(filepath)
+        return entry is not None and os.path.exists(entry['path'])
+
+    def prefetch(self, resolve, owner=None):
+        """resolve() が返す音源（時刻順）をコピーする（変わっていればコピーし直す）
+
+        resolve はメディア索引の検索など NAS にアクセスしうる処理のため、
+        呼び出し元のスレッドを止めないよう先読み用のスレッドで実行する。
+        owner: 呼び出し元の局（マルチ局モードで共有する場合、局ごとに削除の対象から外す）
+        """
+        self._planner.submit(self._prefetch, resolve, owner)
+
+    def _prefetch(self, resolve, owner):
+        try:
+            filepaths = resolve()
+            self.pin(owner, filepaths)
+            # 元の音源にアクセスできない（NAS の停止など）間はコピー済みのものをそのまま使う
+            unreachable = [f for f in filepaths if self.has(f) and not os.path.exists(f)]
+            if unreachable:
+                print(f"\nメディアキャッシュ: 元の音源にアクセスできないため、"
+                      f"コピー済みの {len(unreachable)} ファイルを使用します")
+            filepaths = [f for f in filepaths if f not in unreachable]
+            count = sum(1 for future in self.submit(filepaths).values() if not future.done())
+            if count and self.debug_mode:
+                print(f"\n[メディアキャッシュ] 先読み: {count} ファイル")
+        except Exception as e:
+            print(f"\nメディアキャッシュの先読みエラー: {e}")
+
+    def _measure(self, filepath):
+        st = os.stat(filepath)
+        name = (hashlib.sha1(filepath.encode('utf-8', 'surrogateescape')).hexdigest() +
+                os.path.splitext(filepath)[1].lower())
+        out_path = os.path.join(self.cache_dir, name)
+        tmp_path = out_path + '.part'
+        if st.st_size > self.max_bytes:
+            print(f"\nメディアキャッシュの上限を超えるため保存しません: {filepath}")
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._evict(st.st_size, keep=filepath)
+        try:
+            shutil.copyfile(filepath, tmp_path)
+            after = os.stat(filepath)
+            if (os.path.getsize(tmp_path) != st.st_size or
+                    (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns)):
+                # コピー中に更新された：次の先読みでコピーし直す
+                self._discard(tmp_path)
+                return None
+            os.replace(tmp_path, out_path)
+        except OSError:
+            self._discard(tmp_path)
+            raise
+        if self.debug_mode:
+            print(f"\n[メディアキャッシュ] {os.path.basename(filepath)}: {st.st_size / 1024 ** 2:.1f}MB")
+        return {'path': out_path, 'bytes': st.st_size}
+
+    def shutdown(self):
+        self._planner.shutdown(wait=False)
+        super().shutdown()
+
+class ScheduleRecord:
+    """スケジュールの1レコード（__slots__ で省メモリ化）"""
+    __slots__ = ('time', 'source', 'mix', 'filename', 'filepath', 'broadcast_date')
+
+    def __init__(self, time, source, mix, filename, broadcast_date):
+        self.time = time                      # 開始時刻（datetime）
+        self.source = sys.intern(source)      # 使用しないが保持
+        self.mix = sys.intern(mix)            # 使用しないが保持
+        self.filename = sys.intern(filename)
+        self.filepath = None                  # 再生時に解決したフルパス
+        self.broadcast_date = broadcast_date  # どの日のレコードか
+
+class ScheduleStore:
+    """時刻順に並んだレコードの列
+
+    開始時刻を epoch 秒の配列（array('d')）として並行に保持し、
+    現在・次のレコードの検索を二分探索で行う。インデックスは放送済み
+    レコードを先頭から破棄（evict_before）しても変わらない通し番号で、
+    保持している範囲は start 以上 end 未満。
+    """
+    _EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, records=()):
+        self._records = []
+        self._times = array('d')
+        self._base = 0      # 先頭レコードの通し番号
+        self._lock = threading.RLock()
+        self.extend(records)
+
+    @classmethod
+    def _seconds(cls, dt):
+        """datetime を epoch 秒に変換（タイムゾーンなしのまま比較するため）"""
+        return (dt - cls._EPOCH).total_seconds()
+
+    @property
+    def start(self):
+        """保持している先頭レコードの通し番号"""
+        return self._base
+
+    @property
+    def end(self):
+        """保持している最終レコードの次の通し番号"""
+        with self._lock:
+            return self._base + len(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        with self._lock:
+            if index < self._base:
+                raise IndexError("破棄済みのレコードです")
+            return self._records[index - self._base]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._records))
+
+    def extend(self, records):
+        """レコードを追加（時刻順を維持）"""
+        records = sorted(records, key=lambda r: r.time)
+        if not records:
+            return
+        with self._lock:
+            if self._records and records[0].time < self._records[-1].time:
+                # 既存レコードより前の時刻を含む場合は全体を並べ直す
+                records = sorted(self._records + records, key=lambda r: r.time)
+                self._records = []
+                self._times = array('d')
+            self._records.extend(records)
+            self._times.extend(self._seconds(r.time) for r in records)
+
+    def replace_after(self, index, records):
+        """通し番号 index より後のレコードを records（時刻順）で置き換える"""
+        records = sorted(records, key=lambda r: r.time)
+        with self._lock:
+            keep = min(max(0, index + 1 - self._base), len(self._records))
+            del self._records[keep:]
+            del self._times[keep:]
+            self._records.extend(records)
+            self._times.extend(self._seconds(r.time) for r in records)
+
+    def evict_before(self, index):
+        """通し番号 index より前のレコードを破棄し、破棄した件数を返す"""
+        with self._lock:
+            count = min(max(0, index - self._base), len(self._records))
+            if count:
+                del self._records[:count]
+                del self._times[:count]
+                self._base += count
+            return count
+
+    def index_at(self, dt):
+        """dt 以前に開始した最後のレコードの通し番号（なければ start - 1）"""
+        with self._lock:
+            return self._base + bisect.bisect_right(self._times, self._seconds(dt)) - 1
+
+    def index_of(self, record):
+        """record の通し番号（同じレコードがなければ record の時刻以前に開始した最後のレコード）"""
+        with self._lock:
+            seconds = self._seconds(record.time)
+            lo = bisect.bisect_left(self._times, seconds)
+            hi = bisect.bisect_right(self._times, seconds, lo)
+            for index in range(lo, hi):
+                if self._records[index] is record:
+                    return self._base + index
+            return self._base + hi - 1
+
+    def index_after(self, dt, start=0):
+        """start 以降で dt より後に開始する最初のレコードの通し番号（なければ -1）"""
+        with self._lock:
+            lo = max(0, start - self._base)
+            index = bisect.bisect_right(self._times, self._seconds(dt), lo)
+            return self._base + index if index < len(self._records) else -1
+
+class ScheduleCache:
+    """コンパイル済みスケジュール（YYMMDD.csv の隣の .YYMMDD.csv.cache）
+
+    検証・時刻解析・ソート済みのレコードをバイナリで保存する。CSV の
+    mtime とサイズが一致すれば CSV を読まずに読み込み、一致しない場合も
+    内容のハッシュが同じなら有効とみなす。放送日の終了時刻が変わると
+    時刻の解釈が変わるため、day_end_hour もキーに含める。
+    """
+    MAGIC = b'EAPSSCH1'
+    HEADER = struct.Struct('<8sBBiqqI20s')  # magic, version, day_end_hour, 基準日, mtime_ns, size, 件数, sha1
+    VERSION = 1
+
+    @staticmethod
+    def path_for(csv_path):
+        """CSV に対応するキャッシュファイルのパス"""
+        dirname, basename = os.path.split(csv_path)
+        return os.path.join(dirname, f".{basename}.cache")
+
+    @classmethod
+    def load(cls, csv_path, base_date, day_end_hour, csv_data=None):
+        """有効なキャッシュがあれば (時刻, source, mix, filename) のリストを返す
+
+        csv_data を渡すとハッシュによる照合も行う（mtime だけが変わった場合）。
+        """
+        try:
+            st = os.stat(csv_path)
+            with open(cls.path_for(csv_path), 'rb') as f:
+                data = f.read()
+            (magic, version, cached_hour, ordinal, mtime_ns, size,
+             count, digest) = cls.HEADER.unpack_from(data, 0)
+        except (OSError, struct.error):
+            return None
+        if (magic != cls.MAGIC or version != cls.VERSION or
+                cached_hour != day_end_hour or ordinal != base_date.toordinal()):
+            return None
+        if (mtime_ns, size) != (st.st_mtime_ns, st.st_size):
+            if csv_data is None or hashlib.sha1(csv_data).digest() != digest:
+                return None
+
+        base = datetime.combine(base_date, datetime.min.time())
+        records = []
+        offset = cls.HEADER.size
+        try:
+            for _ in range(count):
+                seconds, = struct.unpack_from('<i', data, offset)
+                offset += 4
+                fields = []
+                for _ in range(3):
+                    length, = struct.unpack_from('<H', data, offset)
+                    offset += 2
+                    fields.append(data[offset:offset + length].decode('utf-8'))
+                    offset += length
+                records.append((base + timedelta(seconds=seconds), fields[0], fields[1], fields[2]))
+        except (struct.error, UnicodeDecodeError):
+            return None
+        return records
+
+    @classmethod
+    def save(cls, csv_path, base_date, day_end_hour, records, csv_data, csv_stat):
+        """(時刻, source, mix, filename) のリストをキャッシュに書き込み"""
+        base = datetime.combine(base_date, datetime.min.time())
+        chunks = [cls.HEADER.pack(cls.MAGIC, cls.VERSION, day_end_hour, base_date.toordinal(),
+                                  csv_stat.st_mtime_ns, csv_stat.st_size, len(records),
+                                  hashlib.sha1(csv_data).digest())]
+        for scheduled_time, source, mix, filename in records:
+            chunks.append(struct.pack('<i', int((scheduled_time - base).total_seconds())))
+            for field in (source, mix, filename):
+                encoded = field.encode('utf-8')[:0xFFFF]
+                chunks.append(struct.pack('<H', len(encoded)))
+                chunks.append(encoded)
+        cache_path = cls.path_for(csv_path)
+        tmp_path = cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(chunks))
+            os.replace(tmp_path, cache_path)
+            return True
+        except OSError:
+            return False
+
+class ScheduleArchive:
+    """data/csv のすべての CSV のレコードを SQLite に索引化したスケジュールの記録
+
+    CSV ごとに mtime とサイズを記録し、sync() では追加・変更された CSV だけを
+    読み込み直す（削除された CSV のレコードも削除する）。CSV の解析は
+    スケジューラーの load_csv_records()（parse_time_for_date による日替わり
+    時刻の解釈とコンパイル済みキャッシュ）で行う。開始時刻は
+    'YYYY-MM-DDTHH:MM:SS' の文字列で保存し、開始時刻の索引で「ある時刻に
+    放送中だったレコード」を、ファイル名と開始時刻の索引で「あるファイルの
+    放送予定」を検索する。
+    """
+    SCHEMA_VERSION = 1
+    COLUMNS = "broadcast_date, start, source, mix, filename"
+
+    def __init__(self, path, csv_dir, day_end_hour, load_records, debug_mode=False):
+        self.path = path
+        self.csv_dir = csv_dir
+        self.day_end_hour = day_end_hour
+        self.load_records = load_records  # load_records(csv_path, 放送日) → ScheduleRecord のリスト
+        self.debug_mode = debug_mode
+        self._db = None
+        self._lock = threading.Lock()
+        self._executor = None   # 監視スレッドからの更新を順に反映するワーカー
+
+    def open(self):
+        """データベースを開く（スキーマ・日替わり時刻が違えば作り直す）"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        with db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                db.executescript(f"""
+                    DROP TABLE IF EXISTS files;
+                    DROP TABLE IF EXISTS records;
+                    CREATE TABLE files (name TEXT PRIMARY KEY, broadcast_date TEXT,
+                                        mtime_ns INTEGER, size INTEGER, day_end_hour INTEGER);
+                    CREATE TABLE records (file TEXT, broadcast_date TEXT, start TEXT,
+                                          source TEXT, mix TEXT, filename TEXT);
+                    CREATE INDEX records_start ON records (start);
+                    CREATE INDEX records_filename ON records (filename COLLATE NOCASE, start);
+                    CREATE INDEX records_file ON records (file);
+                    PRAGMA user_version = {self.SCHEMA_VERSION};
+                """)
+            # 日替わり時刻が変わると時刻の解釈が変わるため、すべて読み込み直す
+            db.execute("DELETE FROM files WHERE day_end_hour != ?", (self.day_end_hour,))
+        self._db = db
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='archive')
+        return self
+
+    def close(self):
+        """更新中の処理を待ってからデータベースを閉じる"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def sync(self):
+        """CSV の追加・変更・削除を反映し、(読み込んだ CSV 数, 削除した CSV 数) を返す"""
+        try:
+            names = [name for name in os.listdir(self.csv_dir)
+                     if MusicScheduler.CSV_NAME_PATTERN.match(name)]
+        except OSError:
+            names = []
+        with self._lock:
+            known = {row['name']: (row['mtime_ns'], row['size'])
+                     for row in self._db.execute("SELECT name, mtime_ns, size FROM files")}
+        updated = 0
+        for name in sorted(names):
+            try:
+                st = os.stat(os.path.join(self.csv_dir, name))
+            except OSError:
+                continue
+            if known.get(name) != (st.st_mtime_ns, st.st_size):
+                updated += self.update_file(name)
+        removed = set(known) - set(names)
+        for name in removed:
+            self.remove_file(name)
+        return updated, len(removed)
+
+    def submit_sync(self):
+        """sync() を専用のワーカーで実行"""
+        self._executor.submit(self._sync)
+
+    def submit(self, name):
+        """CSV の変更を専用のワーカーで反映（監視スレッドから呼ぶ）"""
+        self._executor.submit(self._refresh, name)
+
+    def _sync(self):
+        try:
+            start = time.perf_counter()
+            updated, removed = self.sync()
+            if updated or removed:
+                print(f"スケジュールの記録を更新しました: CSV {updated} 件を読み込み・{removed} 件を削除"
+                      f"（{time.perf_counter() - start:.2f}s）")
+        except Exception as e:
+            print(f"スケジュール記録の更新エラー: {e}")
+
+    def _refresh(self, name):
+        try:
+            if os.path.exists(os.path.join(self.csv_dir, name)):
+                self.update_file(name)
+            else:
+                self.remove_file(name)
+        except Exception as e:
+            print(f"スケジュール記録の更新エラー ({name}): {e}")
+
+    def update_file(self, name):
+        """CSV を1つ読み込んでレコードを置き換える（読み込めなければ 0）"""
+        match = MusicScheduler.CSV_NAME_PATTERN.match(name)
+        if not match:
+            return 0
+        try:
+            broadcast_date = datetime.strptime(match.group(1), '%y%m%d').date()
+            csv_path = os.path.join(self.csv_dir, name)
+            st = os.stat(csv_path)
+        except (ValueError, OSError):
+            return 0
+        records = self.load_records(csv_path, broadcast_date)
+        rows = [(name, broadcast_date.isoformat(), r.time.isoformat(), r.source, r.mix, r.filename)
+                for r in records]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM records WHERE file = ?", (name,))
+            self._db.executemany(
+                f"INSERT INTO records (file, {self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                             (name, broadcast_date.isoformat(), st.st_mtime_ns, st.st_size,
+                              self.day_end_hour))
+        if self.debug_mode:
+            print(f"[スケジュール記録] {name}: {len(rows)} レコード")
+        return 1
+
+    def remove_file(self, name):
+        """削除された CSV のレコードを削除"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM records WHERE file = ?", (name,))
+            self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+
+    def at(self, moment):
+        """moment に放送中だったレコード（dict。'until' は次のレコードの開始時刻）。なければ None"""
+        key = moment.isoformat(timespec='seconds')
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {self.COLUMNS} FROM records WHERE start <= ? "
+                "ORDER BY start DESC LIMIT 1", (key,)).fetchone()
+            if row is None:
+                return None
+            following = self._db.execute(
+                "SELECT start FROM records WHERE start > ? ORDER BY start LIMIT 1",
+                (row['start'],)).fetchone()
+        result = self._to_dict(row)
+        result['until'] = datetime.fromisoformat(following['start']) if following else None
+        return result
+
+    def find(self, filename, since, limit=10):
+        """filename のレコードのうち since 以降に開始するものを開始時刻順に返す"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self.COLUMNS} FROM records WHERE filename = ? COLLATE NOCASE "
+                "AND start >= ? ORDER BY start LIMIT ?",
+                (filename.strip(), since.isoformat(timespec='seconds'), limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        result = dict(row)
+        result['broadcast_date'] = datetime.strptime(row['broadcast_date'], '%Y-%m-%d').date()
+        result['start'] = datetime.fromisoformat(row['start'])
+        return result
+
+class StateFile:
+    """再生状態のスナップショット（再起動時に放送中の mpv を引き継ぐため）
+
+    save() は最新の状態を渡すだけで戻り、書き込みスレッドが一時ファイルに
+    書いて fsync してから os.replace で置き換え、ディレクトリも fsync する
+    （異常終了・電源断でも空や壊れたファイルは残らない）。書き込み前に次の
+    状態が保存された場合は最新のものだけを書く。
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = None
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def load(self):
+        """保存されている状態（dict）。なければ・読めなければ None"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != self.VERSION:
+            return None
+        return state
+
+    def save(self, state):
+        """状態を保存（書き込みは書き込みスレッドで行う）"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name='state-writer', daemon=True)
+                self._thread.start()
+            self._pending = dict(state, version=self.VERSION)
+            self._cond.notify()
+
+    def close(self, timeout=2.0):
+        """保存待ちの状態を書き込んでから終了"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                state, self._pending = self._pending, None
+            if state is None:
+                return
+            self._write(state)
+
+    def _write(self, state):
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._fsync_dir()
+        except OSError as e:
+            print(f"状態ファイル書き込みエラー: {e}")
+
+    def _fsync_dir(self):
+        """置き換え（rename）をディスクに反映"""
+        fd = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
-    def play_file(self, filepath, start_position=0):
-        """ファイルを再生（シーク付き）"""
-        self.stop()  # 前回の再生を停止
+class Transition:
+    """レコードの切り替え（JACK切替・再生開始・前の音源の停止）の各ステップを実行・計測するクラス
 
-        start_time = time.time()
+    run() のステップは呼び出しスレッドで実行し、submit() のステップは
+    指定したワーカーで並行して実行する。呼び出し側が finish() を呼び、
+    並行ステップもすべて完了した時点で report(transition) を呼び出す。
+    """
 
-        cmd = [
-            self.mpv_path,
-            "--no-video",          # 動画表示なし
-            "--no-terminal",       # ターミナル出力なし
-            "--really-quiet",      # 静かに実行
-            "--keep-open=no",      # 再生終了後に自動終了
-            "--ao=jack",           # JACK オーディオ出力
-            "--af=loudnorm=I=-18:TP=-2.0:LRA=11",
+    def __init__(self, label, report):
+        self.label = label
+        self.report = report
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.timings = []   # (ステップ名, 所要秒数)
+        self.errors = []
+        self._lock = threading.Lock()
+        self._pending = 1   # finish() 待ちの分
 
-        ]
+    def _measure(self, name, func, args):
+        step_start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.timings.append((name, time.monotonic() - step_start))
 
-        if start_position > 0:
-            cmd.append(f"--start={int(start_position)}")
-            if self.debug_mode:
-                print(f"[mpv実行] シーク位置: {int(start_position)}秒")
+    def run(self, name, func, *args):
+        """呼び出しスレッドでステップを実行"""
+        return self._measure(name, func, args)
 
-        cmd.append(filepath)
+    def submit(self, executor, name, func, *args):
+        """ワーカーでステップを並行して実行し、Future を返す"""
+        with self._lock:
+            self._pending += 1
+        future = executor.submit(self._run_background, name, func, args)
+        future.add_done_callback(self._step_done)
+        return future
 
+    def _run_background(self, name, func, args):
         try:
-            self.mpv_process = subprocess.Popen(cmd,
-                                               stdout=subprocess.DEVNULL,
-                                               stderr=subprocess.DEVNULL,
-                                               start_new_session=True)
-            exec_time = time.time() - start_time
-            if self.debug_mode:
-                print(f"[mpv実行時間] {exec_time:.3f}s")
-            return True
+            return self._measure(name, func, args)
         except Exception as e:
-            print(f"mpv再生エラー: {e}")
-            return False
+            self.errors.append(f"{name}: {e}")
 
-    def play_file_from_position(self, filepath, start_position):
-        """指定位置から再生"""
-        return self.play_file(filepath, start_position)
+    def finish(self):
+        """呼び出しスレッドのステップが終わったことを通知"""
+        self._step_done(None)
 
-    def stop(self):
-        """再生を停止"""
+    def _step_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self.elapsed = time.monotonic() - self.started
+            self.report(self)
+
+    def summary(self):
+        """各ステップと全体の所要時間（逐次実行した場合の合計との比較）"""
+        steps = ' / '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.timings)
+        serial = sum(seconds for _, seconds in self.timings)
+        return f"{steps}（全体 {self.elapsed * 1000:.1f}ms, 逐次なら {serial * 1000:.1f}ms）"
+
+class AsyncPlayoutEngine:
+    """MusicScheduler の再生ループを asyncio で実行するエンジン（[SCHEDULER] engine = asyncio）
+
+    開始時刻の待機・次のレコードの取得はイベントループ上のタスクで行い、
+    mpv 制御・CSV読み込みはそれぞれ専用のワーカースレッドでタイムアウト
+    付きで実行する。タイムアウトした処理はスレッドを止められないため、その
+    ワーカーを切り離し、同じ種類の以降の処理は新しいワーカーで実行する。
+    JACK 切替（MusicScheduler.routing_worker）と data/csv の監視は従来どおり
+    スレッドで行う。JACK 切替は切り替え処理が再生開始と並行して行うため、
+    遅い操作があっても開始時刻は遅れない。
+    """
+    PLAYER_TIMEOUT = 3.0    # mpv 操作（再生開始・プリロール）
+    SCHEDULE_TIMEOUT = 30.0 # CSV読み込み・再読み込み・破棄
+    RESOLVE_TIMEOUT = 2.0   # 開始時刻のメディアファイルの検索（間に合わなければダミーファイル）
+    WORKERS = ('player', 'schedule', 'resolve')  # ワーカーの種類（属性名は <種類>_executor）
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.loop = None
+        self.tasks = set()
+        self.abandoned = 0  # タイムアウトで切り離したワーカーの数
+        # 同じ種類の操作は順番に実行する（mpv は並行呼び出しに対応していない）
+        self.player_executor = self._executor('player')
+        self.schedule_executor = self._executor('schedule')
+        # メディアファイルの検索（索引の更新で NAS を走査しうる。CSV読み込みの後ろで待たせない）
+        self.resolve_executor = self._executor('resolve')
+
+    @staticmethod
+    def _executor(kind):
+        return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=kind)
+
+    def run(self):
+        """再生ループを実行（終了するまで戻らない）"""
         try:
-            if self.mpv_process is not None and self.mpv_process.poll() is None:
-                self.mpv_process.terminate()
-                try:
-                    self.mpv_process.wait(timeout=0.5)
-                except subprocess.TimeoutExpired:
-                    self.mpv_process.kill()
-                self.mpv_process = None
-                return True
+            asyncio.run(self._main())
+        finally:
+            self._shutdown_executors()
+
+    @classmethod
+    def run_all(cls, engines):
+        """複数の局のエンジンを1つのイベントループで実行（すべての局が終了するまで戻らない）"""
+        async def main():
+            results = await asyncio.gather(*(engine._main() for engine in engines),
+                                           return_exceptions=True)
+            for engine, result in zip(engines, results):
+                if isinstance(result, Exception):
+                    engine.scheduler._log(f"\n再生ループエラー: {result}")
+
+        try:
+            asyncio.run(main())
+        finally:
+            for engine in engines:
+                engine._shutdown_executors()
+
+    def _shutdown_executors(self):
+        for kind in self.WORKERS:
+            getattr(self, f"{kind}_executor").shutdown(wait=False)
+
+    def _abandon_executor(self, executor):
+        """タイムアウトした処理のワーカーを切り離し、新しいワーカーに置き換える（種類名を返す）
+
+        切り離したスレッドは実行中の処理（mpv の IPC などはそれぞれタイムアウト
+        付き）と既に積まれた処理を終えてから終了する。既に置き換え済みなら None。
+        """
+        for kind in self.WORKERS:
+            name = f"{kind}_executor"
+            if getattr(self, name) is executor:
+                setattr(self, name, self._executor(kind))
+                executor.shutdown(wait=False)
+                self.abandoned += 1
+                return kind
+        return None
+
+    async def _main(self):
+        s = self.scheduler
+        self.loop = asyncio.get_running_loop()
+
+        # タイマー・イベントをイベントループ用に置き換え、CSVの変更通知をループに転送
+        # （終了時に元に戻す）
+        originals = (s.timer, s.records_added, s._loader_wake, s.csv_watcher.callback)
+        s.timer = AsyncDeadlineTimer(self.loop, s.clock)
+        s.records_added = LoopEvent(self.loop)
+        s._loader_wake = LoopEvent(self.loop)
+        s.csv_watcher.callback = self._on_csv_changed
+        print("asyncio エンジンで実行します")
+
+        loader = self.spawn(self._loader())
+        try:
+            # 現在演奏中のファイルがある場合は再生開始
+            if s.current_record:
+                await self.call(self.player_executor, s.start_current_playback,
+                                timeout=self.PLAYER_TIMEOUT, label="再生開始")
+
+            last_broadcast_date = s.get_broadcast_date()
+            while True:
+                # 放送中の mpv が途中で終了していたら再起動・無音検出時の代替音源を再生
+                await self._check_player_exit()
+
+                # 日替わりチェック
+                current_broadcast_date = s.get_broadcast_date()
+                if current_broadcast_date != last_broadcast_date:
+                    print(f"\n【日替わり処理】 {last_broadcast_date.strftime('%Y-%m-%d')} → {current_broadcast_date.strftime('%Y-%m-%d')}")
+                    await self.call(self.schedule_executor, s.evict_played_records,
+                                    timeout=self.SCHEDULE_TIMEOUT, label="放送済みレコードの破棄")
+                    s._loader_wake.set()
+                    last_broadcast_date = current_broadcast_date
+
+                if not await self._wait_and_play_next():
+                    print()
+                    print("すべてのレコードの処理が完了しました（翌日分CSVなし）")
+                    break
+        finally:
+            loader.cancel()
+            for task in list(self.tasks):
+                task.cancel()
+            originals[0].wakeups += s.timer.wakeups
+            s.timer, s.records_added, s._loader_wake, s.csv_watcher.callback = originals
+
+    def spawn(self, coroutine):
+        """タスクを開始し、終了まで参照を保持"""
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def call(self, executor, func, *args, timeout, label):
+        """ブロッキング処理をワーカースレッドで実行（タイムアウト・例外はログに記録して None）"""
+        future = self.loop.run_in_executor(executor, func, *args)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            message = f"\n[タイムアウト] {label}が {timeout:.1f} 秒以内に完了しません"
+            if self._abandon_executor(executor) is not None:
+                message += "。このワーカーを切り離し、以降の処理は新しいワーカーで実行します"
+            self.scheduler._log(message)
         except Exception as e:
-            print(f"mpv停止エラー: {e}")
-        return False
+            self.scheduler._log(f"\n{label}エラー: {e}")
+        return None
 
-    def is_playing(self):
-        """再生中かどうかを確認"""
-        return self.mpv_process is not None and self.mpv_process.poll() is None
+    async def _check_player_exit(self):
+        """mpv の異常終了・無音検出の代替音源が記録されていれば処理（mpv 操作用のワーカーで実行）"""
+        if self.scheduler._player_exit is not None:
+            await self.call(self.player_executor, self.scheduler.check_player_exit,
+                            timeout=self.PLAYER_TIMEOUT, label="プレイヤー再起動")
+        if self.scheduler._pending_fallback is not None:
+            await self.call(self.player_executor, self.scheduler.check_dead_air_fallback,
+                            timeout=self.PLAYER_TIMEOUT, label="代替音源の再生")
 
-    def disconnect(self):
-        """クリーンアップ（停止）"""
-        self.stop()
+    async def _cancel_stale_preroll(self, next_record):
+        """次のレコードでなくなったプリロールを破棄（buffer モードのみ。mpv 操作用のワーカーで実行）"""
+        s = self.scheduler
+        if s.buffer_engine is not None and s.armed_record is not None and s.armed_record is not next_record:
+            await self.call(self.player_executor, s.cancel_stale_preroll, next_record,
+                            timeout=self.PLAYER_TIMEOUT, label="プリロールの取り消し")
+
+    def _on_csv_changed(self, name):
+        """data/csv の変更通知（監視スレッド）をイベントループに転送"""
+        self.loop.call_soon_threadsafe(self._schedule_csv_change, name)
+
+    def _schedule_csv_change(self, name):
+        self.spawn(self.call(self.schedule_executor, self.scheduler.on_csv_changed, name,
+                             timeout=self.SCHEDULE_TIMEOUT, label="CSV再読み込み"))
+
+    async def _loader(self):
+        """先読み範囲のCSVを読み込むタスク（1分ごと・日替わり時に確認）"""
+        s = self.scheduler
+        while True:
+            await self.call(self.schedule_executor, s.load_lookahead_days,
+                            timeout=self.SCHEDULE_TIMEOUT, label="CSV先読み")
+            await s._loader_wake.wait(60 / s.clock.speed)
+            s._loader_wake.clear()
+
+    async def _wait_and_play_next(self):
+        """次のレコードの時刻まで待機して再生（MusicScheduler.wait_and_play_next と同じ手順）"""
+        s = self.scheduler
+        s.records_added.clear()
+        next_record, _ = s.get_next_record_from_list()
+        await self._cancel_stale_preroll(next_record)
+
+        if not next_record:
+            # 先読み範囲のCSVが読み込まれるのを待機（演奏は継続）
+            print("\n次のレコードがありません。翌日分CSVの読み込み完了を待機中...")
+            s._loader_wake.set()
+            deadline = s.clock.monotonic() + s.schedule_end_wait
+            while not next_record:
+                remaining = deadline - s.clock.monotonic()
+                if remaining <= 0:
+                    print("翌日分CSVの読み込みが完了しませんでした。")
+                    return False
+                await s.records_added.wait(remaining / s.clock.speed)
+                s.records_added.clear()
+                await self._check_player_exit()
+                next_record, _ = s.get_next_record_from_list()
+            await self._cancel_stale_preroll(next_record)
+            print("翌日分CSVの読み込みが完了しました。放送を継続します。")
+
+        s.next_record = next_record
+        scheduled_time = next_record.time
+
+        if scheduled_time <= s.clock.now():
+            # 既に時刻が過ぎている場合はすぐに再生
+            await self._play_next_record()
+            return True
+
+        print()  # 改行
+        print(f"次の再生予定: {s.format_broadcast_time(scheduled_time)} - {next_record.filename}")
+        if s.display_enabled and not s.display_running:
+            s.start_display_thread()
+
+        # preroll_seconds 前まで待機して次の音源を準備（開始時刻までに終わらなければ待たない）
+        if s.preroll_seconds > 0:
+            preroll_time = scheduled_time - timedelta(seconds=s.preroll_seconds)
+            if not await s.timer.wait_until(preroll_time):
+                return True  # 起こされた：次のレコードを取得し直す
+            remain_seconds = (scheduled_time - s.clock.now()).total_seconds()
+            filepath = await self.call(self.resolve_executor, s.find_media_file, next_record.filename,
+                                       timeout=max(0.1, min(self.RESOLVE_TIMEOUT, remain_seconds - 0.1)),
+                                       label="メディアファイルの検索")
+            remain_seconds = (scheduled_time - s.clock.now()).total_seconds()
+            if filepath is not None and s.next_record is next_record:
+                await self.call(self.player_executor, s.arm_next_record, filepath,
+                                timeout=max(0.1, min(self.PLAYER_TIMEOUT, remain_seconds - 0.05)),
+                                label="プリロール")
+
+        # 開始時刻まで待機
+        if not await s.timer.wait_until(scheduled_time):
+            return True  # 起こされた：次のレコードを取得し直す
+
+        await self._play_next_record(timer_jitter=s.timer.last_jitter)
+        return True
+
+    async def _play_next_record(self, timer_jitter=None):
+        """次のレコードを再生し、CurrentとNextを更新"""
+        s = self.scheduler
+        record = s.next_record
+        if not record:
+            return
+        if s.armed_record is record:
+            filepath, armed = record.filepath, True  # プリロール済み（検索しない）
+        else:
+            # 索引の検索はイベントループを止めないようにワーカーで行う（他の局の開始を遅らせない）
+            resolved = await self.call(self.resolve_executor, s.resolve_next_record,
+                                       timeout=self.RESOLVE_TIMEOUT, label="メディアファイルの検索")
+            if resolved is None:
+                record.filepath = s.dummy_file
+                resolved = (s.dummy_file, False)
+            filepath, armed = resolved
+        s.current_start_time = s.clock.now()
+        await self.call(self.player_executor, s.start_next_record,
+                        record, filepath, armed, timer_jitter,
+                        timeout=self.PLAYER_TIMEOUT, label="再生開始")
+        s.advance_to_next()
 
 class MusicScheduler:
-    def __init__(self, day_end_hour=4, debug_mode=False):
+    CSV_NAME_PATTERN = re.compile(r'^(\d{6})\.csv$')  # YYMMDD.csv
+    PLAYER_RESTART_LIMIT = 3     # 1つのレコードで mpv を再起動する最大回数
+    PLAYER_END_TOLERANCE = 1.0   # 音源の終わりまでこの秒数以内の終了は正常終了とみなす
+
+    def __init__(self, day_end_hour=4, debug_mode=False, clock=None, base_dir=None, log_dir=None,
+                 station=None, shared=None):
         """
         day_end_hour: 放送日の終了時刻（1-5時で指定、デフォルト4時）
         例：4時設定の場合、3:59:59までが当日、4:00:00が翌日開始
         debug_mode: Trueの場合、デバッグログを画面に表示
+        clock: 時計（省略時は実時間。ベンチマークでは ScaledClock）
+        base_dir: data/ を置くディレクトリ（省略時は ~/easyaps）
+        log_dir: ログの保存先（省略時は device.conf の [LOG] dir）
+        station: マルチ局モードの局名（device.conf の [STATION:局名] を使用）
+        shared: マルチ局モードで共有する資源（StationGroup）
         """
-        home_dir = os.path.expanduser("~")
-        self.base_dir = os.path.join(home_dir, "easyaps")
+        self.station = station
+        self.shared = shared
+        self.clock = clock or (shared.clock if shared else SystemClock())
+        self.base_dir = (base_dir or (shared.base_dir if shared else None) or
+                         os.path.join(os.path.expanduser("~"), "easyaps"))
         self.csv_dir = os.path.join(self.base_dir, "data/csv")
         self.contents_dir = os.path.join(self.base_dir, "data/contents")
         self.dummy_file = os.path.join(self.contents_dir, "dummy.m4a")
@@ -118,60 +3638,491 @@ class MusicScheduler:
         self.current_start_time = None  # 現在の音源の実際の開始時刻
         self.display_running = False
         self.display_thread = None
+        self._display_stop = threading.Event()
+        self.timer = DeadlineTimer(self.clock)  # 次のイベントまでの待機
+        self.display_enabled = True  # 待機中に時間表示スレッドを使うか
         self.debug_mode = debug_mode  # デバッグモードフラグ
 
-        # mpvプレイヤー管理
-        self.player = mpvPlayer(mpv_path='/usr/bin/mpv', debug_mode=debug_mode)
+        # メディアファイル索引（run() 開始時に構築）
+        self.media_index = MediaIndex(self.contents_dir) if shared is None else None
 
         # 放送日の終了時刻（0-5時に変更）
         if not (0 <= day_end_hour <= 5):
             raise ValueError("day_end_hour は 0-5 の範囲で指定してください")
         self.day_end_hour = day_end_hour
 
-        # 日替わり処理用
-        self.all_records = []  # 全レコード（現在日+翌日）
-        self.current_record_index = 0  # 現在処理中のレコードインデックス
-        self.next_day_loaded = False  # 翌日分が読み込み済みかどうか
-        self.next_day_loading = False  # 翌日分読み込み中フラグ
-        self.preload_threshold = 10  # 残りレコード数がこの値以下になったら翌日分を読み込み
-        self.next_day_check_started = False  # 翌日分チェック開始フラグ
+        # 日替わり処理用（放送日から lookahead_days 日先までを保持し、放送済みは破棄）
+        self.all_records = ScheduleStore()  # 読み込み済みレコード（通し番号で参照）
+        self.current_record_index = 0  # 現在処理中のレコードの通し番号
+        self.loaded_dates = set()  # 読み込み済みの放送日
+        self.schedule_lock = threading.Lock()  # all_records / loaded_dates の更新用
+        self.schedule_end_wait = 600  # 次のレコードがない場合に先読みを待つ最大秒数
+        self.loader_thread = None
+        self.loader_running = False
+        self._loader_wake = threading.Event()  # 先読みスレッドを起こす
+        self.records_added = threading.Event()  # 先読みでレコードが追加された
+        self._missing_csv_reported = set()  # 未配置を通知済みの放送日
 
         # JACK制御の状態管理を追加
         self.previous_studio_mode = None
         self.jack_connection_active = False
 
-        # ログファイルの初期化
-        self.log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'process.log')
-        self.log_file = open(self.log_file_path, 'a', encoding='utf-8')
+        # device.conf からオーディオルーティング設定を読み込み
+        self._load_device_config()
+
+        # マルチ局モード：メディア索引・解析キャッシュ・JACK クライアント・計測値は全局で共有
+        if shared:
+            shared.share_resources(self)
+
+        # data/csv の監視（CSVの配置・更新を即座に検出）
+        self.csv_watcher = DirectoryWatcher(self.csv_dir, self.on_csv_changed)
+        self.csv_arrived = threading.Event()  # CSVが配置・更新された
+
+        # ログファイルの初期化（書き込みは専用スレッドで行う）
+        if log_dir:
+            self.log_dir = log_dir
+        self.log_file_path = os.path.join(self.log_dir, 'process.log')
+        self.log_writer = LogWriter(self.log_file_path, echo=True,
+                                    echo_prefix=f"[{station}] " if station else '', **self.log_options)
+        self.log_writer.start()
+        self.asrun_log = None
+        if self.asrun_enabled:
+            self.asrun_log = AsRunLog(os.path.join(self.log_dir, 'asrun.jsonl'), **self.log_options)
+            self.asrun_log.start()
         self._log(f"\n========== プログラム起動: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========")
 
-        # device.conf からオーディオルーティング設定を読み込み
+        # 放送タイミングの計測値（Prometheus 形式）
+        if shared is None:
+            self.metrics = Metrics({'station': self.metrics_station})
+        self.metric_start_delay = self.metrics.histogram(
+            'easyaps_start_delay_seconds', '予定時刻から実際の再生開始までの遅れ（秒）',
+            (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+        self.metric_timer_jitter = self.metrics.histogram(
+            'easyaps_timer_jitter_seconds', '開始時刻の待機の遅れ（秒）',
+            (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.05))
+        self.metric_resolve = self.metrics.histogram(
+            'easyaps_file_resolve_seconds', 'メディアファイルの検索時間（秒）',
+            (0.00001, 0.0001, 0.001, 0.01, 0.1, 1))
+        self.metric_jack_switch = self.metrics.histogram(
+            'easyaps_jack_switch_seconds', 'JACK接続モードの切替時間（秒）',
+            (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10))
+        self.metric_player_start = self.metrics.histogram(
+            'easyaps_player_start_seconds', 'mpv の再生開始（起動・IPC）にかかった時間（秒）',
+            (0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2))
+        self.metric_starts = self.metrics.counter(
+            'easyaps_starts_total', '再生を開始したレコードの数')
+        self.metric_last_start = self.metrics.gauge(
+            'easyaps_last_start_timestamp_seconds', '直近の再生開始時刻（UNIX時間）')
+        self.metric_output_rms = self.metrics.gauge(
+            'easyaps_output_rms_dbfs', '放送出力の RMS レベル（dBFS, [MONITOR] の測定間隔ごと）')
+        self.metric_output_peak = self.metrics.gauge(
+            'easyaps_output_peak_dbfs', '放送出力のピークレベル（dBFS, [MONITOR] の測定間隔ごと）')
+        self.metric_dead_air = self.metrics.gauge(
+            'easyaps_dead_air', '無音を検出中なら 1')
+        self.metric_dead_air_total = self.metrics.counter(
+            'easyaps_dead_air_total', '無音を検出した回数')
+        self.metric_player_restarts = self.metrics.counter(
+            'easyaps_player_restarts_total', '異常終了した mpv を再起動した回数')
+        self.metric_player_restart = self.metrics.histogram(
+            'easyaps_player_restart_seconds', 'mpv の異常終了の検出から再生再開までの時間（秒）',
+            (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5))
+        self.metric_media_cache = self.metrics.counter(
+            'easyaps_media_cache_lookups_total', '再生時のメディアキャッシュの検索回数（result: hit / miss）')
+
+        # 放送中の mpv の異常終了（監視スレッドが記録し、再生ループが再起動する）
+        self._player_exit = None
+        self._restart_record = None   # 再起動したレコード
+        self._restart_count = 0       # そのレコードで再起動した回数
+
+        # 放送出力のレベル監視（run() 開始時に JACK に接続）
+        self.level_monitor = None
+        self._quiet_since = None      # 無音が続いている場合、その開始時刻（monotonic）
+        self._dead_air_since = None   # 無音を検出中の場合、検出した時刻（monotonic）
+        self._pending_fallback = None # 無音検出時の代替音源（監視スレッドが記録し、再生ループが再生する）
+
+        # プレイヤー管理（player: 放送中, standby_player: プリロール用）
+        self.buffer_engine = None  # buffer モードの JACK 出力（run() 開始時に接続）
+        if self.player_mode == 'buffer' and not JackBufferEngine.available():
+            print("警告: buffer モードには JACK-Client・NumPy・ffmpeg が必要です。ipc を使用します。")
+            self.player_mode = 'ipc'
+        if self.player_mode == 'buffer':
+            self.buffer_engine = JackBufferEngine(
+                f"easyaps-player-{station}" if station else "easyaps-player",
+                (self.playback_l, self.playback_r), debug_mode=debug_mode)
+            self.player, self.standby_player = (
+                BufferPlayer(self.buffer_engine, debug_mode=debug_mode, handover=self.player_handover,
+                             preload=self.buffer_preload, max_ahead=self.buffer_ahead)
+                for _ in range(2))
+        else:
+            self.player, self.standby_player = self.create_mpv_players()
+        self.armed_record = None  # standby_player に読み込み済みのレコード
+
+        # 再生状態のスナップショット（再起動時に放送中の mpv を引き継ぐ）
+        self.state_file = None
+        if self.state_enabled:
+            name = f"easyaps-{station}.json" if station else "easyaps.json"
+            self.state_file = StateFile(self.state_path or os.path.join(self.base_dir, "data/state", name))
+        self._resumed = None  # 状態ファイルから引き継いだ・再開したレコード
+
+        # 全CSVのスケジュールの記録（start_station() で開き、CSV の変更に合わせて更新）
+        self.archive = None
+
+        if shared is None:
+            # JACK 接続制御（run() 開始時にプロセス内クライアントを開く）
+            self.jack = JackControl(backend=self.jack_backend, debug_mode=debug_mode)
+
+            # ラウドネス解析キャッシュ（解析済みの音源はリアルタイム loudnorm を使わない）
+            self.loudness = LoudnessAnalyzer(
+                os.path.join(self.base_dir, "data/cache/loudness.json"),
+                workers=self.loudness_workers, debug_mode=debug_mode)
+
+            # 音源の長さの測定キャッシュ（プリフライトチェック用）
+            self.durations = DurationProbe(
+                os.path.join(self.base_dir, "data/cache/durations.json"),
+                workers=self.preflight_workers, debug_mode=debug_mode)
+
+            # 途中からの再生用の FLAC キャッシュ（[SEEK_CACHE] enabled = true のときのみ）
+            self.seek_cache = None
+            if self.seek_cache_enabled:
+                self.seek_cache = SeekCache(
+                    self.seek_cache_dir or os.path.join(self.base_dir, "data/cache/seek"),
+                    debug_mode=debug_mode, **self.seek_cache_options)
+
+            # ネットワーク共有上の音源のローカルコピー（[MEDIA_CACHE] enabled = true のときのみ）
+            self.media_cache = None
+            if self.media_cache_enabled:
+                self.media_cache = MediaCache(
+                    self.media_cache_dir or os.path.join(self.base_dir, "data/cache/media"),
+                    debug_mode=debug_mode, **self.media_cache_options)
+        self._preflight_executor = None  # バックグラウンドのプリフライトチェック
+
+        # レコード切り替え時に再生開始と並行して実行する処理（種類ごとに順番に実行）
+        self.routing_worker = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='routing')
+        self.player_stop_worker = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='player-stop')
+        self.player_stopping = None  # 直近の音源停止の Future
+
+    @classmethod
+    def for_query(cls, day_end_hour=4, debug_mode=False, station=None):
+        """--at / --find 用のインスタンス（device.conf の読み込みのみ）
+
+        プレイヤー・JACK・CSV の監視・計測値は作らず、process.log にも書き込まない。
+        """
+        if not (0 <= day_end_hour <= 5):
+            raise ValueError("day_end_hour は 0-5 の範囲で指定してください")
+        self = cls.__new__(cls)
+        self.station = station
+        self.shared = None
+        self.clock = SystemClock()
+        self.base_dir = os.path.join(os.path.expanduser("~"), "easyaps")
+        self.csv_dir = os.path.join(self.base_dir, "data/csv")
+        self.contents_dir = os.path.join(self.base_dir, "data/contents")
+        self.day_end_hour = day_end_hour
+        self.debug_mode = debug_mode
+        self.log_writer = None  # ログは画面にのみ出力
+        self.asrun_log = None
         self._load_device_config()
+        return self
+
+    @classmethod
+    def for_preflight(cls, day_end_hour=4, debug_mode=False, station=None):
+        """--preflight 用のインスタンス（for_query に加えてメディア索引と音源の長さの測定のみ）"""
+        self = cls.for_query(day_end_hour=day_end_hour, debug_mode=debug_mode, station=station)
+        self.media_index = MediaIndex(self.contents_dir)
+        self.durations = DurationProbe(
+            os.path.join(self.base_dir, "data/cache/durations.json"),
+            workers=self.preflight_workers, debug_mode=debug_mode)
+        return self
+
+    def create_mpv_players(self):
+        """放送用・プリロール用の mpvPlayer を作成（IPC ソケット名に局名を含める）"""
+        socket_prefix = os.path.join(tempfile.gettempdir(), f"easyaps-mpv-{os.getuid()}")
+        if self.station:
+            socket_prefix += f"-{self.station}"
+        mode = self.player_mode if self.player_mode != 'buffer' else 'ipc'
+        # マルチ局モードでは JACK クライアント名も局ごとに分ける（出力先は route_player_outputs()）
+        jack_name = f"easyaps-{self.station}" if self.station else None
+        # 両方のプレイヤーの mpv に局ごとの目印を付ける（spawn モードの mpv も前回の分を停止できる）
+        tag = os.path.basename(socket_prefix)
+        players = (mpvPlayer(mpv_path='/usr/bin/mpv', debug_mode=self.debug_mode, mode=mode,
+                             ipc_socket=socket_prefix + ".sock", handover=self.player_handover,
+                             jack_name=jack_name, tag=tag),
+                   mpvPlayer(mpv_path='/usr/bin/mpv', debug_mode=self.debug_mode, mode=mode,
+                             ipc_socket=socket_prefix + "-standby.sock", handover=self.player_handover,
+                             jack_name=jack_name and jack_name + "-standby", tag=tag))
+        for player in players:
+            player.on_exit = self.on_player_exit
+        return players
+
+    def route_player_outputs(self):
+        """マルチ局モードで mpv の出力を局の playback_l / playback_r につなぐ
+
+        プロセス内の JACK クライアントがあれば mpv の自動接続を止め、ポートの
+        登録のたびに JackControl が接続する（buffer モードと同じ L/R の対応）。
+        なければ mpv の自動接続先を局のポートに限定する。
+        """
+        if not self.station:
+            return
+        if self.shared is None:
+            self.jack.open()  # 単独の局（--station）では mpv の起動前に接続しておく
+        destinations = (self.playback_l, self.playback_r)
+        for player in (self.player, self.standby_player):
+            if not isinstance(player, mpvPlayer) or not player.jack_name:
+                continue
+            routed = self.jack.route(player.jack_name, destinations)
+            player.jack_autoconnect = not routed
+            player.jack_ports = () if routed else destinations
+
+    def on_player_exit(self, player, load_id, returncode):
+        """mpv の終了・再生エラーの通知（監視・IPC 読み取りスレッド）：記録して再生ループを起こす"""
+        self._player_exit = (player, load_id, returncode, time.perf_counter())
+        self.timer.wake()
+        self.records_added.set()  # 次のレコードの先読みを待っている場合も起こす
+
+    def check_player_exit(self):
+        """放送中の mpv が途中で終了・再生エラーで停止していたら、現在の位置から再生し直す
+
+        再生ループから呼ぶ。ipc モードの常駐 mpv は再生エラーでも終了しないため、
+        IPC の end-file（reason=error）も同じ通知で扱う。
+        """
+        exit_info, self._player_exit = self._player_exit, None
+        if exit_info is None:
+            return False
+        player, load_id, returncode, detected = exit_info
+        # 既に次の音源に切り替わっている・待機用のプレイヤーだった場合は何もしない
+        if player is not self.player or player.load_id != load_id:
+            return False
+        record = self.current_record
+        if (record is None or self.is_studio_mode(record) or not record.filepath or
+                not self.is_audio_file(record.filepath)):
+            return False
+
+        position = (self.clock.now() - record.time).total_seconds()
+        duration = self.durations.duration(record.filepath)
+        if duration is not None and position >= duration - self.PLAYER_END_TOLERANCE:
+            return False  # 最後まで再生した
+        if player.mode == 'spawn' and returncode == 0 and duration is None:
+            return False  # 長さが不明のため、正常終了とみなす
+
+        if self._restart_record is not record:
+            self._restart_record = record
+            self._restart_count = 0
+        if self._restart_count >= self.PLAYER_RESTART_LIMIT:
+            if self._restart_count == self.PLAYER_RESTART_LIMIT:
+                self._log(f"\n[プレイヤー再起動] {self.PLAYER_RESTART_LIMIT} 回再起動しても終了するため、"
+                          f"次のレコードまで再起動しません: {record.filename}")
+                self._restart_count += 1
+            return False
+        self._restart_count += 1
+
+        cause = "再生エラーで停止しました" if returncode is None else f"終了しました（終了コード {returncode}）"
+        self._log(f"\n[プレイヤー再起動] mpv が{cause}。"
+                  f"{position:.1f} 秒の位置から再生します: {record.filename}")
+        self.play_audio_file(record.filepath, position)
+        latency = time.perf_counter() - detected
+        self.metric_player_restarts.inc()
+        self.metric_player_restart.observe(latency)
+        self.log_asrun(record, record.filepath, 'restart', start_position=position)
+        self.save_state()
+        self._log(f"[プレイヤー再起動] 検出から {latency * 1000:.1f}ms で再開しました"
+                  f"（このレコードで {self._restart_count} 回目）")
+        return True
+
+    def start_metrics_export(self):
+        """device.conf の [METRICS] に従って計測値の出力を開始"""
+        if self.metrics_textfile:
+            self.metrics.start_textfile(self.metrics_textfile, self.metrics_textfile_interval)
+            print(f"メトリクスを書き出します: {self.metrics_textfile}")
+        if self.metrics_http_port:
+            try:
+                self.metrics.start_http(self.metrics_http_address, self.metrics_http_port)
+                print(f"メトリクスを公開します: http://{self.metrics_http_address}:{self.metrics_http_port}/metrics")
+            except OSError as e:
+                print(f"メトリクスの HTTP サーバーを開始できません: {e}")
+
+    def save_state(self):
+        """現在の再生状態を状態ファイルに保存（切り替え・プリロール・再起動のたびに呼ぶ）"""
+        if self.state_file is None:
+            return
+        record = self.current_record
+        next_time = None
+        schedule = None
+        if record is not None:
+            next_index = self.current_record_index + 1
+            if next_index < self.all_records.end:
+                next_time = self.all_records[next_index].time.isoformat()
+            csv_path = self.get_csv_path_by_date(record.broadcast_date)
+            try:
+                st = os.stat(csv_path)
+                schedule = {'csv': csv_path, 'cache': ScheduleCache.path_for(csv_path),
+                            'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+            except OSError:
+                pass
+        players = []
+        for player in (self.player, self.standby_player):
+            process = getattr(player, 'mpv_process', None)
+            if process is None or process.poll() is not None:
+                continue
+            players.append({'socket': player.ipc_socket, 'mode': player.mode, 'pid': process.pid,
+                            'started': AdoptedProcess.start_time(process.pid),
+                            'on_air': player is self.player})
+        self.state_file.save({
+            'pid': os.getpid(),
+            'saved': self.clock.now().isoformat(),
+            'broadcast_date': record.broadcast_date.isoformat() if record else None,
+            'index': self.current_record_index,
+            'routing': 'studio' if self.is_studio_mode(record) else 'file',
+            'record': None if record is None else {
+                'time': record.time.isoformat(), 'filename': record.filename,
+                'filepath': record.filepath},
+            'next_time': next_time,
+            'schedule': schedule,
+            'players': players,
+        })
+
+    def resume_from_state(self):
+        """前回の状態ファイルをもとに放送中の mpv を引き継ぐ（スケジュールの読み込み前に呼ぶ）
+
+        状態ファイルに記録した PID と起動時刻が一致する mpv だけを対象にし、
+        他のプロセスには触れない。放送中だった mpv は IPC に接続してそのまま
+        引き継ぎ、待機用の mpv は停止させて引き継ぐ。引き継げない mpv は終了
+        させる。放送中の mpv を引き継げず、記録したレコードがまだ放送中なら
+        その位置から再生を再開する。状態ファイルにない・状態ファイルがない場合は、
+        この局の目印（--title）かソケットを使う mpv を停止する。
+        """
+        start = time.perf_counter()
+        state = self.state_file.load() if self.state_file is not None else None
+        if state is None:
+            if isinstance(self.player, mpvPlayer):
+                self._cleanup_previous_mpv()
+            return
 
-        # 前回実行時の残存 mpv プロセスを停止
-        self._cleanup_previous_mpv()
+        adopted = None
+        for entry in state.get('players', []):
+            process = AdoptedProcess(entry.get('pid'), entry.get('started'))
+            if process.poll() is not None:
+                continue
+            player = next((p for p in (self.player, self.standby_player)
+                           if isinstance(p, mpvPlayer) and p.ipc_socket == entry.get('socket')), None)
+            if (player is not None and player.mode == entry.get('mode') and
+                    player.mpv_process is None and player.adopt(process)):
+                if entry.get('on_air') and adopted is None:
+                    adopted = player
+                else:
+                    player.stop()  # プリロール中・引き継ぎ中だった音源
+                continue
+            mpvPlayer.reaper.release(process)
+            print(f"前回実行時の mpv (PID {process.pid}) を停止しました")
+        if isinstance(self.player, mpvPlayer):
+            # 状態ファイルに記録する前だった mpv（spawn モードの引き継ぎ中など）も停止
+            self._cleanup_previous_mpv(keep={p.mpv_process.pid for p in (self.player, self.standby_player)
+                                             if getattr(p, 'mpv_process', None) is not None})
+        if adopted is self.standby_player:
+            self.player, self.standby_player = self.standby_player, self.player
+
+        record = state.get('record')
+        if not record:
+            return
+        scheduled = datetime.fromisoformat(record['time'])
+        filepath = record.get('filepath')
+        if adopted is not None and (adopted.is_playing() or state.get('routing') == 'studio'):
+            self._resumed = {'key': (scheduled, record['filename']), 'filepath': filepath,
+                             'routing': state.get('routing'), 'event': 'adopt'}
+            self._log(f"[状態復元] 放送中の mpv (PID {adopted.mpv_process.pid}) を引き継ぎました: "
+                      f"{record['filename']}（{(time.perf_counter() - start) * 1000:.1f}ms）")
+            return
+
+        # 引き継げない場合：スケジュールが変わっておらず、まだ放送中ならその位置から再生
+        if not filepath or not self.is_audio_file(filepath) or not os.path.exists(filepath):
+            return
+        schedule = state.get('schedule') or {}
+        try:
+            st = os.stat(schedule.get('csv', ''))
+            if (st.st_mtime_ns, st.st_size) != (schedule.get('mtime_ns'), schedule.get('size')):
+                return
+        except OSError:
+            return
+        now = self.clock.now()
+        position = (now - scheduled).total_seconds()
+        duration = self.durations.duration(filepath)
+        next_time = state.get('next_time')
+        if (position < 0 or (next_time and now >= datetime.fromisoformat(next_time)) or
+                (duration is not None and position >= duration - self.PLAYER_END_TOLERANCE)):
+            return
+        self.play_audio_file(filepath, position)
+        self._resumed = {'key': (scheduled, record['filename']), 'filepath': filepath,
+                         'routing': state.get('routing'), 'event': 'resume'}
+        self._log(f"[状態復元] {record['filename']} を {position:.1f} 秒の位置から再開しました"
+                  f"（{(time.perf_counter() - start) * 1000:.1f}ms）")
+
+    def take_resumed(self, record):
+        """resume_from_state() で引き継いだ・再開したのが record なら True（再生処理を省略）"""
+        resumed, self._resumed = self._resumed, None
+        if resumed is None or record is None or resumed['key'] != (record.time, record.filename):
+            return False
+        record.filepath = resumed['filepath']
+        if (resumed['routing'] == 'studio') == self.is_studio_mode(record):
+            # JACK の接続は前回のまま残っている
+            self.previous_studio_mode = resumed['routing'] == 'studio'
+        self.routing_worker.submit(self.update_jack_mode, record)
+        elapsed_seconds = (self.clock.now() - record.time).total_seconds()
+        self.log_asrun(record, record.filepath or '', resumed['event'],
+                       start_position=max(0.0, elapsed_seconds))
+        return True
 
-    def _cleanup_previous_mpv(self):
-        """前回実行時に残された mpv プロセスを停止"""
+    def _cleanup_previous_mpv(self, keep=()):
+        """前回実行時に残された mpv プロセスを停止
+
+        他の局や他のアプリケーションの mpv を止めないよう、この局の目印
+        （--title）か IPC ソケットを使う mpv のみを対象にする。目印は spawn
+        モード・引き継ぎ中の mpv にも付いている。keep の PID（状態ファイルから
+        引き継いだ mpv）は停止しない。
+        """
+        socket_root = re.escape(os.path.splitext(self.player.ipc_socket)[0])
+        patterns = [socket_root + r"(-standby)?(-spawn[01])?\.sock"]
+        if self.player.tag:
+            patterns.append(r"--title=" + re.escape(self.player.tag) + r"( |$)")
         try:
-            result = subprocess.run(["pgrep", "-f", "mpv"],
+            result = subprocess.run(["pgrep", "-f", "|".join(f"({p})" for p in patterns)],
                                   capture_output=True,
                                   text=True)
-            if result.stdout.strip():
-                # mpv プロセスが存在する場合は停止
-                subprocess.run(["pkill", "-f", "mpv"],
-                             capture_output=True)
-                print("前回実行時の mpv プロセスを停止しました")
+            stopped = 0
+            for line in result.stdout.split():
+                pid = int(line)
+                if pid in keep or pid == os.getpid():
+                    continue
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    stopped += 1
+                except ProcessLookupError:
+                    pass
+            if stopped:
+                print(f"前回実行時の mpv プロセスを停止しました（{stopped} 件）")
         except Exception:
-            # pgrep/pkill コマンドが利用できない場合はスキップ
+            # pgrep コマンドが利用できない場合はスキップ
             pass
 
     def _log(self, message):
-        """ログをファイルに記録（標準出力にも出力）"""
-        print(message)
-        if self.log_file:
-            self.log_file.write(message + '\n')
-            self.log_file.flush()
+        """ログをファイルに記録（標準出力にも出力。どちらも書き込みスレッドで行う）"""
+        if self.log_writer:
+            self.log_writer.write(message)
+        else:
+            print(message)
+
+    def close_log(self):
+        """ログを閉じる（キューに残った分は書き込んでから閉じる）"""
+        if self.asrun_log:
+            self.asrun_log.close()
+            self.asrun_log = None
+        if self.log_writer:
+            self.log_writer.close()
+            self.log_writer = None
+
+    @staticmethod
+    def device_config_path():
+        """device.conf のパス（スクリプトと同じディレクトリ）"""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device.conf')
 
     def _load_device_config(self):
         """device.conf からオーディオルーティング設定を読み込む（なければデフォルト値を使用）"""
@@ -181,7 +4132,7 @@ class MusicScheduler:
             'playback_l': 'system:playback_1',
             'playback_r': 'system:playback_2',
         }
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device.conf')
+        config_path = self.device_config_path()
         config = configparser.ConfigParser()
 
         if os.path.exists(config_path):
@@ -202,6 +4153,119 @@ class MusicScheduler:
             self.capture_l, self.capture_r = defaults['capture_l'], defaults['capture_r']
             self.playback_l, self.playback_r = defaults['playback_l'], defaults['playback_r']
 
+        # [STATION:局名] セクション（マルチ局モード。ルーティング・CSVの場所を局ごとに上書き）
+        station_section = f"STATION:{self.station}" if self.station else None
+        if station_section:
+            for key in ('capture_l', 'capture_r', 'playback_l', 'playback_r'):
+                setattr(self, key, config.get(station_section, key, fallback=getattr(self, key)))
+            self.csv_dir = os.path.expanduser(config.get(
+                station_section, 'csv_dir',
+                fallback=os.path.join(self.base_dir, "data/csv", self.station)).strip())
+
+        # [PLAYER] セクション（省略時は常駐 mpv + IPC）
+        self.player_mode = config.get('PLAYER', 'mode', fallback='ipc').strip().lower()
+        if self.player_mode not in ('ipc', 'spawn', 'buffer'):
+            print(f"警告: [PLAYER] mode の値が不正です: {self.player_mode}。ipc を使用します。")
+            self.player_mode = 'ipc'
+        # make-before-break（次の音源の再生開始を確認してから前の音源を止める）と、その際のフェードアウト
+        self.player_handover = config.getboolean('PLAYER', 'handover', fallback=True)
+        self.handover_fade = max(0.0, config.getfloat('PLAYER', 'fade_ms', fallback=0) / 1000)
+        # buffer モード（プロセス内再生）の先読み秒数（開始前・再生中）
+        self.buffer_preload = max(0.1, config.getfloat('PLAYER', 'buffer_preload', fallback=1.0))
+        self.buffer_ahead = max(self.buffer_preload, config.getfloat('PLAYER', 'buffer_ahead', fallback=30.0))
+
+        # [SCHEDULER] セクション
+        self.preroll_seconds = config.getfloat('SCHEDULER', 'preroll_seconds', fallback=3.0)
+        self.lookahead_days = max(1, config.getint('SCHEDULER', 'lookahead_days', fallback=1))
+        # thread: 従来のスレッド方式, asyncio: 再生・JACK切替・CSV先読みを asyncio のタスクで実行
+        self.engine = config.get('SCHEDULER', 'engine', fallback='thread').strip().lower()
+        if self.engine not in ('thread', 'asyncio'):
+            print(f"警告: [SCHEDULER] engine の値が不正です: {self.engine}。thread を使用します。")
+            self.engine = 'thread'
+
+        # [LOUDNESS] セクション（gain: 固定ゲイン, linear: 測定値付き loudnorm, live: 常にリアルタイム）
+        self.loudness_mode = config.get('LOUDNESS', 'mode', fallback='gain').strip().lower()
+        if self.loudness_mode not in ('gain', 'linear', 'live'):
+            print(f"警告: [LOUDNESS] mode の値が不正です: {self.loudness_mode}。gain を使用します。")
+            self.loudness_mode = 'gain'
+        self.loudness_workers = config.getint('LOUDNESS', 'workers', fallback=2)
+
+        # [JACK] セクション（auto: JACK-Client があれば使用, client: 常に使用, cli: jack_connect 等）
+        self.jack_backend = config.get('JACK', 'backend', fallback='auto').strip().lower()
+        if self.jack_backend not in ('auto', 'client', 'cli'):
+            print(f"警告: [JACK] backend の値が不正です: {self.jack_backend}。auto を使用します。")
+            self.jack_backend = 'auto'
+
+        # [LOG] セクション（process.log と as-run ログ asrun.jsonl）
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.log_dir = os.path.expanduser(config.get('LOG', 'dir', fallback='').strip()) or script_dir
+        if station_section:
+            self.log_dir = os.path.expanduser(config.get(
+                station_section, 'log_dir', fallback=os.path.join(self.log_dir, self.station)).strip())
+        self.log_options = {
+            'max_bytes': int(config.getfloat('LOG', 'max_size_mb', fallback=10) * 1024 * 1024),
+            'backup_count': max(0, config.getint('LOG', 'backup_count', fallback=7)),
+            'daily': config.getboolean('LOG', 'rotate_daily', fallback=True),
+            'fsync_interval': config.getfloat('LOG', 'fsync_interval', fallback=5.0),
+        }
+        self.asrun_enabled = config.getboolean('LOG', 'asrun', fallback=True)
+
+        # [METRICS] セクション（Prometheus 形式の計測値。textfile・http_port とも省略時は出力しない）
+        self.metrics_station = config.get('METRICS', 'station', fallback='').strip() or socket.gethostname()
+        self.metrics_textfile = os.path.expanduser(config.get('METRICS', 'textfile', fallback='').strip())
+        self.metrics_textfile_interval = config.getfloat('METRICS', 'textfile_interval', fallback=15.0)
+        self.metrics_http_address = config.get('METRICS', 'http_address', fallback='127.0.0.1').strip()
+        self.metrics_http_port = config.getint('METRICS', 'http_port', fallback=0)
+
+        # [PREFLIGHT] セクション（CSV読み込み時に音源の欠落・重なり・空白を確認）
+        self.preflight_enabled = config.getboolean('PREFLIGHT', 'enabled', fallback=True)
+        self.preflight_workers = max(1, config.getint('PREFLIGHT', 'workers', fallback=4))
+
+        # [MONITOR] セクション（放送出力のレベル監視と無音検出。省略時は無効）
+        self.monitor_enabled = config.getboolean('MONITOR', 'enabled', fallback=False)
+        self.monitor_interval = max(0.05, config.getfloat('MONITOR', 'interval', fallback=0.5))
+        self.dead_air_threshold = config.getfloat('MONITOR', 'threshold_dbfs', fallback=-50.0)
+        self.dead_air_seconds = max(1.0, config.getfloat('MONITOR', 'dead_air_seconds', fallback=10.0))
+        self.dead_air_fallback = config.get('MONITOR', 'fallback', fallback='').strip()
+
+        # [STATE] セクション（再生状態のスナップショット。省略時は有効）
+        self.state_enabled = config.getboolean('STATE', 'enabled', fallback=True)
+        self.state_path = os.path.expanduser(config.get('STATE', 'file', fallback='').strip())
+        if station_section and self.state_path:
+            root, ext = os.path.splitext(self.state_path)
+            self.state_path = f"{root}-{self.station}{ext}"
+
+        # [MEDIA_CACHE] セクション（ネットワーク共有上の音源をローカルにコピーして再生。省略時は無効）
+        self.media_cache_enabled = config.getboolean('MEDIA_CACHE', 'enabled', fallback=False)
+        self.media_cache_dir = os.path.expanduser(config.get('MEDIA_CACHE', 'dir', fallback='').strip())
+        self.media_cache_options = {
+            'max_bytes': int(config.getfloat('MEDIA_CACHE', 'max_size_mb', fallback=10240) * 1024 * 1024),
+            'workers': max(1, config.getint('MEDIA_CACHE', 'workers', fallback=2)),
+        }
+        self.media_prefetch = max(1, config.getint('MEDIA_CACHE', 'prefetch', fallback=5))
+
+        # [ARCHIVE] セクション（全CSVのレコードを SQLite に索引化。省略時は有効）
+        self.archive_enabled = config.getboolean('ARCHIVE', 'enabled', fallback=True)
+        self.archive_path = os.path.expanduser(config.get('ARCHIVE', 'file', fallback='').strip())
+        if station_section and self.archive_path:
+            root, ext = os.path.splitext(self.archive_path)
+            self.archive_path = f"{root}-{self.station}{ext}"
+        if not self.archive_path:
+            name = f"schedule-{self.station}.sqlite3" if self.station else "schedule.sqlite3"
+            self.archive_path = os.path.join(self.base_dir, "data/cache", name)
+
+        # [SEEK_CACHE] セクション（途中から再生する音源を FLAC に変換して保存。省略時は無効）
+        self.seek_cache_enabled = config.getboolean('SEEK_CACHE', 'enabled', fallback=False)
+        self.seek_cache_dir = os.path.expanduser(config.get('SEEK_CACHE', 'dir', fallback='').strip())
+        self.seek_cache_options = {
+            'max_bytes': int(config.getfloat('SEEK_CACHE', 'max_size_mb', fallback=2048) * 1024 * 1024),
+            'extensions': tuple('.' + e.strip().lstrip('.') for e in
+                                config.get('SEEK_CACHE', 'extensions', fallback='m4a, mp3, aac').split(',')
+                                if e.strip()),
+            'min_bytes': int(config.getfloat('SEEK_CACHE', 'min_size_mb', fallback=20) * 1024 * 1024),
+            'workers': max(1, config.getint('SEEK_CACHE', 'workers', fallback=1)),
+        }
+
     def format_time_display(self, seconds):
         """秒数を MM:SS 形式にフォーマット"""
         if seconds < 0:
@@ -225,7 +4289,7 @@ class MusicScheduler:
     def get_broadcast_date(self, target_time=None):
         """放送日付を取得（日替わり時刻を考慮）"""
         if target_time is None:
-            target_time = datetime.now()
+            target_time = self.clock.now()
         
         # 日替わり時刻より前なら前日の放送日
         if target_time.hour < self.day_end_hour:
@@ -236,41 +4300,9 @@ class MusicScheduler:
         return broadcast_date
     
     def check_jack_connections(self):
-        """修正版：JACKの接続状態をチェック"""
-        try:
-            result = subprocess.run(["jack_lsp", "-c"], 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=3)
-            if result.returncode == 0:
-                output = result.stdout
-                lines = output.split('\n')
-                
-                capture1_to_playback1 = False
-                capture2_to_playback2 = False
-                
-                current_port = None
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # 出力ポートの行（インデントなし）
-                    if not line.startswith(' ') and not line.startswith('\t'):
-                        current_port = line
-                    else:
-                        # 接続先の行（インデント有り）
-                        connected_to = line
-                        if current_port == self.capture_l and connected_to == self.playback_l:
-                            capture1_to_playback1 = True
-                        elif current_port == self.capture_r and connected_to == self.playback_r:
-                            capture2_to_playback2 = True
-                
-                is_connected = capture1_to_playback1 and capture2_to_playback2
-                return is_connected
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
-            pass
-        return False
+        """JACKのスタジオ接続（capture → playback）が確立しているかチェック"""
+        return self.jack.all_connected([(self.capture_l, self.playback_l),
+                                        (self.capture_r, self.playback_r)])
     
     def connect_jack_studio(self):
         """JACKでスタジオ接続を確立（シンプル版）"""
@@ -278,12 +4310,10 @@ class MusicScheduler:
             print("\nスタジオモード: JACK接続を確立中...")
 
             # 接続1: capture_l -> playback_l
-            subprocess.run(["jack_connect", self.capture_l, self.playback_l],
-                         capture_output=True, text=True, timeout=5)
+            self.jack.connect(self.capture_l, self.playback_l)
 
             # 接続2: capture_r -> playback_r
-            subprocess.run(["jack_connect", self.capture_r, self.playback_r],
-                         capture_output=True, text=True, timeout=5)
+            self.jack.connect(self.capture_r, self.playback_r)
             
             print("JACK接続確立完了")
             self.jack_connection_active = True
@@ -299,12 +4329,10 @@ class MusicScheduler:
             print("\nJACK接続を切断中...")
 
             # 切断1: capture_l -> playback_l
-            subprocess.run(["jack_disconnect", self.capture_l, self.playback_l],
-                         capture_output=True, text=True, timeout=5)
+            self.jack.disconnect(self.capture_l, self.playback_l)
 
             # 切断2: capture_r -> playback_r
-            subprocess.run(["jack_disconnect", self.capture_r, self.playback_r],
-                         capture_output=True, text=True, timeout=5)
+            self.jack.disconnect(self.capture_r, self.playback_r)
             
             print("JACK接続切断完了")
             self.jack_connection_active = False
@@ -318,15 +4346,15 @@ class MusicScheduler:
         """レコードがスタジオモードかどうかチェック"""
         if not record:
             return False
-        filename = record.get('filename', '').strip().upper()
-        source = record.get('source', '').strip().upper()
+        filename = record.filename.strip().upper()
+        source = record.source.strip().upper()
         is_st = filename == 'ST' or source == 'ST'
         return is_st
     
     def handle_jack_mode_change(self, current_record):
         """JACK接続モードの変更を処理（シンプル版）"""
         current_studio_mode = self.is_studio_mode(current_record)
-        filename = current_record.get('filename', '') if current_record else 'None'
+        filename = current_record.filename if current_record else 'None'
         
         # STモードの場合
         if current_studio_mode:
@@ -342,18 +4370,107 @@ class MusicScheduler:
         
         # 前回の状態を更新
         self.previous_studio_mode = current_studio_mode
+
+    def update_jack_mode(self, record):
+        """レコードに合わせてJACK接続モードを切り替え（モード変更時のみ実行）"""
+        studio_mode = self.is_studio_mode(record)
+        if studio_mode != self.previous_studio_mode:
+            switch_start = time.perf_counter()
+            self.handle_jack_mode_change(record)
+            self.metric_jack_switch.observe(time.perf_counter() - switch_start,
+                                            to='studio' if studio_mode else 'file')
     
+    def start_level_monitor(self):
+        """device.conf の [MONITOR] に従って放送出力のレベル監視を開始"""
+        if not self.monitor_enabled:
+            return
+        if not LevelMonitor.available():
+            print("警告: レベル監視には JACK-Client と NumPy が必要です。監視を行いません。")
+            return
+        monitor = LevelMonitor(
+            f"easyaps-monitor-{self.station}" if self.station else "easyaps-monitor",
+            (self.playback_l, self.playback_r), self.on_output_level,
+            interval=self.monitor_interval, debug_mode=self.debug_mode)
+        if monitor.open():
+            self.level_monitor = monitor
+
+    def dead_air_expected(self):
+        """無音でよいレコードを放送中かどうか（スタジオ・無音（SLT）・レコードなし）"""
+        record = self.current_record
+        if record is None or self.is_studio_mode(record):
+            return True
+        return record.filepath is not None and not self.is_audio_file(record.filepath)
+
+    def on_output_level(self, rms_db, peak_db):
+        """放送出力のレベル（監視スレッド）：計測値を更新し、無音の継続を検出"""
+        for channel, rms, peak in zip(('L', 'R'), rms_db, peak_db):
+            self.metric_output_rms.set(round(rms, 1), channel=channel)
+            self.metric_output_peak.set(round(peak, 1), channel=channel)
+
+        now = self.clock.monotonic()
+        if max(rms_db) >= self.dead_air_threshold or self.dead_air_expected():
+            if self._dead_air_since is not None:
+                self._log(f"\n[無音復帰] 放送出力が戻りました（無音 {now - self._quiet_since:.1f} 秒）")
+                self.metric_dead_air.set(0)
+            self._quiet_since = None
+            self._dead_air_since = None
+            return
+
+        if self._quiet_since is None:
+            self._quiet_since = now
+        if self._dead_air_since is None and now - self._quiet_since >= self.dead_air_seconds:
+            self._dead_air_since = now
+            self.on_dead_air(max(rms_db))
+
+    def on_dead_air(self, level_db):
+        """無音を検出：ログ・as-run ログに記録し、設定があれば代替音源を再生"""
+        record = self.current_record
+        filepath = record.filepath if record else None
+        name = record.filename if record else '-'
+        self._log(f"\n[無音検出] 放送出力が {self.dead_air_seconds:.0f} 秒以上 {self.dead_air_threshold:.0f} dBFS を"
+                  f"下回っています（{level_db:.1f} dBFS）: {name}")
+        self.metric_dead_air.set(1)
+        self.metric_dead_air_total.inc()
+        if record is not None:
+            self.log_asrun(record, filepath or '', event='dead_air')
+        if not self.dead_air_fallback:
+            return
+        fallback = self.media_index.lookup(self.dead_air_fallback)
+        if not fallback:
+            self._log(f"[無音検出] 代替音源が見つかりません: {self.dead_air_fallback}")
+            return
+        # プレイヤーは切り替えと同じ再生ループで操作する（mpv の終了時の再起動と同じ）
+        self._pending_fallback = (record, fallback)
+        self.timer.wake()
+        self.records_added.set()  # 次のレコードの先読みを待っている場合も起こす
+
+    def check_dead_air_fallback(self):
+        """無音検出で記録した代替音源を再生（再生ループから呼ぶ）"""
+        pending, self._pending_fallback = self._pending_fallback, None
+        if pending is None:
+            return False
+        record, fallback = pending
+        # 既に次のレコードに切り替わった・無音から復帰した場合は再生しない
+        if record is not self.current_record or self._dead_air_since is None:
+            return False
+        self._log(f"[無音検出] 代替音源を再生します: {fallback}")
+        self.play_audio_file(fallback)
+        return True
+
     def display_status(self):
         """時間情報を連続表示するスレッド"""
         while self.display_running:
             try:
-                time.sleep(0.1)  # 0.1秒ごとに更新
-                current_time = datetime.now()
+                # 秒が切り替わる時刻に合わせて1秒ごとに更新
+                self._display_stop.wait(1.0 - datetime.now().microsecond / 1000000)
+                if not self.display_running:
+                    break
+                current_time = self.clock.now()
                 time_str = current_time.strftime('%H:%M:%S')
 
                 # 次のイベントまでの残り時間を計算
                 if self.next_record:
-                    next_start = self.next_record['time']
+                    next_start = self.next_record.time
                     remain_seconds = (next_start - current_time).total_seconds()
 
                     if remain_seconds > 0:
@@ -373,7 +4490,7 @@ class MusicScheduler:
                         label = "\033[41m\033[97m生放送中\033[0m"
                     else:
                         # ファイル名を表示（緑色）
-                        filename = self.current_record.get('filename', '？')
+                        filename = self.current_record.filename or '？'
                         label = f"\033[92m{filename}\033[0m"
                     status_line = f"[{label}] {time_str} {remain_str}"
                 else:
@@ -384,18 +4501,20 @@ class MusicScheduler:
 
             except Exception as e:
                 # エラーが発生してもスレッドを継続
-                time.sleep(0.1)
+                time.sleep(1)
     
     def start_display_thread(self):
         """時間表示スレッドを開始"""
         if not self.display_running:
             self.display_running = True
+            self._display_stop.clear()
             self.display_thread = threading.Thread(target=self.display_status, daemon=True)
             self.display_thread.start()
     
     def stop_display_thread(self):
         """時間表示スレッドを停止"""
         self.display_running = False
+        self._display_stop.set()
         if self.display_thread:
             self.display_thread.join(timeout=2)
         print()  # 改行
@@ -417,7 +4536,7 @@ class MusicScheduler:
         return self.get_csv_path_by_date(next_day)
     
     def find_media_file(self, filename):
-        """findコマンドを使ってメディアファイルのフルパスを取得（統一版・Linux/Windows対応）"""
+        """メディア索引からメディアファイルのフルパスを取得（大文字小文字無視）"""
         # SLTまたは空欄の場合は特別処理
         if filename.upper() == 'SLT' or filename.strip() == '':
             return 'SILENCE'  # 無音を示す特別な値を返す
@@ -426,31 +4545,243 @@ class MusicScheduler:
         if filename.upper() == 'ST':
             return 'STUDIO'  # スタジオモードを示す特別な値を返す
         
-        try:
-            # -inameで大文字小文字無視の一括検索（Linux/Windows対応）
-            result = subprocess.run(
-                ["find", "-L", self.contents_dir, "-iname", f"{filename}.*", "-type", "f"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            
-            if result.stdout.strip():
-                # 対応拡張子のファイルを探す
-                for line in result.stdout.strip().split('\n'):
-                    if line.lower().endswith(('.mp3', '.m4a')):
-                        #print(f"\nファイルが見つかりました: {line}")
-                        return line
-                        
-        except subprocess.CalledProcessError as e:
-            print(f"\nfindコマンドエラー ({filename}): {e}")
+        resolve_start = time.perf_counter()
+        filepath = self.media_index.lookup(filename, exists=self.media_exists)
+        self.metric_resolve.observe(time.perf_counter() - resolve_start,
+                                    result='found' if filepath else 'missing')
+        if filepath:
+            return filepath
         
         # どの拡張子でも見つからない場合はダミーファイルのパスを返す
-        #print(f"\nファイルが見つかりません: {filename} (拡張子: mp3, m4a)")
-        print(f"\nファイルが見つかりません: {os.path.join(self.contents_dir, filename)}.mp3/.m4a")
-        print(f"ダミーファイルで代替: {self.dummy_file}")
+        self._log(f"\nファイルが見つかりません: {os.path.join(self.contents_dir, filename)}.mp3/.m4a")
+        self._log(f"ダミーファイルで代替: {self.dummy_file}")
         return self.dummy_file
     
+    def is_audio_file(self, filepath):
+        """filepath が mpv で再生する音源かどうか（無音・スタジオ・ダミー欠落を除く）"""
+        if (filepath in ('SILENCE', 'STUDIO') or
+            filepath.strip() == '' or
+            os.path.basename(filepath).strip() == '' or
+            os.path.basename(filepath).upper().startswith('SLT') or
+            os.path.basename(filepath).upper() == 'ST'):
+            return False
+        if filepath == self.dummy_file and not os.path.exists(filepath):
+            return False
+        return True
+
+    def audio_filter_for(self, filepath):
+        """音源に適用するオーディオフィルタ（未解析ならリアルタイム loudnorm）"""
+        # メディアキャッシュにコピー済みなら、解析結果を元の音源のサイズ・mtime で確認しない
+        trusted = self.media_cache is not None and self.media_cache.has(filepath)
+        return self.loudness.audio_filter(filepath, self.loudness_mode, trusted=trusted)
+
+    def is_media_record(self, record):
+        """音源ファイルを指定したレコードかどうか（空欄・ST・SLT を除く）"""
+        filename = record.filename.strip()
+        return bool(filename) and filename.upper() not in ('ST', 'SLT')
+
+    def media_filepaths(self, records):
+        """レコードの音源のパスを重複なしで返す（時刻順, 見つからない音源は除く）"""
+        filepaths = []
+        seen = set()
+        for record in sorted(records, key=lambda x: x.time):
+            if not self.is_media_record(record):
+                continue
+            filepath = self.media_index.lookup(record.filename.strip())
+            if filepath and filepath not in seen:
+                seen.add(filepath)
+                filepaths.append(filepath)
+        return filepaths
+
+    def request_loudness_analysis(self, records):
+        """レコードの音源をラウドネス解析キューに投入（時刻順）"""
+        if self.loudness_mode == 'live' or not self.loudness.available:
+            return
+        count = len(self.loudness.submit(self.media_filepaths(records)))
+        if count:
+            self._log(f"\nラウドネス解析を開始します: {count} ファイル")
+
+    def request_seek_cache(self, records):
+        """レコードの音源をシークキャッシュの変換キューに投入（時刻順）"""
+        if self.seek_cache is None or not self.seek_cache.available:
+            return
+        count = len(self.seek_cache.submit(self.media_filepaths(records)))
+        if count:
+            self._log(f"\nシークキャッシュの変換を開始します: {count} ファイル")
+
+    def seekable_path(self, filepath, start_position):
+        """再生に使うパス（途中から再生する場合はシークキャッシュの FLAC、
+        メディアキャッシュにコピー済みならローカルのコピー、それ以外は元の音源）"""
+        if start_position and self.seek_cache is not None:
+            cached = self.seek_cache.lookup(filepath)
+            if cached is not None:
+                if self.debug_mode:
+                    self._log(f"[シークキャッシュ] {os.path.basename(filepath)} → {cached}")
+                return cached
+        if self.media_cache is None:
+            return filepath
+        local = self.media_cache.lookup(filepath)
+        self.metric_media_cache.inc(result='hit' if local else 'miss')
+        if local is None:
+            self._log(f"[メディアキャッシュ] コピーがないため元の音源を再生します: {filepath}")
+            return filepath
+        if self.debug_mode:
+            self._log(f"[メディアキャッシュ] {os.path.basename(filepath)} → {local}")
+        return local
+
+    def request_media_prefetch(self):
+        """放送中と次の media_prefetch 件のレコードの音源をメディアキャッシュに先読み"""
+        if self.media_cache is None:
+            return
+        if self.current_record:
+            start = self.current_record_index
+        else:
+            start = self.all_records.index_at(self.clock.now()) + 1
+        records = []
+        for index in range(max(start, self.all_records.start),
+                           min(start + 1 + self.media_prefetch, self.all_records.end)):
+            try:
+                records.append(self.all_records[index])
+            except IndexError:
+                continue
+        # 索引の検索も NAS にアクセスしうるため、先読み用のスレッドで行う
+        self.media_cache.prefetch(lambda: self.media_filepaths(records), owner=self.station)
+
+    def media_exists(self, filepath):
+        """音源があるかどうか（メディアキャッシュにコピー済みなら元の音源は確認しない）"""
+        if self.media_cache is not None and self.media_cache.has(filepath):
+            return True
+        return os.path.isfile(filepath)
+
+    def arm_next_record(self, filepath=None):
+        """次のレコードを一時停止状態で standby_player に読み込む（プリロール）
+
+        filepath: 検索済みの音源（省略時はここで検索する）
+        """
+        record = self.next_record
+        if not record or self.armed_record is record:
+            return False
+        if filepath is None:
+            filepath = self.find_media_file(record.filename)
+        record.filepath = filepath
+        if not self.is_audio_file(filepath):
+            return False
+
+        # 切り替え時に並行して実行した standby_player の停止が終わるのを待つ
+        if self.player_stopping is not None:
+            concurrent.futures.wait([self.player_stopping], timeout=2.0 + self.handover_fade)
+
+        # 既に開始時刻を過ぎている場合はその位置まで事前にシーク
+        remain_seconds = (record.time - self.clock.now()).total_seconds()
+        start_position = max(0.0, -remain_seconds)
+        timeout = min(2.0, max(0.1, remain_seconds - 0.2))
+        # buffer モードでは開始時刻を JACK のフレームで予約する（タイマーの遅れの影響を受けない）
+        start_at = None
+        if self.buffer_engine is not None and remain_seconds > 0:
+            start_at = time.monotonic() + remain_seconds / self.clock.speed
+        if self.standby_player.arm(self.seekable_path(filepath, start_position), start_position,
+                                   timeout=timeout, audio_filter=self.audio_filter_for(filepath),
+                                   start_at=start_at):
+            self.armed_record = record
+            if self.buffer_engine is not None and self.next_record is not record:
+                # 読み込み中に次のレコードが変わった（予約した開始を取り消す）
+                self.cancel_stale_preroll(self.next_record)
+                return False
+            self.save_state()
+            if self.debug_mode:
+                self._log(f"[プリロール] {self.format_broadcast_time(record.time)} - {filepath}")
+            return True
+        return False
+
+    def cancel_stale_preroll(self, next_record):
+        """プリロールしたレコードが次のレコードでなくなったら破棄（buffer モード）
+
+        buffer モードではプリロール時に開始フレームを予約するため、取り消さないと
+        予定時刻に再生が始まってしまう。mpv は一時停止のままなので従来どおり
+        切り替え時に破棄する。
+        """
+        record = self.armed_record
+        if record is None or record is next_record or self.buffer_engine is None:
+            return
+        self.armed_record = None
+        self.standby_player.cancel_armed()
+        if self.debug_mode:
+            self._log(f"[プリロール] 取り消し: {self.format_broadcast_time(record.time)} - {record.filename}")
+
+    def start_armed_playback(self, filepath):
+        """プリロール済みの standby_player を再生開始し、放送中のプレイヤーと入れ替える
+
+        入れ替え前に放送中だったプレイヤーを返す（停止は呼び出し側で行う）。
+        """
+        self.armed_record = None
+        start = time.perf_counter()
+        if not self.standby_player.start_armed():
+            self.play_audio_file(filepath)
+            return None
+        self.metric_player_start.observe(time.perf_counter() - start, method='preroll')
+        self.player, self.standby_player = self.standby_player, self.player
+        self._log(f"\n再生開始: {filepath} (プリロール)")
+        return self.standby_player
+
+    def can_hand_over(self):
+        """standby_player で次の音源を開始して放送中の mpv から引き継げるか
+
+        プリロールしない切り替え・途中からの再生でも make-before-break にする。
+        standby_player が前の引き継ぎで停止中の場合は放送中の mpv で読み込む。
+        """
+        if not self.player_handover or not isinstance(self.player, mpvPlayer):
+            return False
+        if self.player_stopping is not None and not self.player_stopping.done():
+            return False
+        return self.player.is_playing()
+
+    def log_start_error(self, record, timer_jitter=None):
+        """予定時刻と実際の開始時刻の差をログに記録（timer_jitter: タイマー単体の遅れ）"""
+        error_ms = (self.clock.now() - record.time).total_seconds() * 1000
+        message = f"[開始誤差] {self.format_broadcast_time(record.time)} - {record.filename}: {error_ms:+.1f}ms"
+        if timer_jitter is not None:
+            message += f" (タイマー {timer_jitter * 1000:+.1f}ms)"
+        self._log(message)
+
+    def record_start_metrics(self, record, filepath, timer_jitter=None):
+        """再生開始の遅れなどを計測値に記録"""
+        mode = self.playout_mode(record, filepath)
+        self.metric_start_delay.observe((self.clock.now() - record.time).total_seconds(), mode=mode)
+        if timer_jitter is not None:
+            self.metric_timer_jitter.observe(timer_jitter)
+        self.metric_starts.inc(mode=mode)
+        self.metric_last_start.set(time.time())
+
+    def playout_mode(self, record, filepath):
+        """as-run ログに記録する再生方式（file / studio / silence / dummy）"""
+        if self.is_studio_mode(record):
+            return 'studio'
+        if not self.is_audio_file(filepath):
+            return 'silence'
+        if filepath == self.dummy_file:
+            return 'dummy'
+        return 'file'
+
+    def log_asrun(self, record, filepath, event='start', start_position=None,
+                  preroll=False, timer_jitter=None):
+        """as-run ログに1件記録（呼び出し時刻を実際の開始時刻とする。整形は書き込みスレッドで行う）"""
+        if self.asrun_log is None:
+            return
+        actual = self.clock.now()
+        self.asrun_log.write({
+            'event': event,
+            'broadcast_date': record.broadcast_date,
+            'scheduled': record.time,
+            'actual': actual,
+            'error_ms': round((actual - record.time).total_seconds() * 1000, 1),
+            'timer_jitter_ms': None if timer_jitter is None else round(timer_jitter * 1000, 1),
+            'filename': record.filename,
+            'file': filepath,
+            'mode': self.playout_mode(record, filepath),
+            'preroll': preroll,
+            'position': start_position,
+        })
+
     def play_audio_file(self, filepath, start_position=None):
         """mpvでオーディオファイルを再生（SLT・空欄・ST対応）"""
         import time
@@ -489,14 +4820,29 @@ class MusicScheduler:
 
         try:
             playback_start = time.time()
+            audio_filter = self.audio_filter_for(filepath)
+            # 放送中の mpv は止めずに standby_player で開始し、出力開始を確認してから止める
+            previous = self.player if self.can_hand_over() else None
+            player = self.standby_player if previous is not None else self.player
+            if previous is not None:
+                self.armed_record = None  # プリロールしていた音源は読み込みで置き換わる
             if start_position is not None:
-                # 指定された位置から再生開始
-                self.player.play_file_from_position(filepath, start_position)
+                # 指定された位置から再生開始（変換済みなら FLAC から）
+                started = player.play_file_from_position(
+                    self.seekable_path(filepath, start_position), start_position, audio_filter)
                 self._log(f"\n再生開始: {filepath} (位置: {start_position:.1f}秒)")
             else:
-                self.player.play_file(filepath)
+                started = player.play_file(self.seekable_path(filepath, None), audio_filter=audio_filter)
                 self._log(f"\n再生開始: {filepath}")
+            if previous is not None:
+                if started:
+                    self.player, self.standby_player = player, previous
+                    self.player_stopping = self.player_stop_worker.submit(
+                        previous.hand_over, player, self.handover_fade)
+                else:
+                    self.player_stopping = self.player_stop_worker.submit(previous.stop)
             mpv_elapsed = time.time() - playback_start
+            self.metric_player_start.observe(mpv_elapsed, method=player.mode)
             if self.debug_mode:
                 self._log(f"[mpv実行時間] {mpv_elapsed:.3f}s")
         except Exception as e:
@@ -553,155 +4899,359 @@ class MusicScheduler:
         broadcast_date = self.get_broadcast_date()
         return self.parse_time_for_date(time_str, broadcast_date)
     
-    def wait_for_csv_file(self, csv_path, is_background=False):
-        """CSVファイルが見つかるまで待機（修正版：バックグラウンド専用）"""
-        attempt_count = 0
-        max_attempts = 60  # 最大60回（60分）試行
-        
-        while not os.path.exists(csv_path) and attempt_count < max_attempts:
-            attempt_count += 1
-            filename = os.path.basename(csv_path)
-            
-            print(f"\n翌日分CSVファイルが見つかりません: {filename} (試行{attempt_count}/{max_attempts}回目)")
-            print("1分後に再試行します...")
-            
-            # 1分間待機
-            time.sleep(60)
-            
-        if os.path.exists(csv_path):
-            if attempt_count > 0:
-                print(f"\nCSVファイルが見つかりました: {os.path.basename(csv_path)}")
-            return True
-        else:
-            print(f"\n警告: 翌日分CSVファイルが見つかりませんでした: {os.path.basename(csv_path)}")
-            print(f"{max_attempts}分間待機しましたが、ファイルが配置されませんでした。")
-            return False
-
-    def load_csv_records(self, csv_path, base_date, is_background=False):
+    def load_csv_records(self, csv_path, base_date):
         """指定されたCSVファイルからレコードを読み込み"""
-        # バックグラウンドの場合のみファイル待機
-        if is_background:
-            if not self.wait_for_csv_file(csv_path, is_background):
-                return []
-        elif not os.path.exists(csv_path):
-            # フォアグラウンドでファイルが見つからない場合は即座に失敗
+        if not os.path.exists(csv_path):
             print(f"CSVファイルが見つかりません: {csv_path}")
             return []
         
-        records = []
+        # コンパイル済みキャッシュが有効ならそのまま使用
+        cached = ScheduleCache.load(csv_path, base_date, self.day_end_hour)
+        if cached is not None:
+            return self._records_from_tuples(cached, base_date)
+        
+        parsed = []
         
         try:
-            with open(csv_path, 'r', encoding='utf-8-sig') as csvfile:
-                reader = csv.reader(csvfile)
+            csv_stat = os.stat(csv_path)
+            with open(csv_path, 'rb') as csvfile:
+                csv_data = csvfile.read()
+            
+            # mtime のみ変化した場合はハッシュで照合
+            cached = ScheduleCache.load(csv_path, base_date, self.day_end_hour, csv_data)
+            if cached is not None:
+                ScheduleCache.save(csv_path, base_date, self.day_end_hour, cached, csv_data, csv_stat)
+                return self._records_from_tuples(cached, base_date)
+            
+            reader = csv.reader(io.StringIO(csv_data.decode('utf-8-sig')))
+            
+            for row in reader:
+                if len(row) < 4:  # 最低4カラム必要
+                    continue
                 
-                for row in reader:
-                    if len(row) < 4:  # 最低4カラム必要
-                        continue
-                    
-                    time_str = row[0].strip()
-                    source = row[1].strip()      # 使用しないが読み込み
-                    mix = row[2].strip()         # 使用しないが読み込み
-                    filename = row[3].strip()
-                    
-                    # 空行やヘッダー行をスキップ
-                    if not time_str or time_str.lower() in ['time', '時刻', 'タイム']:
-                        continue
-                    
-                    # 時刻を解析（指定された基準日で）
-                    scheduled_time = self.parse_time_for_date(time_str, base_date)
-                    if scheduled_time is None:
-                        continue
-                    
-                    record = {
-                        'time': scheduled_time,
-                        'source': source,
-                        'mix': mix,
-                        'filename': filename,
-                        'filepath': None,
-                        'broadcast_date': base_date  # どの日のレコードかを記録
-                    }
-                    
-                    records.append(record)
+                time_str = row[0].strip()
+                source = row[1].strip()      # 使用しないが読み込み
+                mix = row[2].strip()         # 使用しないが読み込み
+                filename = row[3].strip()
+                
+                # 空行やヘッダー行をスキップ
+                if not time_str or time_str.lower() in ['time', '時刻', 'タイム']:
+                    continue
+                
+                # 時刻を解析（指定された基準日で）
+                scheduled_time = self.parse_time_for_date(time_str, base_date)
+                if scheduled_time is None:
+                    continue
+                
+                parsed.append((scheduled_time, source, mix, filename))
         
         except Exception as e:
             print(f"CSVファイル読み込みエラー: {e}")
             return []
         
-        return records
+        # 時刻順にソートしてコンパイル済みキャッシュに保存
+        parsed.sort(key=lambda x: x[0])
+        if not ScheduleCache.save(csv_path, base_date, self.day_end_hour, parsed, csv_data, csv_stat):
+            if self.debug_mode:
+                self._log(f"[スケジュールキャッシュ] 書き込みできません: {ScheduleCache.path_for(csv_path)}")
+        
+        return self._records_from_tuples(parsed, base_date)
+    
+    def _records_from_tuples(self, rows, base_date):
+        """(時刻, source, mix, filename) のリストからレコードを作成"""
+        return [ScheduleRecord(scheduled_time, source, mix, filename, base_date)
+                for scheduled_time, source, mix, filename in rows]
     
-    def load_next_day_csv_background(self):
-        """翌日のCSVファイルをバックグラウンドで読み込む（スレッド用）"""
-        next_day_csv_path = self.get_next_day_csv_path()
+    def load_lookahead_days(self):
+        """放送日の翌日から lookahead_days 日先までの未読み込み分を日付順に読み込む"""
         broadcast_date = self.get_broadcast_date()
-        next_day = broadcast_date + timedelta(days=1)
+        added = 0
+        for offset in range(1, self.lookahead_days + 1):
+            target_date = broadcast_date + timedelta(days=offset)
+            if target_date in self.loaded_dates:
+                continue
+            csv_path = self.get_csv_path_by_date(target_date)
+            if not os.path.exists(csv_path):
+                if target_date not in self._missing_csv_reported:
+                    self._missing_csv_reported.add(target_date)
+                    print(f"\n先読み対象のCSVファイルが見つかりません: {os.path.basename(csv_path)}")
+                    print("配置され次第読み込みます...")
+                # 通し番号を保つため、欠けている日より先は読み込まない
+                break
 
-        self._log(f"\nバックグラウンドで翌日分CSVを読み込み中: {next_day_csv_path}")
-        self._log(f"DEBUG: バックグラウンド開始。next_day_loaded={self.next_day_loaded}, next_day_loading={self.next_day_loading}")
-        next_day_records = self.load_csv_records(next_day_csv_path, next_day, is_background=True)
+            records = self.load_csv_records(csv_path, target_date)
+            with self.schedule_lock:
+                self.all_records.extend(records)
+                self.loaded_dates.add(target_date)
+            self._log(f"\n{target_date.strftime('%Y-%m-%d')} 分 {len(records)} レコードを追加しました"
+                      f"（保持: {len(self.all_records)} レコード）")
+            self.request_loudness_analysis(records)
+            self.request_seek_cache(records)
+            self.start_preflight(records, target_date)
+            added += len(records)
 
-        if next_day_records:
-            # 時刻順にソートしてから追加
-            next_day_records.sort(key=lambda x: x['time'])
-            self.all_records.extend(next_day_records)
-            print(f"\n翌日分 {len(next_day_records)} レコードを追加しました")
-            self.next_day_loaded = True
-        else:
-            print("\n翌日分のCSVファイルが見つからないか、有効なレコードがありません")
-            # ファイルが見つからない場合でもフラグは立てない（再試行のため）
+        if added:
+            self.records_added.set()
+            self.request_media_prefetch()
+        return added
+
+    def schedule_loader(self):
+        """先読み範囲のCSVを読み込むスレッド（1分ごと・日替わり時に確認）"""
+        while self.loader_running:
+            try:
+                self.load_lookahead_days()
+            except Exception as e:
+                print(f"\nCSV先読みエラー: {e}")
+            self.clock.wait(self._loader_wake, 60)
+            self._loader_wake.clear()
 
-        self._log(f"DEBUG: バックグラウンド完了。next_day_loaded={self.next_day_loaded}, next_day_loading→False に設定")
-        self.next_day_loading = False
+    def start_loader_thread(self):
+        """先読みスレッドを開始"""
+        if not self.loader_running:
+            self.loader_running = True
+            self.loader_thread = threading.Thread(target=self.schedule_loader, daemon=True)
+            self.loader_thread.start()
 
-    def load_next_day_csv(self):
-        """翌日のCSVファイルを読み込んで追加（バックグラウンド対応）"""
-        self._log(f"DEBUG: load_next_day_csv() 呼び出し。next_day_loaded={self.next_day_loaded}, next_day_loading={self.next_day_loading}")
-        if self.next_day_loaded or self.next_day_loading:
-            self._log(f"DEBUG: 早期リターン。既に読み込み済みまたは読み込み中です")
+    def stop_loader_thread(self):
+        """先読みスレッドを停止"""
+        self.loader_running = False
+        self._loader_wake.set()
+
+    def on_csv_changed(self, name):
+        """data/csv 内のファイルの追加・更新・削除の通知（監視スレッド）"""
+        match = self.CSV_NAME_PATTERN.match(name)
+        if not match:
+            return
+        try:
+            target_date = datetime.strptime(match.group(1), '%y%m%d').date()
+        except ValueError:
             return
+        self.csv_arrived.set()
+        if self.archive is not None:
+            self.archive.submit(name)
+        if target_date in self.loaded_dates:
+            self.reload_schedule_day(target_date)
+            self.request_media_prefetch()
+        else:
+            self._loader_wake.set()
 
-        self._log(f"DEBUG: バックグラウンドスレッド開始。next_day_loading→True に設定")
-        self.next_day_loading = True
-        
-        # バックグラウンドスレッドで実行
-        background_thread = threading.Thread(
-            target=self.load_next_day_csv_background, 
-            daemon=True
-        )
-        background_thread.start()
-    
-    def check_next_day_csv_availability(self):
-        """翌日分CSVの読み込み状況をチェック（ノンブロッキング）"""
-        if not self.next_day_check_started:
-            # 残りレコード数をチェック
-            remaining_count = len(self.all_records) - self.current_record_index - 1
-            if remaining_count <= self.preload_threshold:
-                print(f"\n残りレコード数が {remaining_count} 個になりました。翌日分CSVの読み込みを開始します。")
-                self.load_next_day_csv()
-                self.next_day_check_started = True
-    
-    def is_end_of_schedule(self):
-        """スケジュール終了かどうかをチェック"""
-        # 現在のレコードが最後のレコードかどうか
-        if self.current_record_index >= len(self.all_records) - 1:
-            # 翌日分が読み込み済みなら継続
-            if self.next_day_loaded:
+    def reload_schedule_day(self, target_date):
+        """読み込み済みの放送日のCSVを再読み込みし、未来のレコードだけを差し替える
+
+        現在時刻以前のレコード（放送中のレコードを含む）は変更しない。
+        内容が変わらないレコードは既存のオブジェクトをそのまま使うため、
+        プリロール済みの音源も維持される。
+        """
+        csv_path = self.get_csv_path_by_date(target_date)
+        if not os.path.exists(csv_path):
+            self._log(f"\nCSVファイルが削除されました: {os.path.basename(csv_path)}（読み込み済みのスケジュールで継続します）")
+            return False
+        new_records = self.load_csv_records(csv_path, target_date)
+
+        current_time = self.clock.now()
+        with self.schedule_lock:
+            after_index = self.all_records.index_at(current_time)
+            if self.current_record:
+                after_index = max(after_index, self.current_record_index)
+            tail = [self.all_records[i] for i in range(after_index + 1, self.all_records.end)]
+
+            # 既存の未来レコードとの差分を計算
+            unchanged = {}
+            for record in tail:
+                if record.broadcast_date == target_date:
+                    key = (record.time, record.source, record.mix, record.filename)
+                    unchanged.setdefault(key, []).append(record)
+            merged = []
+            added = []
+            for record in new_records:
+                if record.time <= current_time:
+                    continue
+                key = (record.time, record.source, record.mix, record.filename)
+                if unchanged.get(key):
+                    merged.append(unchanged[key].pop(0))
+                else:
+                    merged.append(record)
+                    added.append(record)
+            removed = sum(len(records) for records in unchanged.values())
+            if not added and not removed:
                 return False
-            # 翌日分の読み込みがまだなら、読み込み開始（既に開始済みなら何もしない）
-            elif not self.next_day_loading:
-                print("\n最終レコードに到達しました。翌日分CSVの読み込みを開始します。")
-                self.load_next_day_csv()
-            return True  # 翌日分が読み込まれるまでは終了扱い
-        return False
-        
+
+            others = [r for r in tail if r.broadcast_date != target_date]
+            self.all_records.replace_after(after_index, others + merged)
+
+        self._log(f"\n【スケジュール更新】 {target_date.strftime('%Y-%m-%d')}: "
+                  f"追加 {len(added)} / 削除 {removed} レコード（放送中の音源は継続）")
+        self.request_loudness_analysis(added)
+        self.request_seek_cache(added)
+        self.start_preflight(new_records, target_date)
+        # 次のレコードの待機をやり直させる
+        self.records_added.set()
+        self.timer.wake()
+        return True
+
+    def evict_played_records(self):
+        """放送済みのレコード（現在のレコードより前）と過去の放送日を破棄"""
+        with self.schedule_lock:
+            count = self.all_records.evict_before(self.current_record_index)
+            keep_from = (self.current_record.broadcast_date if self.current_record
+                         else self.get_broadcast_date())
+            self.loaded_dates = {d for d in self.loaded_dates if d >= keep_from}
+            self._missing_csv_reported = {d for d in self._missing_csv_reported if d >= keep_from}
+        if count:
+            self._log(f"\n放送済みの {count} レコードを破棄しました（保持: {len(self.all_records)} レコード）")
+        return count
+
+    PREFLIGHT_OVERLAP_TOLERANCE = 0.5  # 次のレコードへの食い込みの許容秒数
+    PREFLIGHT_GAP_TOLERANCE = 1.0      # 次のレコードまでの無音の許容秒数
+
+    def run_preflight(self, records, label):
+        """レコードの音源を解決・測定し、欠落・重なり・空白を報告（プリフライトチェック）
+
+        音源の長さは ffprobe で並列に測定し、パスと mtime ごとにキャッシュする。
+        戻り値は検出した問題の件数。
+        """
+        started = time.monotonic()
+        records = sorted(records, key=lambda x: x.time)
+        filepaths = self.media_filepaths(records)
+        if self.durations.available:
+            self.durations.probe_all(filepaths)
+
+        problems = []
+        unmeasured = 0
+        for index, record in enumerate(records):
+            if not self.is_media_record(record):
+                continue
+            filename = record.filename.strip()
+            filepath = self.media_index.lookup(filename)
+            time_text = self.format_broadcast_time(record.time)
+            if filepath is None:
+                problems.append(f"  欠落: {time_text} {filename}（dummy で代替されます）")
+                continue
+            duration = self.durations.duration(filepath)
+            if duration is None:
+                unmeasured += 1
+                continue
+            if index + 1 >= len(records):
+                continue
+            next_record = records[index + 1]
+            margin = (next_record.time - record.time).total_seconds() - duration
+            if margin < -self.PREFLIGHT_OVERLAP_TOLERANCE:
+                problems.append(f"  重なり: {time_text} {filename} が次のレコード"
+                                f"（{self.format_broadcast_time(next_record.time)}）に {-margin:.1f} 秒食い込みます")
+            elif margin > self.PREFLIGHT_GAP_TOLERANCE:
+                problems.append(f"  空白: {time_text} {filename} の終了後 {margin:.1f} 秒の無音があります")
+
+        elapsed = time.monotonic() - started
+        self._log(f"\n【プリフライト】 {label}: {len(records)} レコード / 音源 {len(filepaths)} ファイル"
+                  f"（{elapsed:.1f} 秒）")
+        for line in problems:
+            self._log(line)
+        if not self.durations.available:
+            self._log("  ffprobe が見つからないため、重なり・空白は確認していません")
+        elif unmeasured:
+            self._log(f"  長さを測定できなかった音源: {unmeasured} 件")
+        if not problems:
+            self._log("  問題はありません")
+        return len(problems)
+
+    def start_preflight(self, records, target_date):
+        """プリフライトチェックをバックグラウンドで実行（放送日ごとに順番に処理）"""
+        if not self.preflight_enabled or not records:
+            return
+        if self._preflight_executor is None:
+            self._preflight_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='preflight')
+        self._preflight_executor.submit(self._preflight_task, list(records), target_date)
+
+    def _preflight_task(self, records, target_date):
+        try:
+            self.run_preflight(records, target_date.strftime('%Y-%m-%d'))
+        except Exception as e:
+            print(f"\nプリフライトチェックエラー: {e}")
+
+    def stop_preflight(self):
+        """バックグラウンドのプリフライトチェックを終了"""
+        if self._preflight_executor is not None:
+            try:
+                self._preflight_executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:  # Python 3.8 以前
+                self._preflight_executor.shutdown(wait=False)
+        if self.shared is None:
+            self.durations.shutdown()
+
+    def open_archive(self):
+        """スケジュールの記録（ScheduleArchive）を開く（開けなければ None）"""
+        try:
+            return ScheduleArchive(self.archive_path, self.csv_dir, self.day_end_hour,
+                                   self.load_csv_records, debug_mode=self.debug_mode).open()
+        except (sqlite3.Error, OSError) as e:
+            print(f"スケジュールの記録を開けません: {self.archive_path} ({e})")
+            return None
+
+    def start_archive(self):
+        """[ARCHIVE] enabled = true ならスケジュールの記録を開き、CSVの変更の反映を開始"""
+        if not self.archive_enabled:
+            return
+        self.archive = self.open_archive()
+        if self.archive is not None:
+            self.archive.submit_sync()
+
+    def query_archive(self, at=None, filename=None, since=None, limit=10):
+        """スケジュールの記録を検索して表示（--at / --find 用）。見つかれば True
+
+        at: 放送中だったレコードを調べる時刻、filename: 放送予定を調べるファイル名
+        （since 以降、省略時は現在時刻以降）
+        """
+        archive = self.open_archive()
+        if archive is None:
+            return False
+        try:
+            start = time.perf_counter()
+            updated, removed = archive.sync()
+            print(f"スケジュールの記録: CSV {updated} 件を読み込み・{removed} 件を削除"
+                  f"（{time.perf_counter() - start:.2f}s）")
+            start = time.perf_counter()
+            if at is not None:
+                results = [row for row in (archive.at(at),) if row is not None]
+            else:
+                results = archive.find(filename, since or self.clock.now(), limit)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for row in results:
+                line = (f"{row['broadcast_date'].strftime('%Y-%m-%d')} {self.format_broadcast_time(row['start'])}"
+                        f"  {row['source']}  {row['mix']}  {row['filename']}"
+                        f"（{row['start'].strftime('%Y-%m-%d %H:%M:%S')}")
+                if row.get('until') is not None:
+                    line += f" - {row['until'].strftime('%H:%M:%S')}"
+                print(line + "）")
+            if not results:
+                print("該当するレコードはありません")
+            print(f"（検索 {elapsed_ms:.1f}ms）")
+            return bool(results)
+        finally:
+            archive.close()
+            self.close_log()
+
+    def preflight_date(self, target_date):
+        """指定した放送日のCSVをプリフライトチェック（--preflight 用）"""
+        csv_path = self.get_csv_path_by_date(target_date)
+        try:
+            if not os.path.exists(csv_path):
+                print(f"CSVファイルが見つかりません: {csv_path}")
+                return None
+            self.media_index.build()
+            records = self.load_csv_records(csv_path, target_date)
+            if not self.durations.available:
+                print("ffprobe が見つかりません。音源の欠落のみ確認します。")
+            return self.run_preflight(records, target_date.strftime('%Y-%m-%d'))
+        finally:
+            self.durations.shutdown()
+            self.close_log()
+
     def load_and_process_csv(self):
         """CSVファイルを読み込み、レコードを処理"""
         csv_path = self.get_today_csv_path()
         broadcast_date = self.get_broadcast_date()
 
-        # 日替わり時にフラグをリセット
-        self.next_day_loaded = False
-        self.next_day_loading = False
-        self.next_day_check_started = False
         self.current_record_index = 0
 
         # 今日分のCSVが存在しない場合は待機
@@ -709,53 +5259,49 @@ class MusicScheduler:
             print(f"\n本日分のCSVファイルが見つかりません: {csv_path}")
             print("ファイルが配置されるまで待機します...")
             while not os.path.exists(csv_path):
-                time.sleep(60)
-                print(f"再試行中... {datetime.now().strftime('%H:%M:%S')}")
+                # CSVの配置を監視スレッドから通知（念のため1分ごとにも確認）
+                if not self.clock.wait(self.csv_arrived, 60):
+                    print(f"再試行中... {self.clock.now().strftime('%H:%M:%S')}")
+                self.csv_arrived.clear()
             print("CSVファイルが見つかりました。")
         
         # 今日分のレコードを読み込み
-        self.all_records = self.load_csv_records(csv_path, broadcast_date)
+        self.all_records = ScheduleStore(self.load_csv_records(csv_path, broadcast_date))
+        self.loaded_dates = {broadcast_date}
         
         if not self.all_records:
             return []
         
-        # 時刻順にソート
-        self.all_records.sort(key=lambda x: x['time'])
+        current_time = self.clock.now()
         
-        current_time = datetime.now()
-        
-        # 現在時刻より前のレコードをスキップし、CurrentRecordを特定
-        for i, record in enumerate(self.all_records):
-            if record['time'] <= current_time:
-                self.current_record = record
-                self.current_record_index = i
-            else:
-                # 次のレコードをNextRecordとして設定
-                if i < len(self.all_records):
-                    self.next_record = self.all_records[i]
-                break
+        # 現在時刻以前に開始した最後のレコードを CurrentRecord、その次を NextRecord とする
+        index = self.all_records.index_at(current_time)
+        if index >= 0:
+            self.current_record = self.all_records[index]
+            self.current_record_index = index
+        if index + 1 < len(self.all_records):
+            self.next_record = self.all_records[index + 1]
         
         return self.all_records
     
     def start_current_playback(self):
         """現在のレコードの再生を開始（修正版）"""
-        if self.current_record:
-            filename = self.current_record['filename']
+        if self.current_record and self.take_resumed(self.current_record):
+            print(f"\n現在演奏中: {self.format_broadcast_time(self.current_record.time)} - "
+                  f"{self.current_record.filename}（前回の再生を継続）")
+            self.current_start_time = self.clock.now()
+            self.save_state()
+        elif self.current_record:
+            filename = self.current_record.filename
             filepath = self.find_media_file(filename)
-            self.current_record['filepath'] = filepath
+            self.current_record.filepath = filepath
 
-            # JACK接続モード変更を処理（モード変更時のみ実行）
-            current_studio_mode = self.is_studio_mode(self.current_record)
-            if current_studio_mode != self.previous_studio_mode:
-                self.handle_jack_mode_change(self.current_record)
-                self.previous_studio_mode = current_studio_mode
-
-            # 翌日分CSVのチェック（レコード演奏時）
-            self.check_next_day_csv_availability()
+            # JACK接続モード変更を再生開始と並行して処理（モード変更時のみ実行）
+            transition = self.begin_transition(self.current_record)
 
             # 現在時刻と開始予定時刻の差を計算
-            current_time = datetime.now()
-            scheduled_time = self.current_record['time']
+            current_time = self.clock.now()
+            scheduled_time = self.current_record.time
             elapsed_seconds = (current_time - scheduled_time).total_seconds()
 
             # 実際の再生開始時刻を記録
@@ -768,140 +5314,290 @@ class MusicScheduler:
                 seconds = int(elapsed_seconds % 60)
                 print(f"現在演奏中: {self.format_broadcast_time(scheduled_time)} - {filename}")
                 print(f"開始時刻から {minutes}:{seconds:02d} 経過。該当位置から再生開始")
-                self.play_audio_file(filepath, elapsed_seconds)
+                transition.run('再生開始', self.play_audio_file, filepath, elapsed_seconds)
+                self.log_asrun(self.current_record, filepath, 'resume', start_position=elapsed_seconds)
             else:
                 # 開始時刻がまだ来ていない場合（通常はここには来ない）
                 print(f"現在演奏中: {self.format_broadcast_time(scheduled_time)} - {filename}")
-                self.play_audio_file(filepath)
+                transition.run('再生開始', self.play_audio_file, filepath)
+                self.log_asrun(self.current_record, filepath)
+            transition.finish()
+            self.save_state()
         else:
             print("現在演奏中のレコードがありません")
     
     def get_next_record_from_list(self):
         """リストから次のレコードを取得"""
-        current_time = datetime.now()
+        current_time = self.clock.now()
         
-        # 現在のインデックスから次のレコードを探す
-        for i in range(self.current_record_index + 1, len(self.all_records)):
-            record_time = self.all_records[i]['time']
-            if record_time > current_time:
-                return self.all_records[i], i
+        # 現在のインデックス以降で現在時刻より後の最初のレコードを二分探索
+        # （最初のレコードの開始前に起動した場合は先頭から）
+        start = self.current_record_index + 1 if self.current_record else self.all_records.start
+        index = self.all_records.index_after(current_time, start)
+        if index >= 0:
+            return self.all_records[index], index
         
         return None, -1
     
     def wait_and_play_next(self):
         """次のレコードの時刻まで待機して再生"""
-        # 翌日分CSVのチェック（毎回実行）
-        self.check_next_day_csv_availability()
-        
         # 次のレコードを取得
-        next_record, next_index = self.get_next_record_from_list()
+        self.records_added.clear()
+        next_record, _ = self.get_next_record_from_list()
+        self.cancel_stale_preroll(next_record)
         
         if not next_record:
-            # 次のレコードがない場合の処理
-            if self.is_end_of_schedule():
-                # 翌日分が読み込み中の場合は待機
-                if self.next_day_loading and not self.next_day_loaded:
-                    print("\n翌日分CSVの読み込み完了を待機中...")
-                    # ノンブロッキングで待機（演奏は継続）
-                    wait_count = 0
-                    while self.next_day_loading and not self.next_day_loaded and wait_count < 300:  # 最大5分待機
-                        time.sleep(1)
-                        wait_count += 1
-                    
-                    if self.next_day_loaded:
-                        print("翌日分CSVの読み込みが完了しました。放送を継続します。")
-                        # 再度次のレコードを取得
-                        next_record, next_index = self.get_next_record_from_list()
-                        if not next_record:
-                            print("次のレコードがありません")
-                            return False
-                    else:
-                        print("翌日分CSVの読み込みが完了しませんでした。")
-                        return False
-                else:
-                    print("次のレコードがありません")
+            # 先読み範囲のCSVが読み込まれるのを待機（演奏は継続）
+            print("\n次のレコードがありません。翌日分CSVの読み込み完了を待機中...")
+            self._loader_wake.set()
+            deadline = self.clock.monotonic() + self.schedule_end_wait
+            while not next_record:
+                remaining = deadline - self.clock.monotonic()
+                if remaining <= 0:
+                    print("翌日分CSVの読み込みが完了しませんでした。")
                     return False
-            else:
-                print("次のレコードがありません")
-                return False
+                self.clock.wait(self.records_added, remaining)
+                self.records_added.clear()
+                self.check_player_exit()
+                self.check_dead_air_fallback()
+                next_record, _ = self.get_next_record_from_list()
+            self.cancel_stale_preroll(next_record)
+            print("翌日分CSVの読み込みが完了しました。放送を継続します。")
         
         self.next_record = next_record
-        current_time = datetime.now()
-        scheduled_time = self.next_record['time']
+        current_time = self.clock.now()
+        scheduled_time = self.next_record.time
         
         if scheduled_time <= current_time:
             # 既に時刻が過ぎている場合はすぐに再生
-            self.play_next_record(next_index)
+            self.play_next_record()
             return True
         
-        # 待機時間を計算
-        wait_seconds = (scheduled_time - current_time).total_seconds()
         print()  # 改行
-        print(f"次の再生予定: {self.format_broadcast_time(scheduled_time)} - {self.next_record['filename']}")
+        print(f"次の再生予定: {self.format_broadcast_time(scheduled_time)} - {self.next_record.filename}")
         
         # 時間表示スレッドを開始（まだ開始していない場合）
-        if not self.display_running:
+        if self.display_enabled and not self.display_running:
             self.start_display_thread()
         
-        # 待機（0.1秒刻みでチェック）
-        while wait_seconds > 0:
-            time.sleep(0.1)
-            current_time = datetime.now()
-            wait_seconds = (scheduled_time - current_time).total_seconds()
+        # preroll_seconds 前まで待機して次の音源を準備
+        if self.preroll_seconds > 0:
+            preroll_time = scheduled_time - timedelta(seconds=self.preroll_seconds)
+            if not self.timer.wait_until(preroll_time):
+                return True  # 起こされた：次のレコードを取得し直す
+            self.arm_next_record()
+
+        # 開始時刻まで待機
+        if not self.timer.wait_until(scheduled_time):
+            return True  # 起こされた：次のレコードを取得し直す
         
         # 再生
-        self.play_next_record(next_index)
+        self.play_next_record(timer_jitter=self.timer.last_jitter)
         return True
     
-    def play_next_record(self, next_index):
+    def resolve_next_record(self):
+        """次のレコードの音源を確定（戻り値: (filepath, プリロール済みかどうか)）"""
+        if self.armed_record is self.next_record:
+            return self.next_record.filepath, True
+        filepath = self.find_media_file(self.next_record.filename)
+        self.next_record.filepath = filepath
+        return filepath, False
+
+    def start_next_record(self, record, filepath, armed, timer_jitter=None):
+        """次のレコードに切り替え、開始誤差を記録
+
+        JACK切替は再生開始と並行して実行し、前の音源の停止は再生開始の後に
+        並行して実行する（切り替えの所要時間は各ステップの合計ではなく最大値）。
+        """
+        transition = self.begin_transition(record)
+        print()  # 改行してから情報表示
+        print(f"再生開始: {self.format_broadcast_time(record.time)} - {record.filename}")
+        if armed:
+            previous = transition.run('再生開始', self.start_armed_playback, filepath)
+            if previous is not None and self.player_handover:
+                # 次の音源の出力開始を確認してから前の音源を止める（make-before-break）
+                self.player_stopping = transition.submit(
+                    self.player_stop_worker, '前の音源の停止', previous.hand_over,
+                    self.player, self.handover_fade)
+            elif previous is not None:
+                self.player_stopping = transition.submit(
+                    self.player_stop_worker, '前の音源の停止', previous.stop)
+        else:
+            # 次のレコードは時刻通りなので位置指定なし
+            transition.run('再生開始', self.play_audio_file, filepath)
+            if self.armed_record is not None:
+                # 別のレコード用にプリロールしていた音源を破棄（一時停止中のため再生開始後でよい）
+                self.armed_record = None
+                self.player_stopping = transition.submit(
+                    self.player_stop_worker, 'プリロール破棄', self.standby_player.stop)
+        self.log_start_error(record, timer_jitter)
+        self.record_start_metrics(record, filepath, timer_jitter)
+        self.log_asrun(record, filepath, preroll=armed, timer_jitter=timer_jitter)
+        transition.finish()
+
+    def begin_transition(self, record):
+        """レコードへの切り替えを開始し、JACK切替を並行して実行"""
+        transition = Transition(f"{self.format_broadcast_time(record.time)} - {record.filename}",
+                                self.log_transition)
+        transition.submit(self.routing_worker, 'JACK切替', self.update_jack_mode, record)
+        return transition
+
+    def log_transition(self, transition):
+        """切り替えの各ステップの所要時間をログに記録"""
+        self._log(f"[切替] {transition.label}: {transition.summary()}")
+        for error in transition.errors:
+            self._log(f"切替エラー ({error})")
+
+    def advance_to_next(self):
+        """CurrentRecordとインデックスを次のレコードに更新
+
+        インデックスは待機の前ではなくここで求め直す（待機中にCSVの再読み込みで
+        レコードが置き換わったり、放送済みのレコードが破棄されたりしても
+        通し番号がずれない）。
+        """
+        record = self.next_record
+        with self.schedule_lock:
+            # CSVの再読み込みは current_record_index 以降を置き換えるため、同じロックの中で更新
+            self.current_record = record
+            self.current_record_index = self.all_records.index_of(record)
+        self.next_record = None
+        self.save_state()
+        self.request_media_prefetch()
+
+    def play_next_record(self, timer_jitter=None):
         """次のレコードを再生し、CurrentとNextを更新（修正版）"""
         if self.next_record:
-            filename = self.next_record['filename']
-            filepath = self.find_media_file(filename)
-            self.next_record['filepath'] = filepath
+            filepath, armed = self.resolve_next_record()
+
+            # 実際の再生開始時刻を記録
+            self.current_start_time = self.clock.now()
 
-            # JACK接続モード変更を処理（モード変更時のみ実行）
-            current_studio_mode = self.is_studio_mode(self.next_record)
-            if current_studio_mode != self.previous_studio_mode:
-                self.handle_jack_mode_change(self.next_record)
-                self.previous_studio_mode = current_studio_mode
+            self.start_next_record(self.next_record, filepath, armed, timer_jitter)
+            self.advance_to_next()
+    
+    def start_station(self):
+        """再生ループの開始前の準備（CSVの読み込みなど）。有効なレコードがなければ False
 
-            # 翌日分CSVのチェック（レコード演奏時）
-            self.check_next_day_csv_availability()
+        マルチ局モードで共有する資源（JACK クライアント・メディア索引・計測値の
+        出力）の準備は StationGroup が行う。
+        """
+        # buffer モード：JACK クライアントを開く（開けなければ mpv の ipc モードで再生）
+        if self.buffer_engine is not None and not self.buffer_engine.open():
+            print("プロセス内再生を開始できません。mpv（ipc モード）で再生します。")
+            self.buffer_engine = None
+            self.player_mode = 'ipc'
+            self.player, self.standby_player = self.create_mpv_players()
 
-            # 実際の再生開始時刻を記録
-            self.current_start_time = datetime.now()
+        # マルチ局モード：mpv の出力を局のポートにつなぐ
+        self.route_player_outputs()
 
-            print()  # 改行してから情報表示
-            print(f"再生開始: {self.format_broadcast_time(self.next_record['time'])} - {filename}")
-            self.play_audio_file(filepath)  # 次のレコードは時刻通りなので位置指定なし
+        # 前回実行時の mpv を引き継ぐ（引き継げないものは停止）
+        self.resume_from_state()
+
+        if self.shared is None:
+            # 計測値の出力を開始
+            self.start_metrics_export()
+
+            # JACK クライアントに接続（利用できなければ jack_connect 等を使用）
+            self.jack.open()
+
+            # メディアファイル索引を構築し、以降は差分更新
+            self.media_index.build()
+            self.media_index.start_refresh_thread()
+
+        # data/csv の監視を開始
+        self.csv_watcher.start()
+
+        # スケジュールの記録を開き、前回以降のCSVの変更をバックグラウンドで反映
+        self.start_archive()
+
+        # 放送出力のレベル監視を開始
+        self.start_level_monitor()
+
+        # CSVファイルを読み込み
+        records = self.load_and_process_csv()
+
+        if not records:
+            print("有効なレコードがありません")
+            return False
+
+        if self._resumed is not None and self.current_record is None:
+            # 引き継いだ音源が今のスケジュールにない
+            self._resumed = None
+            self.player.stop()
+
+        print(f"総レコード数: {len(records)}")
+
+        # 本日分の音源のラウドネス解析をバックグラウンドで開始
+        if not self.loudness.available and self.loudness_mode != 'live':
+            print("ffmpeg が見つかりません。ラウドネス解析を行わず、リアルタイム loudnorm を使用します。")
+        upcoming = [r for r in records if not self.current_record or r.time >= self.current_record.time]
+        self.request_loudness_analysis(upcoming)
+        self.request_seek_cache(upcoming)
+        self.request_media_prefetch()
+
+        # 本日分の音源の欠落・重なり・空白をバックグラウンドで確認
+        self.start_preflight(records, self.get_broadcast_date())
+
+        # 現在の設定を表示
+        print(f"放送日終了時刻: {self.day_end_hour:02d}:00:00")
+        current_broadcast_time = self.format_broadcast_time(self.clock.now())
+        print(f"現在の放送時刻: {current_broadcast_time}")
+        broadcast_date = self.get_broadcast_date()
+        print(f"放送日: {broadcast_date.strftime('%Y-%m-%d')}")
+        print()
+        return True
+
+    def stop_station(self):
+        """再生ループの終了後の後始末（共有する資源は StationGroup が閉じる）"""
+        # 時間表示スレッドを停止
+        self.stop_display_thread()
+        if self.level_monitor is not None:
+            self.level_monitor.close()
+            self.level_monitor = None
+        self.stop_loader_thread()
+        self.csv_watcher.stop()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if self.shared is None:
+            self.media_index.stop_refresh_thread()
+        self.stop_preflight()
+        if self.shared is None:
+            self.metrics.stop()
+        # 実行中のJACK切替・音源の停止は完了を待つ
+        self.routing_worker.shutdown(wait=True)
+        self.player_stop_worker.shutdown(wait=True)
+        if self.buffer_engine is not None:
+            # プロセス内再生は終了とともに止まる
+            self.buffer_engine.close()
+        if self.state_file is not None:
+            # mpv は終了後も再生を続けるため、最後の状態を残す
+            self.save_state()
+            self.state_file.close()
+        if self.shared is None:
+            self.loudness.shutdown()
+            if self.seek_cache is not None:
+                self.seek_cache.shutdown()
+            if self.media_cache is not None:
+                self.media_cache.shutdown()
+            self.jack.close()
+        # ログファイルを閉じる
+        self._log(f"========== プログラム終了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========\n")
+        self.close_log()
 
-            # CurrentRecordとインデックスを更新
-            self.current_record = self.next_record
-            self.current_record_index = next_index
-            self.next_record = None
-    
     def run(self):
         """メインの実行ループ"""
         print("放送スケジューラーを開開始します...")
 
         try:
-            # CSVファイルを読み込み
-            records = self.load_and_process_csv()
-            
-            if not records:
-                print("有効なレコードがありません")
+            if not self.start_station():
+                return
+
+            if self.engine == 'asyncio':
+                # 以降の処理を asyncio のタスクとして実行
+                AsyncPlayoutEngine(self).run()
                 return
-            
-            print(f"総レコード数: {len(records)}")
-            
-            # 現在の設定を表示
-            print(f"放送日終了時刻: {self.day_end_hour:02d}:00:00")
-            current_broadcast_time = self.format_broadcast_time(datetime.now())
-            print(f"現在の放送時刻: {current_broadcast_time}")
-            broadcast_date = self.get_broadcast_date()
-            print(f"放送日: {broadcast_date.strftime('%Y-%m-%d')}")
-            print()
             
             # 現在演奏中のファイルがある場合は再生開始
             if self.current_record:
@@ -910,74 +5606,489 @@ class MusicScheduler:
             # 時間表示スレッドを開始
             #self.start_display_thread()
 
+            # 翌日以降のCSVの先読みを開始
+            self.start_loader_thread()
+
             # 日替わり検出用に初期放送日を記録
             last_broadcast_date = self.get_broadcast_date()
 
             # 残りのレコードを順次処理
             while True:
+                # 放送中の mpv が途中で終了していたら再起動・無音検出時の代替音源を再生
+                self.check_player_exit()
+                self.check_dead_air_fallback()
+
                 # 日替わりチェック
                 current_broadcast_date = self.get_broadcast_date()
                 if current_broadcast_date != last_broadcast_date:
                     print(f"\n【日替わり処理】 {last_broadcast_date.strftime('%Y-%m-%d')} → {current_broadcast_date.strftime('%Y-%m-%d')}")
-                    # フラグをリセット（current_record_index はまだリセットしない）
-                    self.next_day_loaded = False
-                    self.next_day_loading = False
-                    self.next_day_check_started = False
-                    self._log(f"DEBUG: 日替わり処理実行。フラグをリセット。next_day_loaded={self.next_day_loaded}, next_day_loading={self.next_day_loading}, next_day_check_started={self.next_day_check_started}")
+                    # 放送済みレコードを破棄し、新しい先読み範囲を読み込む（通し番号は維持）
+                    self.evict_played_records()
+                    self._loader_wake.set()
                     last_broadcast_date = current_broadcast_date
 
                 if not self.wait_and_play_next():
-                    # 当日分のレコードが終了した
-                    if self.next_day_loaded:
-                        # 翌日分が読み込まれている場合、翌日分の処理を開始
-                        print(f"\n翌日分レコードから再開します")
-                        self.current_record_index = 0  # ← 翌日分のレコード処理開始時にリセット
-                        self._log(f"DEBUG: 当日分終了。翌日分から再開。current_record_index=0 にリセット")
-                        continue  # メインループを継続
-                    else:
-                        # 翌日分が読み込まれていない場合、スケジュール終了
-                        break
-                
-                # 全レコード終了チェック（簡略化）
-                if self.current_record_index >= len(self.all_records) - 1:
-                    if not self.next_day_loaded:
-                        # 翌日分が読み込まれていない場合の最終確認
-                        if self.next_day_loading:
-                            print("\n翌日分CSVの最終読み込み完了を待機中...")
-                            # 最大10分待機
-                            wait_count = 0
-                            while self.next_day_loading and not self.next_day_loaded and wait_count < 600:
-                                time.sleep(1)
-                                wait_count += 1
-                            
-                            if self.next_day_loaded:
-                                print("翌日分CSVの読み込みが完了しました。放送を継続します。")
-                                continue
-                            else:
-                                print("翌日分CSVの読み込みが完了しませんでした。")
-                                break
-                        else:
-                            print()
-                            print("すべてのレコードの処理が完了しました（翌日分CSVなし）")
-                            break
-                    else:
-                        # 翌日分も含めて全て終了
-                        print()
-                        print("すべてのレコードの処理が完了しました")
-                        break
+                    print()
+                    print("すべてのレコードの処理が完了しました（翌日分CSVなし）")
+                    break
         
         finally:
-            # 時間表示スレッドを停止
-            self.stop_display_thread()
-            # ログファイルを閉じる
-            if self.log_file:
-                self._log(f"========== プログラム終了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ==========\n")
-                self.log_file.close()
-                self.log_file = None
+            self.stop_station()
+
+            # mpv再生とJACK接続を保持したまま終了
+            print("\nスクリプトを停止しました。mpv再生とJACK接続は保持されています。")
+
+class StationGroup:
+    """1つのプロセスで複数の局（チャンネル）を運用するクラス（マルチ局モード）
+
+    device.conf の [STATION:局名] セクションごとに MusicScheduler を作成する。
+    各局は CSV の場所・日替わり時刻・ルーティング・mpv を個別に持ち、
+    メディア索引・解析キャッシュ・JACK クライアント・計測値の出力は全局で
+    共有する。各局の再生ループは1つの asyncio イベントループ上で実行する。
+    """
+    SECTION_PREFIX = 'STATION:'
+    NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+    def __init__(self, stations, debug_mode=False, clock=None, base_dir=None):
+        """stations: [(局名, 日替わり時刻), ...]"""
+        self.clock = clock or SystemClock()
+        self.base_dir = base_dir or os.path.join(os.path.expanduser("~"), "easyaps")
+        self.debug_mode = debug_mode
+        self.media_index = None  # 最初の局の作成時に device.conf の設定で作成
+        self.jack = None
+        self.loudness = None
+        self.durations = None
+        self.seek_cache = None
+        self.media_cache = None
+        self.metrics = None
+        self.metrics_settings = None
+        self.schedulers = [MusicScheduler(day_end_hour=hour, debug_mode=debug_mode,
+                                          station=name, shared=self)
+                           for name, hour in stations]
+
+    @classmethod
+    def configured_stations(cls, default_day_end_hour=4):
+        """device.conf の [STATION:局名] セクションから [(局名, 日替わり時刻), ...] を返す"""
+        config = configparser.ConfigParser()
+        config.read(MusicScheduler.device_config_path(), encoding='utf-8')
+        stations = []
+        for section in config.sections():
+            if not section.startswith(cls.SECTION_PREFIX):
+                continue
+            name = section[len(cls.SECTION_PREFIX):].strip()
+            if not cls.NAME_PATTERN.match(name):
+                print(f"警告: 局名に使用できない文字が含まれています: [{section}]（英数字・-・_ のみ）")
+                continue
+            hour = config.getint(section, 'day_end_hour', fallback=default_day_end_hour)
+            if not (0 <= hour <= 5):
+                print(f"警告: [{section}] day_end_hour は 0-5 の範囲で指定してください。{default_day_end_hour} を使用します。")
+                hour = default_day_end_hour
+            stations.append((name, hour))
+        return stations
+
+    def share_resources(self, scheduler):
+        """共有する資源を局に設定（最初の局の設定で作成。MusicScheduler の初期化中に呼ばれる）"""
+        if self.jack is None:
+            self.media_index = MediaIndex(scheduler.contents_dir)
+            self.jack = JackControl(backend=scheduler.jack_backend, debug_mode=self.debug_mode)
+            self.loudness = LoudnessAnalyzer(
+                os.path.join(self.base_dir, "data/cache/loudness.json"),
+                workers=scheduler.loudness_workers, debug_mode=self.debug_mode)
+            self.durations = DurationProbe(
+                os.path.join(self.base_dir, "data/cache/durations.json"),
+                workers=scheduler.preflight_workers, debug_mode=self.debug_mode)
+            if scheduler.seek_cache_enabled:
+                self.seek_cache = SeekCache(
+                    scheduler.seek_cache_dir or os.path.join(self.base_dir, "data/cache/seek"),
+                    debug_mode=self.debug_mode, **scheduler.seek_cache_options)
+            if scheduler.media_cache_enabled:
+                self.media_cache = MediaCache(
+                    scheduler.media_cache_dir or os.path.join(self.base_dir, "data/cache/media"),
+                    debug_mode=self.debug_mode, **scheduler.media_cache_options)
+            self.metrics = Metrics()
+            self.metrics_settings = scheduler
+        scheduler.media_index = self.media_index
+        scheduler.jack = self.jack
+        scheduler.loudness = self.loudness
+        scheduler.durations = self.durations
+        scheduler.seek_cache = self.seek_cache
+        scheduler.media_cache = self.media_cache
+        scheduler.metrics = self.metrics.view(station=scheduler.station)
+        scheduler.display_enabled = False  # 複数局の時間表示は画面が乱れるため行わない
+
+    def start_metrics_export(self):
+        """device.conf の [METRICS] に従って全局の計測値の出力を開始"""
+        settings = self.metrics_settings
+        if settings.metrics_textfile:
+            self.metrics.start_textfile(settings.metrics_textfile, settings.metrics_textfile_interval)
+            print(f"メトリクスを書き出します: {settings.metrics_textfile}")
+        if settings.metrics_http_port:
+            try:
+                self.metrics.start_http(settings.metrics_http_address, settings.metrics_http_port)
+                print(f"メトリクスを公開します: http://{settings.metrics_http_address}:{settings.metrics_http_port}/metrics")
+            except OSError as e:
+                print(f"メトリクスの HTTP サーバーを開始できません: {e}")
+
+    def run(self):
+        """全局の再生ループを実行（すべての局が終了するまで戻らない）"""
+        names = ', '.join(s.station for s in self.schedulers)
+        print(f"マルチ局モードで開始します: {names}")
+        if any(s.engine != 'asyncio' for s in self.schedulers):
+            print("マルチ局モードでは asyncio エンジンを使用します")
+
+        try:
+            self.start_metrics_export()
+            self.jack.open()
+            self.media_index.build()
+            self.media_index.start_refresh_thread()
+
+            ready = []
+            for scheduler in self.schedulers:
+                print(f"\n[{scheduler.station}] CSV: {scheduler.csv_dir}")
+                try:
+                    if scheduler.start_station():
+                        ready.append(scheduler)
+                except Exception as e:
+                    print(f"[{scheduler.station}] 開始できません: {e}")
+            if not ready:
+                print("再生できる局がありません")
+                return
+
+            AsyncPlayoutEngine.run_all([AsyncPlayoutEngine(s) for s in ready])
+
+        finally:
+            for scheduler in self.schedulers:
+                scheduler.stop_station()
+            self.media_index.stop_refresh_thread()
+            self.metrics.stop()
+            self.loudness.shutdown()
+            self.durations.shutdown()
+            if self.seek_cache is not None:
+                self.seek_cache.shutdown()
+            if self.media_cache is not None:
+                self.media_cache.shutdown()
+            self.jack.close()
 
             # mpv再生とJACK接続を保持したまま終了
             print("\nスクリプトを停止しました。mpv再生とJACK接続は保持されています。")
 
+    def stop_display_thread(self):
+        for scheduler in self.schedulers:
+            scheduler.stop_display_thread()
+
+class FakePlayer:
+    """mpvPlayer の代替（ベンチマーク用）。操作を記録するだけで音は出さない"""
+    mode = 'fake'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency      # 1操作あたりの所要時間（実時間の秒, IPC の往復を模擬）
+        self.current_file = None
+        self.armed_file = None
+        self.operations = 0
+
+    def _operate(self):
+        self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def play_file(self, filepath, start_position=0, audio_filter=None):
+        self._operate()
+        self.current_file = filepath
+        return True
+
+    def play_file_from_position(self, filepath, start_position, audio_filter=None):
+        return self.play_file(filepath, start_position, audio_filter)
+
+    def arm(self, filepath, start_position=0, timeout=2.0, audio_filter=None, start_at=None):
+        self._operate()
+        self.armed_file = filepath
+        return True
+
+    def start_armed(self):
+        if self.armed_file is None:
+            return False
+        self._operate()
+        self.current_file, self.armed_file = self.armed_file, None
+        return True
+
+    def stop(self):
+        self._operate()
+        self.current_file = None
+        self.armed_file = None
+
+    def is_playing(self):
+        return self.current_file is not None
+
+    def wait_playing(self, timeout=1.0):
+        return self.current_file is not None
+
+    def hand_over(self, incoming, fade=0.0, timeout=1.0):
+        self.stop()
+
+    def disconnect(self):
+        pass
+
+class ArrayStream:
+    """メモリ上の配列を DecodedStream と同じ操作で読み出すストリーム（--buffer-check 用）"""
+
+    def __init__(self, data):
+        self.data = data
+        self.consumed_frames = 0
+        self.underruns = 0
+
+    @property
+    def exhausted(self):
+        return self.consumed_frames >= len(self.data)
+
+    def read_into(self, out, frames):
+        count = min(frames, len(self.data) - self.consumed_frames)
+        out[:count] = self.data[self.consumed_frames:self.consumed_frames + count]
+        self.consumed_frames += count
+        return count
+
+    def close(self):
+        pass
+
+class FakeJack:
+    """JackControl の代替（ベンチマーク用）。接続状態をメモリ上で管理する"""
+    in_process = True
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.connections = set()
+        self.operations = 0
+
+    def open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def route(self, client_name, destinations):
+        return True
+
+    def is_connected(self, source, destination):
+        return (source, destination) in self.connections
+
+    def all_connected(self, pairs):
+        return all(pair in self.connections for pair in pairs)
+
+    def connect(self, source, destination):
+        self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.connections.add((source, destination))
+        return True
+
+    def disconnect(self, source, destination):
+        self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.connections.discard((source, destination))
+        return True
+
+def write_bench_schedule(csv_dir, first_date, days, interval, day_end_hour, end_time):
+    """ベンチマーク用のCSVを生成（放送日ごとに day_end_hour 時から interval 秒間隔, end_time まで）
+
+    音源・スタジオ(ST)・無音(SLT)・存在しない音源を混在させる。戻り値は生成したレコードの時刻のリスト。
+    """
+    names = ['A', 'B', 'C', 'A', 'B', 'ST', 'C', 'SLT', 'A', 'NOFILE']
+    times = []
+    for offset in range(days + 2):
+        broadcast_date = first_date + timedelta(days=offset)
+        day_start = datetime.combine(broadcast_date, datetime.min.time()) + timedelta(hours=day_end_hour)
+        rows = []
+        for index, seconds in enumerate(range(0, 86400, interval)):
+            scheduled_time = day_start + timedelta(seconds=seconds)
+            if scheduled_time >= end_time:
+                break
+            hour, rest = divmod(day_end_hour * 3600 + seconds, 3600)  # 24時以降は 24:00:00 形式
+            rows.append(f"{hour:02d}:{rest // 60:02d}:{rest % 60:02d},PC,,{names[index % len(names)]}\n")
+            times.append(scheduled_time)
+        if not rows:
+            break
+        with open(os.path.join(csv_dir, broadcast_date.strftime('%y%m%d') + '.csv'), 'w', encoding='utf-8') as f:
+            f.write('time,source,mix,filename\n')
+            f.writelines(rows)
+    return times
+
+def _resident_memory():
+    """現在の常駐メモリ（バイト, 取得できなければ None）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(math.ceil(ratio * len(ordered))) - 1)]
+
+def run_benchmark(days=1, speed=1000.0, interval=180, hours=range(6), engine='thread',
+                  player_latency=0.0, jack_latency=0.0):
+    """生成したスケジュールを倍速の仮想時計で再生し、スケジューラーの性能を計測
+
+    日替わり時刻（hours）ごとに、放送日の12時から days 日分を再生する（日替わりを days 回通過）。
+    mpv・JACK は FakePlayer・FakeJack で代替する。開始誤差は実時間に換算して報告する。
+    戻り値は全レコードが予定どおり開始されたかどうか。
+    """
+    print(f"ベンチマーク: {days} 日分, {speed:g} 倍速, {interval} 秒間隔, エンジン {engine}")
+    all_ok = True
+    for day_end_hour in hours:
+        work_dir = tempfile.mkdtemp(prefix='easyaps-bench-')
+        try:
+            for sub_dir in ('data/csv', 'data/contents', 'log'):
+                os.makedirs(os.path.join(work_dir, sub_dir))
+            for name in ('A.mp3', 'B.mp3', 'C.m4a'):
+                open(os.path.join(work_dir, 'data/contents', name), 'wb').close()
+
+            first_date = datetime.now().date()
+            start = datetime.combine(first_date, datetime.min.time()) + timedelta(hours=12)
+            end = start + timedelta(days=days)
+            expected = [t for t in write_bench_schedule(os.path.join(work_dir, 'data/csv'), first_date,
+                                                        days, interval, day_end_hour, end) if t > start]
+
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                clock = ScaledClock(start, speed)
+                scheduler = MusicScheduler(day_end_hour=day_end_hour, clock=clock, base_dir=work_dir,
+                                           log_dir=os.path.join(work_dir, 'log'))
+                scheduler.log_writer.echo = False
+                scheduler.player = FakePlayer(player_latency)
+                scheduler.standby_player = FakePlayer(player_latency)
+                scheduler.jack = FakeJack(jack_latency)
+                scheduler.engine = engine
+                scheduler.display_enabled = False
+                scheduler.preflight_enabled = False
+                scheduler.loudness_mode = 'live'
+                scheduler.metrics_textfile = ''
+                scheduler.metrics_http_port = 0
+                scheduler.schedule_end_wait = 2 * interval
+
+                memory_before = _resident_memory()
+                cpu_before = time.process_time()
+                wall_before = time.monotonic()
+                scheduler.run()
+                cpu_time = time.process_time() - cpu_before
+                wall_time = time.monotonic() - wall_before
+                memory_after = _resident_memory()
+
+            errors = []
+            jitters = []
+            broadcast_dates = set()
+            with open(os.path.join(work_dir, 'log', 'asrun.jsonl'), encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry['event'] != 'start':
+                        continue
+                    broadcast_dates.add(entry['broadcast_date'])
+                    errors.append(entry['error_ms'] / speed)
+                    if entry['timer_jitter_ms'] is not None:
+                        jitters.append(entry['timer_jitter_ms'] / speed)
+
+            ok = len(errors) >= len(expected)
+            all_ok = all_ok and ok
+            memory = ('-' if memory_before is None or memory_after is None
+                      else f"{(memory_after - memory_before) / 1048576:+.1f}MB")
+            print(f"日替わり {day_end_hour}時: {len(errors)}/{len(expected)} 件開始"
+                  f"（放送日 {len(broadcast_dates)} 日分）{'' if ok else ' ※開始されないレコードあり'}")
+            print(f"  開始誤差（実時間） p50 {_percentile(errors, 0.5):.3f}ms"
+                  f" / p99 {_percentile(errors, 0.99):.3f}ms / 最大 {max(errors, default=float('nan')):.3f}ms"
+                  f"  タイマー p99 {_percentile(jitters, 0.99):.3f}ms")
+            print(f"  タイマー復帰 {scheduler.timer.wakeups} 回, CPU {cpu_time:.2f}s / 実時間 {wall_time:.1f}s"
+                  f", メモリ {memory}, 保持レコード {len(scheduler.all_records)}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return all_ok
+
+def run_buffer_check(fade_ms=10.0, gain=0.5):
+    """動作中の JACK サーバーで、JackBufferEngine の開始フレームとクロスフェードを確認
+
+    一定値の2つの音源を周期の途中のフレームに予約し、2つ目の開始フレームから
+    1つ目をフェードアウトさせる（BufferPlayer.hand_over と同じ）。エンジンの出力を
+    録音用のクライアントで受け、サンプル単位で期待値と比べる。
+    戻り値は一致すれば True、しなければ False、JACK が使えなければ None。
+    """
+    if jack is None or numpy is None:
+        print("JACK-Client・NumPy がないため確認できません")
+        return None
+    engine = JackBufferEngine('easyaps-check')
+    if not engine.open():
+        print("JACK サーバーに接続できないため確認できません（例: jackd -d dummy）")
+        return None
+    recorder = None
+    try:
+        recorder = jack.Client('easyaps-check-rec', no_start_server=True)
+        inputs = [recorder.inports.register(f"in_{i + 1}") for i in range(DecodedStream.CHANNELS)]
+        samplerate = engine.samplerate
+        length = samplerate  # 1秒分を録音
+        recorded = numpy.zeros((length, DecodedStream.CHANNELS), dtype=numpy.float32)
+        window = {'base': None, 'filled': 0}
+
+        def record(frames):
+            base = window['base']
+            if base is None:
+                return
+            position = jack_frame_delta(recorder.last_frame_time, base)
+            if position < 0 or position >= length:
+                return
+            count = min(frames, length - position)
+            for channel, port in enumerate(inputs):
+                recorded[position:position + count, channel] = port.get_array()[:count]
+            window['filled'] = position + count
+
+        recorder.set_process_callback(record)
+        recorder.activate()
+        for output, port in zip(engine.ports, inputs):
+            recorder.connect(output, port)
+
+        # 周期の境界からずらしたフレームに予約する
+        lead = samplerate // 10
+        start_frame = (engine.client.frame_time + 3 * lead + 123) & 0xFFFFFFFF
+        window['base'] = (start_frame - lead) & 0xFFFFFFFF
+        fade_frames = int(fade_ms / 1000 * samplerate)
+        level = numpy.full((2 * samplerate, DecodedStream.CHANNELS), 0.5, dtype=numpy.float32)
+        first = BufferVoice(ArrayStream(level), frames=engine.blocksize)
+        second = BufferVoice(ArrayStream(level), gain=gain, frames=engine.blocksize)
+        engine.start(first, frame=start_frame)
+        engine.start(second, frame=start_frame + samplerate // 4 + 321)
+        first.fade_out(fade_frames, start_frame=second.start_frame)
+
+        deadline = time.monotonic() + 3.0
+        while window['filled'] < length and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if window['filled'] < length:
+            print("録音が終わりません（JACK サーバーが動作していない可能性があります）")
+            return False
+
+        index = numpy.arange(length)
+        start_a = lead
+        start_b = jack_frame_delta(second.start_frame, window['base'])
+        ramp = numpy.clip(1.0 - (index - start_b) / fade_frames, 0.0, 1.0)
+        expected = numpy.where(index < start_a, 0.0,
+                               numpy.where(index < start_b, 0.5, 0.5 * ramp + 0.5 * gain))
+        nonzero = numpy.flatnonzero(recorded[:, 0])
+        actual_start = int(nonzero[0]) if len(nonzero) else -1
+        error = float(numpy.max(numpy.abs(recorded - expected[:, None])))
+        ok = actual_start == start_a and error < 1e-5
+        print(f"JACK {samplerate} Hz / {engine.blocksize} フレーム")
+        print(f"開始フレーム: 予約 {start_a} / 実際 {actual_start}")
+        print(f"クロスフェード {fade_ms:g}ms（{start_b} フレームから）: 最大誤差 {error:.2e}")
+        print("結果: " + ("一致" if ok else "不一致"))
+        return ok
+    except jack.JackError as e:
+        print(f"JACK エラー: {e}")
+        return False
+    finally:
+        if recorder is not None:
+            try:
+                recorder.deactivate()
+                recorder.close()
+            except Exception:
+                pass
+        engine.close()
+
 def main():
     # 日替わり時刻をコマンドライン引数で設定
     import sys
@@ -997,6 +6108,20 @@ def main():
         print("  -v, --version    バージョン情報を表示")
         print("  -h, --help       この使用方法を表示")
         print("  --debug          デバッグモード（MPD実行時間などを画面に表示）")
+        print("  --station NAME   device.conf の [STATION:NAME] の局だけを実行（--preflight と併用可）")
+        print("                   （[STATION:...] があり、省略した場合は全局をマルチ局モードで実行）")
+        print("  --preflight [YYMMDD]")
+        print("                   放送日のCSVの音源の欠落・重なり・空白を確認して終了")
+        print("                   （日付省略時は現在の放送日）")
+        print("  --at YYMMDD HH:MM:SS")
+        print("                   その放送日・時刻（CSVと同じ表記, 24時以降可）に放送中だったレコードを表示")
+        print("  --find NAME      ファイル名 NAME の放送予定を表示（--from YYMMDD の放送日以降,")
+        print("                   省略時は現在時刻以降。--limit N で件数, 既定 10）")
+        print("  --bench          生成したスケジュールを倍速で再生し、スケジューラーの性能を計測")
+        print("                   --days N（日数, 既定 1）--speed X（倍速, 既定 1000）")
+        print("                   --interval S（レコード間隔の秒数, 既定 180）")
+        print("                   --hours 0,4（日替わり時刻, 既定 0-5 すべて）--engine thread|asyncio")
+        print("  --buffer-check   動作中の JACK サーバーで buffer モードの開始フレームとクロスフェードを確認")
         print()
         print("日替わり時刻: 0-5の数字で指定（午前0時～5時）")
         print("例:")
@@ -1005,6 +6130,10 @@ def main():
         print("  python3 easyaps.py --debug  # デバッグモードで起動")
         print("  python3 easyaps.py --debug 3 # デバッグモード + 午前3時で日替わり")
         print("  python3 easyaps.py -v       # バージョン表示")
+        print("  python3 easyaps.py --preflight 250401 # 2025-04-01 分を事前確認")
+        print("  python3 easyaps.py --at 250401 25:10:00 # 2025-04-01 分の 25:10 に放送中のレコード")
+        print("  python3 easyaps.py --find jingle01      # jingle01 の次回以降の放送予定")
+        print("  python3 easyaps.py --bench --days 7 --speed 5000 # 7日分を5000倍速で計測")
         return
 
     # コマンドライン引数を解析
@@ -1015,6 +6144,89 @@ def main():
         debug_mode = True
         args.remove('--debug')
 
+    # --benchオプション（mpv・JACK を使わずに倍速で再生して計測）
+    if '--bench' in args:
+        args.remove('--bench')
+
+        def option(name, convert, default):
+            if name not in args:
+                return default
+            position = args.index(name)
+            try:
+                value = convert(args[position + 1])
+            except (IndexError, ValueError):
+                print(f"エラー: {name} の値が不正です")
+                sys.exit(2)
+            del args[position:position + 2]
+            return value
+
+        ok = run_benchmark(
+            days=option('--days', int, 1),
+            speed=option('--speed', float, 1000.0),
+            interval=option('--interval', int, 180),
+            hours=option('--hours', lambda v: [int(h) for h in v.split(',') if 0 <= int(h) <= 5], range(6)),
+            engine=option('--engine', str, 'thread'),
+        )
+        sys.exit(0 if ok else 1)
+
+    # --buffer-checkオプション（JACK サーバーがあればプロセス内再生をサンプル単位で確認）
+    if '--buffer-check' in args:
+        result = run_buffer_check()
+        sys.exit(0 if result is not False else 1)
+
+    # --stationオプション（マルチ局設定のうち1局だけを実行）
+    station = None
+    if '--station' in args:
+        position = args.index('--station')
+        args.pop(position)
+        if position >= len(args) or not StationGroup.NAME_PATTERN.match(args[position]):
+            print("エラー: --station には局名（英数字・-・_）を指定してください")
+            return
+        station = args.pop(position)
+
+    # --preflightオプションをチェック（YYMMDD を続けて指定可能）
+    preflight = False
+    preflight_date = None
+    if '--preflight' in args:
+        preflight = True
+        position = args.index('--preflight')
+        args.pop(position)
+        if position < len(args) and re.match(r'^\d{6}$', args[position]):
+            try:
+                preflight_date = datetime.strptime(args.pop(position), '%y%m%d').date()
+            except ValueError:
+                print("エラー: 日付は YYMMDD 形式で指定してください")
+                return
+
+    # --at / --find オプション（スケジュールの記録を検索して終了）
+    archive_at = None
+    archive_find = None
+    archive_from = None
+    archive_limit = 10
+    try:
+        if '--at' in args:
+            position = args.index('--at')
+            _, date_str, time_str = args[position:position + 3]
+            del args[position:position + 3]
+            archive_at = (datetime.strptime(date_str, '%y%m%d').date(), time_str)
+        if '--find' in args:
+            position = args.index('--find')
+            _, archive_find = args[position:position + 2]
+            del args[position:position + 2]
+        if '--from' in args:
+            position = args.index('--from')
+            _, date_str = args[position:position + 2]
+            del args[position:position + 2]
+            archive_from = datetime.strptime(date_str, '%y%m%d').date()
+        if '--limit' in args:
+            position = args.index('--limit')
+            _, limit_str = args[position:position + 2]
+            del args[position:position + 2]
+            archive_limit = max(1, int(limit_str))
+    except ValueError:
+        print("エラー: --at は YYMMDD HH:MM:SS、--from は YYMMDD、--limit は数値で指定してください")
+        return
+
     # 残りの引数で日替わり時刻を指定
     if len(args) > 0:
         try:
@@ -1028,12 +6240,44 @@ def main():
             print("使用方法: python3 easyaps.py [0-5]")
             return
     
+    # device.conf の [STATION:局名]（局ごとの日替わり時刻を優先）
+    stations = StationGroup.configured_stations(day_end_hour)
+    if station:
+        matched = [item for item in stations if item[0] == station]
+        if not matched:
+            print(f"エラー: device.conf に [STATION:{station}] がありません")
+            return
+        day_end_hour = matched[0][1]
+
+    if preflight:
+        scheduler = MusicScheduler.for_preflight(day_end_hour=day_end_hour, debug_mode=debug_mode,
+                                                 station=station)
+        problems = scheduler.preflight_date(preflight_date or scheduler.get_broadcast_date())
+        sys.exit(1 if problems is None or problems else 0)
+
+    if archive_at or archive_find:
+        scheduler = MusicScheduler.for_query(day_end_hour=day_end_hour, debug_mode=debug_mode, station=station)
+        if archive_at:
+            moment = scheduler.parse_time_for_date(archive_at[1], archive_at[0])
+            if moment is None:
+                sys.exit(2)
+            found = scheduler.query_archive(at=moment)
+        else:
+            since = None
+            if archive_from:
+                since = datetime.combine(archive_from, datetime.min.time()) + timedelta(hours=day_end_hour)
+            found = scheduler.query_archive(filename=archive_find, since=since, limit=archive_limit)
+        sys.exit(0 if found else 1)
+
     print(f"放送スケジューラー - 日替わり時刻: 午前{day_end_hour}時 (version {version})")
     if debug_mode:
         print("[デバッグモード有効]")
     print("=" * 50)
 
-    scheduler = MusicScheduler(day_end_hour=day_end_hour, debug_mode=debug_mode)
+    if stations and not station:
+        scheduler = StationGroup(stations, debug_mode=debug_mode)
+    else:
+        scheduler = MusicScheduler(day_end_hour=day_end_hour, debug_mode=debug_mode, station=station)
     try:
         scheduler.run()
     except KeyboardInterrupt: